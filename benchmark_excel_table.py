@@ -0,0 +1,136 @@
+"""
+Benchmark av create_excel_table_with_categories (Finansdatabas och Optimerad budget)
+Jämför den tidigare loopen (ett booleskt filter per konto och månad) med den
+pivot_table-baserade tabellen i src/utils/excel_table.py på syntetiska konton,
+kontrollerar att de faktiska månadsvärdena är identiska och skriver resultatet som JSON.
+
+Användning:
+    python benchmark_excel_table.py                  # 500 konton
+    python benchmark_excel_table.py --accounts 2000 --repeat 3
+"""
+import sys
+import json
+import random
+import argparse
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Callable, Tuple
+
+import pandas as pd
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from utils.excel_table import build_excel_table, MONTH_COLUMNS
+
+RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+
+def generate_frames(accounts: int, seed: int = 42) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Faktiska värden (några månader saknas) och budget för alla konton, som från Firebase"""
+    rng = random.Random(seed)
+    actual, budget = [], []
+    n_revenue = max(1, accounts // 4)
+    for i in range(accounts):
+        category, category_id = ('Intäkter', 'cat_1') if i < n_revenue else ('Kostnader', 'cat_2')
+        account = {'account_name': f"Konto {i + 1}", 'category': category,
+                   'account_id': f"acc_{i + 1}", 'category_id': category_id}
+        for month in range(1, 13):
+            if rng.random() < 0.9:
+                actual.append({**account, 'month': month, 'amount': round(rng.uniform(1000, 90000), 2)})
+            budget.append({'account_name': account['account_name'], 'category': category,
+                           'month': month, 'amount': round(rng.uniform(1000, 90000), 2),
+                           'account_id': account['account_id']})
+    return pd.DataFrame(actual), pd.DataFrame(budget)
+
+def legacy_excel_table(actual_df: pd.DataFrame, budget_df: pd.DataFrame) -> pd.DataFrame:
+    """Tidigare implementation (iterrows + filter per konto och månad) som referens"""
+    result_data = []
+    if not actual_df.empty:
+        unique_accounts = actual_df[['account_name', 'category', 'account_id', 'category_id']].drop_duplicates()
+        for _, account_info in unique_accounts.iterrows():
+            row = {
+                'account': account_info['account_name'],
+                'category': account_info['category'],
+                'account_id': account_info['account_id'],
+                'category_id': account_info['category_id']
+            }
+            account_data = actual_df[actual_df['account_name'] == account_info['account_name']]
+            for i, month in enumerate(MONTH_COLUMNS, 1):
+                month_data = account_data[account_data['month'] == i]
+                row[month] = month_data['amount'].sum() if len(month_data) > 0 else 0
+            result_data.append(row)
+    return pd.DataFrame(result_data)
+
+def time_call(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Median och min i ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 2), 'min_ms': round(min(timings), 2)}
+
+def run_benchmark(accounts: int = 500, repeat: int = 5) -> Dict[str, Any]:
+    actual_df, budget_df = generate_frames(accounts)
+    legacy = legacy_excel_table(actual_df, budget_df)
+    table = build_excel_table(actual_df, budget_df)
+    columns = list(legacy.columns)
+    identical = table[columns].astype({m: 'float64' for m in MONTH_COLUMNS}).equals(
+        legacy.astype({m: 'float64' for m in MONTH_COLUMNS}))
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'accounts': accounts,
+        'rows': len(actual_df),
+        'repeat': repeat,
+        'identical': identical,
+        'loaders': {
+            'legacy (iterrows)': time_call(lambda: legacy_excel_table(actual_df, budget_df), repeat),
+            'pivot_table': time_call(lambda: build_excel_table(actual_df, budget_df), repeat),
+        }
+    }
+    legacy_ms = results['loaders']['legacy (iterrows)']['median_ms']
+    pivot_ms = results['loaders']['pivot_table']['median_ms']
+    results['speedup'] = round(legacy_ms / pivot_ms, 1) if pivot_ms else None
+    return results
+
+def save_results(results: Dict[str, Any], path: Optional[Path] = None) -> Path:
+    """Spara som JSON (standard: benchmarks/results/excel_table_<tid>.json)"""
+    if path is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"excel_table_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"\n📊 {results['accounts']} konton, {results['rows']} faktiska värden, {results['repeat']} körningar")
+    print(f"{'Implementation':<22}{'median ms':>12}{'min ms':>10}")
+    for name, timing in results['loaders'].items():
+        print(f"{name:<22}{timing['median_ms']:>12.1f}{timing['min_ms']:>10.1f}")
+    print(f"⚡ {results['speedup']}x snabbare")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark av create_excel_table_with_categories")
+    parser.add_argument("--accounts", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Sökväg för JSON-resultat")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.accounts, args.repeat)
+    print_results(results)
+    path = save_results(results, Path(args.output) if args.output else None)
+    print(f"\n💾 Resultat sparat: {path}")
+
+    if not results['identical']:
+        print("❌ Tabellerna skiljer sig från tidigare implementation")
+        return 1
+    print("✅ Samma värden som tidigare implementation")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+Benchmark av dataladdare mot syntetiska dataset (flera företag × år × konton)
+Kör laddarna mot den lokala Firebase-ersättaren med simulerad latens och skriver
+resultatet som JSON så att regressioner syns i review.
+
+Användning:
+    python benchmark_loaders.py                              # standardstorlek
+    python benchmark_loaders.py --companies 5 --years 4 --accounts 60 --latency-ms 40
+    python benchmark_loaders.py --backend local              # repository mot lokal SQLite
+    python benchmark_loaders.py --update-baseline            # skriv om benchmarks/baseline_loaders.json
+"""
+import os
+import io
+import sys
+import json
+import math
+import random
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Callable
+
+import pandas as pd
+import streamlit as st
+
+from utils_local_firebase import LocalFirebaseServer, connect_firebase_db
+from models_repository import build_meta_index, compact_test_data, build_compact_budget_node, budget_monthly_values
+
+BENCHMARK_DIR = Path(__file__).parent / "benchmarks"
+RESULTS_DIR = BENCHMARK_DIR / "results"
+BASELINE_FILE = BENCHMARK_DIR / "baseline_loaders.json"
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun', 'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+COMPANY_NAMES = ['KLAB', 'KSAB', 'KMAB', 'AAB', 'KFAB']
+
+def _quiet_streamlit() -> None:
+    """Dölj Streamlits bare mode-varningar (ingen ScriptRunContext utanför streamlit run)"""
+    try:
+        from streamlit import config as st_config, logger as st_logger
+        # Läs in konfigurationen först - annars återställs loggnivån vid första st.secrets-anropet
+        st_config.get_config_options()
+        st_logger.set_log_level("error")
+    except Exception:
+        pass
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith('streamlit'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+def _company_name(index: int) -> str:
+    return COMPANY_NAMES[index] if index < len(COMPANY_NAMES) else f"BOLAG{index + 1}"
+
+def _account_name(index: int, n_revenue: int) -> str:
+    return f"Försäljning {index + 1}" if index < n_revenue else f"Kostnad {index - n_revenue + 1}"
+
+def _monthly_amount(rng: random.Random, base: float, month: int) -> float:
+    """Belopp med säsongsmönster och brus"""
+    return round(base * (1 + 0.3 * math.sin((month - 1) / 12 * 2 * math.pi)) * rng.uniform(0.9, 1.1), 2)
+
+def generate_test_data(companies: int, years: int, accounts: int, start_year: int = 2023, seed: int = 42) -> Dict[str, Any]:
+    """Syntetisk test_data-blob med samma struktur som Excel-importen skriver"""
+    rng = random.Random(seed)
+    now = datetime.now().isoformat()
+    year_list = [start_year + i for i in range(years)]
+    n_revenue = max(1, accounts // 3)
+
+    test_data = {
+        "meta": {
+            "created_at": now,
+            "description": f"Syntetiskt dataset {companies}×{years}×{accounts}",
+            "years": year_list,
+            "companies_count": companies,
+            "accounts_count": companies * accounts
+        },
+        "companies": {},
+        "accounts": {},
+        "categories": {
+            "category_1": {"name": "Intäkter", "description": "Standard kategori för intäkter", "created_at": now},
+            "category_2": {"name": "Kostnader", "description": "Standard kategori för kostnader", "created_at": now}
+        },
+        "values": {}
+    }
+
+    value_counter = 1
+    for c in range(companies):
+        company_id = f"company_{c + 1}"
+        test_data["companies"][company_id] = {"name": _company_name(c), "location": "Stockholm", "created_at": now}
+
+        for a in range(accounts):
+            account_id = f"account_{c * accounts + a + 1}"
+            is_revenue = a < n_revenue
+            test_data["accounts"][account_id] = {
+                "name": _account_name(a, n_revenue),
+                "category_id": "category_1" if is_revenue else "category_2",
+                "company_id": company_id,
+                "created_at": now
+            }
+
+            base = rng.uniform(10_000, 500_000) * (1 if is_revenue else -0.4)
+            for year in year_list:
+                for month in range(1, 13):
+                    test_data["values"][f"value_{value_counter}"] = {
+                        "company_id": company_id,
+                        "account_id": account_id,
+                        "year": year,
+                        "month": month,
+                        "amount": _monthly_amount(rng, base, month),
+                        "type": "actual",
+                        "created_at": now
+                    }
+                    value_counter += 1
+
+    # Samma meta-index som importen skriver
+    test_data["meta"]["index"] = build_meta_index(test_data)
+    return test_data
+
+def generate_simple_budgets(test_data: Dict[str, Any], year: int, seed: int = 42) -> Dict[str, Any]:
+    """SIMPLE_BUDGETS för hälften av kontona i varje företag"""
+    rng = random.Random(seed)
+    budgets = {}
+    for company_id, company in test_data["companies"].items():
+        company_accounts = [a for a in test_data["accounts"].values() if a["company_id"] == company_id]
+        for account in company_accounts[::2]:
+            base = rng.uniform(10_000, 400_000)
+            budgets.setdefault(company["name"], {}).setdefault(str(year), {})[account["name"]] = build_compact_budget_node(
+                {m: _monthly_amount(rng, base, i + 1) for i, m in enumerate(MONTH_NAMES)}
+            )
+    return budgets
+
+def generate_budget_values(account_ids: List[str], budget_id: str = "budget_1") -> Dict[str, Any]:
+    """budget_values-nod (en post per konto och månad) som update_budget_value läser"""
+    return {
+        f"bv_{i + 1}": {"budget_id": budget_id, "account_id": account_id, "month": month, "amount": 1000.0 * month}
+        for i, (account_id, month) in enumerate((a, m) for a in account_ids for m in range(1, 13))
+    }
+
+def generate_excel_frame(companies: int, years: int, accounts: int, start_year: int = 2023, seed: int = 42) -> pd.DataFrame:
+    """DataFrame i samma format som load_excel_data_correct returnerar"""
+    rng = random.Random(seed)
+    n_revenue = max(1, accounts // 3)
+    rows = []
+    for c in range(companies):
+        for y in range(years):
+            for a in range(accounts):
+                account_name = _account_name(a, n_revenue)
+                base = rng.uniform(10_000, 500_000) * (1 if a < n_revenue else -0.4)
+                row = {'Företag': _company_name(c), 'År': start_year + y, 'Konto': account_name,
+                       'Kategori': 'Intäkter' if a < n_revenue else 'Kostnader'}
+                for i, month in enumerate(MONTH_NAMES):
+                    row[month] = _monthly_amount(rng, base, i + 1)
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+def time_call(fn: Callable[[], Any], repeat: int, server: LocalFirebaseServer,
+              setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Tidmät fn() repeat gånger (setup körs före varje körning, utanför tidtagningen)"""
+    timings = []
+    server.reset_stats()
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    stats = dict(server.stats)
+    return {
+        'min_ms': round(min(timings), 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'repeat': repeat,
+        'requests': stats['requests'] // repeat,
+        'bytes_out': stats['bytes_out'] // repeat
+    }
+
+def run_benchmarks(companies: int = 3, years: int = 3, accounts: int = 30, latency_ms: float = 30.0,
+                   repeat: int = 5, backend: str = "firebase", seed: int = 42) -> Dict[str, Any]:
+    """Kör alla laddar-benchmarks och returnera resultat som dict"""
+    _quiet_streamlit()
+    random.seed(seed)
+
+    test_data = generate_test_data(companies, years, accounts, seed=seed)
+    year_list = test_data["meta"]["years"]
+    company_id = "company_1"
+    company_account_ids = [aid for aid, a in test_data["accounts"].items() if a["company_id"] == company_id]
+    account_names = sorted({test_data["accounts"][aid]["name"] for aid in company_account_ids})
+
+    seed_data = {
+        "test_data": compact_test_data(test_data),
+        "SIMPLE_BUDGETS": generate_simple_budgets(test_data, year_list[-1], seed=seed),
+        "budget_values": generate_budget_values(company_account_ids)
+    }
+
+    local_db_dir = None
+    if backend == "local":
+        local_db_dir = tempfile.mkdtemp(prefix="finans_bench_")
+        os.environ["FINANS_STORAGE_BACKEND"] = "local"
+        os.environ["FINANS_LOCAL_DB"] = str(Path(local_db_dir) / "bench.db")
+    else:
+        os.environ["FINANS_STORAGE_BACKEND"] = "firebase"
+    # Egen diskcache per körning (påverkar inte appens data/cache)
+    os.environ["FINANS_DISK_CACHE_PATH"] = str(Path(tempfile.mkdtemp(prefix="finans_bench_cache_")) / "cache.db")
+
+    results = {}
+    with LocalFirebaseServer(data=seed_data, latency_ms=latency_ms) as server:
+        with redirect_stdout(io.StringIO()):
+            st.session_state['firebase_db'] = connect_firebase_db(server)
+        st.session_state.pop('finans_repository', None)
+
+        # Importera sidorna först när FirebaseDB pekar på den lokala servern
+        from models_repository import get_repository
+        from pages_visualization2 import get_visualization_data
+        from pages_seasonal_analysis import get_seasonal_data_optimized, calculate_seasonal_metrics, clear_seasonal_cache
+        from test_excel_import import load_test_data_with_categories, save_test_data_to_firebase
+        from utils_result_cache import clear_result_cache
+        from utils_disk_cache import get_disk_cache
+
+        def cold_start():
+            """Tom cache i minnet och på disk"""
+            clear_result_cache()
+            get_disk_cache().clear()
+
+        repo = get_repository()
+        if backend == "local":
+            repo.save_test_data(test_data)
+            for company_name, per_year in seed_data["SIMPLE_BUDGETS"].items():
+                for year, per_account in per_year.items():
+                    for account_name, node in per_account.items():
+                        repo.save_simple_budget(company_name, int(year), account_name, budget_monthly_values(node))
+
+        results['get_visualization_data'] = time_call(
+            lambda: get_visualization_data(company_id, year_list[-1]),
+            repeat, server, setup=cold_start
+        )
+
+        results['get_seasonal_data_optimized'] = time_call(
+            lambda: get_seasonal_data_optimized(company_id, year_list, account_names, True),
+            repeat, server, setup=cold_start
+        )
+
+        # Efter omstart: säsongsdatan borta ur minnet men diskcachen varm
+        results['get_seasonal_data_optimized (disk)'] = time_call(
+            lambda: get_seasonal_data_optimized(company_id, year_list, account_names, True),
+            repeat, server, setup=clear_seasonal_cache
+        )
+
+        seasonal_df = get_seasonal_data_optimized(company_id, year_list, account_names, True)
+        results['calculate_seasonal_metrics'] = time_call(
+            lambda: calculate_seasonal_metrics(seasonal_df, account_names, year_list),
+            repeat, server
+        )
+
+        results['load_test_data_with_categories'] = time_call(
+            lambda: load_test_data_with_categories(company_id, year_list[-1]),
+            repeat, server
+        )
+
+        results['update_budget_value'] = time_call(
+            lambda: st.session_state['firebase_db'].update_budget_value(
+                "budget_1", company_account_ids[0], random.randint(1, 12), random.uniform(1, 10_000)
+            ),
+            repeat, server
+        )
+
+        excel_df = generate_excel_frame(companies, years, accounts, seed=seed)
+        results['save_test_data_to_firebase'] = time_call(
+            lambda: save_test_data_to_firebase(excel_df),
+            repeat, server
+        )
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'commit': _git_commit(),
+        'params': {
+            'companies': companies, 'years': years, 'accounts': accounts,
+            'values': len(test_data["values"]), 'latency_ms': latency_ms,
+            'repeat': repeat, 'backend': backend, 'seed': seed
+        },
+        'results': results
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def save_results(results: Dict[str, Any], path: Optional[Path] = None) -> Path:
+    """Spara resultat som JSON (default benchmarks/results/loaders_<tid>.json)"""
+    if path is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"loaders_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+def compare_with_baseline(results: Dict[str, Any], baseline_path: Path = BASELINE_FILE,
+                          threshold: float = 0.25) -> List[str]:
+    """Jämför median-tider och antal anrop mot baseline. Returnerar lista med regressioner."""
+    if not Path(baseline_path).exists():
+        return []
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    comparable = ('values', 'latency_ms', 'backend')
+    if any(baseline.get('params', {}).get(key) != results['params'][key] for key in comparable):
+        print("⚠️ Baseline har annan datasetstorlek, latens eller backend - jämförelse hoppas över")
+        return []
+
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        if current['median_ms'] > previous['median_ms'] * (1 + threshold):
+            regressions.append(f"{name}: {previous['median_ms']} ms → {current['median_ms']} ms")
+        if current['requests'] > previous['requests']:
+            regressions.append(f"{name}: {previous['requests']} → {current['requests']} anrop")
+    return regressions
+
+def print_results(results: Dict[str, Any]) -> None:
+    """Skriv resultat som tabell"""
+    params = results['params']
+    print(f"\n📊 {params['companies']} företag × {params['years']} år × {params['accounts']} konton "
+          f"= {params['values']} värden, latens {params['latency_ms']} ms, backend {params['backend']}")
+    print(f"{'Laddare':<34}{'median ms':>12}{'min ms':>10}{'anrop':>8}{'kB ut':>10}")
+    for name, r in results['results'].items():
+        print(f"{name:<34}{r['median_ms']:>12.1f}{r['min_ms']:>10.1f}{r['requests']:>8}{r['bytes_out'] / 1024:>10.1f}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark av dataladdare")
+    parser.add_argument("--companies", type=int, default=3)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--accounts", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", choices=["firebase", "local"], default="firebase")
+    parser.add_argument("--output", help="Sökväg för JSON-resultat")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--threshold", type=float, default=0.25, help="Tillåten försämring av median (andel)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.companies, args.years, args.accounts, args.latency_ms, args.repeat, args.backend)
+    print_results(results)
+
+    if args.update_baseline:
+        path = save_results(results, Path(args.baseline))
+        print(f"\n💾 Baseline uppdaterad: {path}")
+        return 0
+
+    path = save_results(results, Path(args.output) if args.output else None)
+    print(f"\n💾 Resultat sparat: {path}")
+
+    regressions = compare_with_baseline(results, Path(args.baseline), args.threshold)
+    if regressions:
+        print("\n❌ Regressioner mot baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("✅ Inga regressioner mot baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Benchmark av kallstart för streamlit_app (tid till inloggningssidan)
+Modulerna som appen importerar innan någon sida valts spåras genom att köra
+streamlit_app.py en gång med Streamlits AppTest under `-X importtime`. De importeras
+sedan i nya processer för mätning, och benchmarken kontrollerar att tunga moduler
+(plotly.subplots, numpy, pandas, sidmoduler) inte laddas och jämför mot budgeten i
+benchmarks/startup_budget.json.
+
+Användning:
+    python benchmark_startup.py                  # mät och jämför mot budget
+    python benchmark_startup.py --repeat 7       # fler körningar (median)
+    python benchmark_startup.py --pages          # visa även importkostnad per sida
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+
+from utils_page_registry import PAGES, LAZY_ONLY_MODULES
+
+ROOT_DIR = Path(__file__).parent
+APP_FILE = ROOT_DIR / "streamlit_app.py"
+BENCHMARK_DIR = ROOT_DIR / "benchmarks"
+RESULTS_DIR = BENCHMARK_DIR / "results"
+BUDGET_FILE = BENCHMARK_DIR / "startup_budget.json"
+
+# Spårningen kör inloggningssidan - Firebase-konfigurationen behöver bara finnas
+# (inga anrop görs före inloggning) och uppvärmningen ska inte starta
+TRACE_ENV = {
+    "FIREBASE_API_KEY": "benchmark", "FIREBASE_AUTH_DOMAIN": "benchmark",
+    "FIREBASE_DATABASE_URL": "https://benchmark.invalid", "FIREBASE_STORAGE_BUCKET": "benchmark",
+    "FIREBASE_MESSAGING_SENDER_ID": "benchmark", "FIREBASE_APP_ID": "benchmark"
+}
+TRACE_MARKER = "--- streamlit_app ---"
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Tolka `-X importtime`-utdata till [{module, self_us, cumulative_us, depth}]"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # rubrikraden
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append({'module': name.strip(), 'self_us': self_us,
+                        'cumulative_us': cumulative_us, 'depth': depth})
+    return imports
+
+def run_importtime(modules: List[str]) -> List[Dict[str, Any]]:
+    """Importera modulerna i en ny process och returnera importtiderna"""
+    code = "; ".join(f"import {module}" for module in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Import misslyckades: {proc.stderr.strip().splitlines()[-1]}")
+    return parse_importtime(proc.stderr)
+
+def trace_startup_modules() -> List[str]:
+    """
+    Moduler som streamlit_app faktiskt importerar fram till inloggningssidan: skriptet körs
+    en gång med AppTest och toppnivåimporterna efter markören samlas in (streamlit först)
+    """
+    code = "\n".join([
+        "import sys",
+        "from streamlit.testing.v1 import AppTest",
+        f"app = AppTest.from_file({str(APP_FILE)!r}, default_timeout=60)",
+        f"sys.stderr.write({TRACE_MARKER!r} + '\\n')",
+        "app.run()",
+        "for exception in app.exception:",
+        "    sys.stderr.write(f'Fel i streamlit_app: {exception.value}\\n')",
+        "sys.exit(1 if app.exception else 0)",
+    ])
+    env = {**TRACE_ENV, **os.environ, "FINANS_WARMUP": "0"}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT_DIR, capture_output=True, text=True, env=env)
+    if proc.returncode != 0 or TRACE_MARKER not in proc.stderr:
+        raise RuntimeError(f"Spårning av streamlit_app misslyckades: {proc.stderr.strip().splitlines()[-1]}")
+    imports = parse_importtime(proc.stderr.split(TRACE_MARKER, 1)[1])
+    # Streamlits egna moduler laddas av skriptkörningen - de ingår i 'streamlit'
+    modules = [i['module'] for i in imports if i['depth'] == 0 and i['module'].split('.')[0] != 'streamlit']
+    return ["streamlit"] + list(dict.fromkeys(modules))
+
+def measure_startup(modules: List[str], repeat: int = 5) -> Dict[str, Any]:
+    """Mät kallstartens importtid (median av flera körningar) och leta efter tunga moduler"""
+    totals = []
+    imports = []
+    for _ in range(repeat):
+        imports = run_importtime(modules)
+        totals.append(sum(i['self_us'] for i in imports) / 1000)
+
+    loaded = {i['module'] for i in imports}
+    top_level = sorted((i for i in imports if i['depth'] == 0),
+                       key=lambda i: i['cumulative_us'], reverse=True)
+    return {
+        'median_ms': round(statistics.median(totals), 1),
+        'min_ms': round(min(totals), 1),
+        'repeat': repeat,
+        'startup_modules': modules,
+        'modules_loaded': len(loaded),
+        'top_level': {i['module']: round(i['cumulative_us'] / 1000, 1) for i in top_level},
+        'eager_heavy_modules': [m for m in LAZY_ONLY_MODULES if m in loaded]
+    }
+
+def measure_pages(startup_modules: List[str]) -> Dict[str, float]:
+    """Extra importtid per sida när kallstartens moduler redan är laddade"""
+    costs = {}
+    for name, (module, _) in PAGES.items():
+        imports = run_importtime(startup_modules + [module])
+        entry = next((i for i in imports if i['module'] == module and i['depth'] == 0), None)
+        costs[name] = round(entry['cumulative_us'] / 1000, 1) if entry else 0.0
+    return costs
+
+def check_budget(results: Dict[str, Any], budget_path: Path = BUDGET_FILE) -> List[str]:
+    """Jämför mot budget. Returnerar lista med överträdelser."""
+    violations = []
+    startup = results['startup']
+    if startup['eager_heavy_modules']:
+        violations.append(f"Tunga moduler laddas vid kallstart: {', '.join(startup['eager_heavy_modules'])}")
+
+    if not Path(budget_path).exists():
+        return violations
+    with open(budget_path, 'r', encoding='utf-8') as f:
+        budget = json.load(f)
+
+    if startup['median_ms'] > budget.get('startup_import_ms', float('inf')):
+        violations.append(f"Kallstart {startup['median_ms']} ms > budget {budget['startup_import_ms']} ms")
+    if startup['modules_loaded'] > budget.get('max_modules', float('inf')):
+        violations.append(f"{startup['modules_loaded']} moduler laddas > budget {budget['max_modules']}")
+    return violations
+
+def save_results(results: Dict[str, Any], path: Optional[Path] = None) -> Path:
+    """Spara resultat som JSON (default benchmarks/results/startup_<tid>.json)"""
+    if path is None:
+        path = RESULTS_DIR / f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+def print_results(results: Dict[str, Any]) -> None:
+    """Skriv resultat som tabell"""
+    startup = results['startup']
+    print(f"\n🚀 Kallstart: median {startup['median_ms']} ms (min {startup['min_ms']} ms, "
+          f"{startup['repeat']} körningar, {startup['modules_loaded']} moduler)")
+    print(f"{'Modul':<34}{'kumulativ ms':>14}")
+    for module, ms in startup['top_level'].items():
+        print(f"{module:<34}{ms:>14.1f}")
+    if results.get('pages'):
+        print(f"\n{'Sida (laddas vid val)':<34}{'extra ms':>14}")
+        for name, ms in results['pages'].items():
+            print(f"{name:<34}{ms:>14.1f}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark av kallstart (importtid)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pages", action="store_true", help="Mät även importkostnad per sida")
+    parser.add_argument("--output", help="Sökväg för JSON-resultat")
+    parser.add_argument("--budget", default=str(BUDGET_FILE))
+    args = parser.parse_args(argv)
+
+    startup_modules = trace_startup_modules()
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'startup': measure_startup(startup_modules, args.repeat),
+        'pages': measure_pages(startup_modules) if args.pages else {}
+    }
+    print_results(results)
+
+    path = save_results(results, Path(args.output) if args.output else None)
+    print(f"\n💾 Resultat sparat: {path}")
+
+    violations = check_budget(results, Path(args.budget))
+    if violations:
+        print("\n❌ Kallstart över budget:")
+        for line in violations:
+            print(f"  - {line}")
+        return 1
+    print("✅ Kallstart inom budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
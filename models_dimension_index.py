@@ -0,0 +1,105 @@
+"""
+Dimensionsindex för företag, kategorier och konton
+Byggs en gång per datauppsättning och ger O(1)-uppslag på namn och id (samt omvänt)
+istället för linjära genomsökningar i varje loop.
+"""
+from typing import Optional, Dict, List, Any
+
+from utils_result_cache import bounded_cache
+from utils_disk_cache import TAG_TEST_DATA
+
+class DimensionIndex:
+    """Uppslagstabeller för företag, kategorier och konton (första träffen vinner vid dubbletter)"""
+
+    def __init__(self, companies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 accounts: Optional[Dict[str, Dict[str, Any]]] = None,
+                 categories: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.companies: Dict[str, Dict[str, Any]] = {}
+        self.accounts: Dict[str, Dict[str, Any]] = {}
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        self._company_by_name: Dict[str, str] = {}
+        self._category_by_name: Dict[str, str] = {}
+        self._account_by_company_name: Dict[tuple, str] = {}
+        self._account_by_category_name: Dict[tuple, str] = {}
+        self._accounts_by_company: Dict[Optional[str], List[str]] = {}
+
+        for company_id, info in (companies or {}).items():
+            self.add_company(company_id, info)
+        for category_id, info in (categories or {}).items():
+            self.add_category(category_id, info)
+        for account_id, info in (accounts or {}).items():
+            self.add_account(account_id, info)
+
+    # -------- Uppbyggnad (även för nyskapade poster under en import) --------
+    def add_company(self, company_id: str, info: Dict[str, Any]) -> None:
+        self.companies[company_id] = info
+        self._company_by_name.setdefault(info.get('name'), company_id)
+
+    def add_category(self, category_id: str, info: Dict[str, Any]) -> None:
+        self.categories[category_id] = info
+        self._category_by_name.setdefault(info.get('name'), category_id)
+
+    def add_account(self, account_id: str, info: Dict[str, Any]) -> None:
+        self.accounts[account_id] = info
+        company_id = info.get('company_id')
+        name = info.get('name')
+        self._account_by_company_name.setdefault((company_id, name), account_id)
+        self._account_by_category_name.setdefault((info.get('category_id'), name), account_id)
+        self._accounts_by_company.setdefault(company_id, []).append(account_id)
+
+    # -------- Företag --------
+    def company_id(self, name: str) -> Optional[str]:
+        return self._company_by_name.get(name)
+
+    def company_name(self, company_id: str) -> Optional[str]:
+        return self.companies.get(company_id, {}).get('name')
+
+    # -------- Kategorier --------
+    def category_id(self, name: str) -> Optional[str]:
+        return self._category_by_name.get(name)
+
+    def category_name(self, category_id: Optional[str], default: str = 'Okänd kategori') -> str:
+        return self.categories.get(category_id, {}).get('name', default)
+
+    # -------- Konton --------
+    def account_id(self, company_id: Optional[str], name: str) -> Optional[str]:
+        """Första kontot med namnet hos företaget"""
+        return self._account_by_company_name.get((company_id, name))
+
+    def account_id_in_category(self, category_id: Optional[str], name: str) -> Optional[str]:
+        """Första kontot med namnet i kategorin (äldre schema utan company_id)"""
+        return self._account_by_category_name.get((category_id, name))
+
+    def account_name(self, account_id: str, default: str = 'Okänt konto') -> str:
+        return self.accounts.get(account_id, {}).get('name', default)
+
+    def account_category(self, account_id: str) -> str:
+        """Kategorinamn för ett konto"""
+        return self.category_name(self.accounts.get(account_id, {}).get('category_id'))
+
+    def accounts_for_company(self, company_id: str) -> List[str]:
+        """Företagets konto-id:n i ursprunglig ordning"""
+        return list(self._accounts_by_company.get(company_id, []))
+
+@bounded_cache(ttl=300, persist=True, depends=(TAG_TEST_DATA,))
+def get_dimension_index(from_snapshot: bool = False) -> DimensionIndex:
+    """Dimensionsindex för aktuell test_data (eller Parquet-snapshotens manifest)"""
+    if from_snapshot:
+        from utils_parquet_snapshot import load_manifest
+        data_dict = load_manifest()
+        return DimensionIndex(data_dict.get('companies'), data_dict.get('accounts'), data_dict.get('categories'))
+
+    from models_repository import get_repository
+    repo = get_repository()
+    return DimensionIndex(repo.get_companies(), repo.get_accounts(), repo.get_categories())
+
+def index_from_firebase(firebase_db) -> DimensionIndex:
+    """Index över toppnoderna companies, accounts och account_categories (ETL-layouten)"""
+    return DimensionIndex(firebase_db.get_companies(), firebase_db.get_accounts(),
+                          firebase_db.get_account_categories())
+
+@bounded_cache(ttl=300)
+def get_firebase_dimension_index() -> DimensionIndex:
+    """Dimensionsindex för toppnoderna (cachas som övriga läsningar av dem)"""
+    from models_firebase_database import get_firebase_db
+    return index_from_firebase(get_firebase_db())
@@ -2,19 +2,72 @@
 Firebase Realtime Database modeller för finansiell analysapp - Enkel version med bara Pyrebase
 """
 import os
+import hashlib
 from datetime import datetime
 from typing import Optional, Dict, List, Any
+from urllib.parse import urlencode
 import pyrebase
 import streamlit as st
 from dotenv import load_dotenv
 from pathlib import Path
 
-# Ladda miljövariabler från .env fil
+from utils_instrumentation import instrument_class, install_http_hook, record_event
+from utils_singleflight import single_flight
+from utils_result_cache import cache_get, cache_put
+
+# Snabb JSON-tolkning för råa läsningar (valfritt beroende)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    import json
+    ORJSON_AVAILABLE = False
+
+# ETag-cache för villkorliga läsningar: (databas, path) -> (etag, rå JSON) i den gemensamma
+# resultatcachen (minnestak och LRU). Delas mellan sessioner - servern kontrollerar ändå
+# behörighet vid varje revalidering.
+ETAG_TTL = 3600
+
+def _singleflight_scope(token: Optional[str]) -> str:
+    """
+    Vilka anropare som får dela en hämtning. Reglerna ger alla inloggade samma läsrätt,
+    så standard är en gemensam scope för autentiserade anrop. FINANS_SINGLEFLIGHT_SCOPE=token
+    delar bara mellan anrop med samma token.
+    """
+    if not token:
+        return "anon"
+    if os.getenv("FINANS_SINGLEFLIGHT_SCOPE", "auth") == "token":
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+    return "auth"
+
+def json_loads(content: bytes) -> Any:
+    """Tolka JSON-svar till vanliga dict/list (orjson om installerat)"""
+    if not content:
+        return None
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def json_dumps(value: Any) -> bytes:
+    """JSON-kropp för skrivningar (orjson om installerat)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value)
+    return json.dumps(value).encode('utf-8')
+
+# Miljövariabler från .env laddas vid första behov (ingen I/O vid import)
 env_path = Path(__file__).parent.parent.parent / '.env'
-load_dotenv(env_path)
+_env_loaded = False
+
+def _load_env() -> None:
+    """Ladda .env-filen en gång"""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv(env_path)
+        _env_loaded = True
 
 def get_env_var(key: str) -> str:
     """Hämta miljövariabel från .env eller Streamlit secrets"""
+    _load_env()
     # Först försök vanliga miljövariabler
     value = os.getenv(key)
     if value:
@@ -23,21 +76,98 @@ def get_env_var(key: str) -> str:
     # Sedan försök Streamlit secrets (för cloud deployment)
     try:
         return st.secrets[key]
-    except (KeyError, AttributeError):
+    except (KeyError, AttributeError, FileNotFoundError):
+        # Saknad secrets.toml (t.ex. lokal backend utan Firebase) - returnera None
         return None
 
-# Debug: Kontrollera att miljövariabler laddas
-print(f"🔍 Debug - Database URL: {get_env_var('FIREBASE_DATABASE_URL')}")
-print(f"🔍 Debug - API Key: {get_env_var('FIREBASE_API_KEY')[:10] if get_env_var('FIREBASE_API_KEY') else 'None'}...")
+def diff_budget_values(existing_values: Dict[str, Any], budget_id: str,
+                       budget_updates: Dict[Any, Dict[int, float]], partial: bool = False):
+    """
+    Jämför befintliga budget_values mot nya värden för en budget
+
+    Args:
+        existing_values: Hela budget_values-noden {key: {budget_id, account_id, month, amount}}
+        budget_id: Budgeten som sparas
+        budget_updates: {account_id: {month: amount}} - celler som saknas tas bort
+        partial: True = bara cellerna i budget_updates berörs (övriga behålls)
+
+    Returns:
+        (updates, stats) - multi-path updates relativt databasroten (None = ta bort)
+        och antal 'added', 'changed', 'removed', 'unchanged'
+    """
+    now = datetime.now().isoformat()
+    updates = {}
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+    # Befintliga celler (account_id, month) -> (key, amount)
+    current = {}
+    for key, value in (existing_values or {}).items():
+        if not isinstance(value, dict) or value.get("budget_id") != budget_id:
+            continue
+        cell = (str(value.get("account_id")), int(value.get("month", 0)))
+        if cell in current:
+            # Dubblett från tidigare delete-and-recreate - städa bort
+            updates[f"budget_values/{key}"] = None
+            continue
+        current[cell] = (key, float(value.get("amount", 0) or 0))
+
+    seen = set()
+    for account_id, months in budget_updates.items():
+        for month, amount in months.items():
+            cell = (str(account_id), int(month))
+            amount = float(amount or 0)
+            seen.add(cell)
+            existing = current.get(cell)
+
+            # Policy: spara aldrig 0-värden
+            if abs(amount) <= 1e-9:
+                if existing:
+                    updates[f"budget_values/{existing[0]}"] = None
+                    stats["removed"] += 1
+                else:
+                    stats["unchanged"] += 1
+                continue
+
+            if existing is None:
+                key = f"{budget_id}_{account_id}_{int(month)}"
+                updates[f"budget_values/{key}"] = {
+                    "budget_id": budget_id,
+                    "account_id": account_id,
+                    "month": int(month),
+                    "amount": amount,
+                    "updated_at": now
+                }
+                stats["added"] += 1
+            elif abs(existing[1] - amount) > 1e-9:
+                updates[f"budget_values/{existing[0]}/amount"] = amount
+                updates[f"budget_values/{existing[0]}/updated_at"] = now
+                stats["changed"] += 1
+            else:
+                stats["unchanged"] += 1
+
+    for cell, (key, _) in current.items():
+        if cell not in seen and not partial:
+            updates[f"budget_values/{key}"] = None
+            stats["removed"] += 1
 
+    return updates, stats
+
+# Max antal paths per multi-path update vid bulk-borttagning
+BULK_DELETE_CHUNK_SIZE = 5000
+
+@instrument_class("firebase", exclude=("get_ref",))
 class FirebaseDB:
     """Firebase Realtime Database hanterare - Använder endast Pyrebase (ingen Service Account behövs!)"""
     
-    def __init__(self):
+    def __init__(self, token: Optional[str] = None):
+        # Egen token för jobb utan användarsession (t.ex. uppvärmningen), annars sessionens
+        self._token = token
         self._initialize_firebase()
         
     def _get_token(self):
         """Hämta idToken för autentiserad användare (krävs av reglerna)."""
+        if self._token:
+            return self._token
         try:
             # Preferera explicit sparad token
             token = st.session_state.get('user_token')
@@ -71,6 +201,8 @@ class FirebaseDB:
         try:
             self.firebase = pyrebase.initialize_app(self.firebase_config)
             self.db = self.firebase.database()
+            # Mät alla HTTP-anrop (anrop, bytes, tid) per rerun
+            install_http_hook(self.firebase.requests)
             print("✅ Firebase initialiserad med Pyrebase (ingen Service Account behövd!)")
         except Exception as e:
             print(f"❌ Firebase initialization failed: {e}")
@@ -82,12 +214,98 @@ class FirebaseDB:
             return self.db.child(path)
         return self.db
 
+    def _request_url(self, path: str, token: Optional[str], query: Dict[str, Any]) -> str:
+        """REST-URL som Pyrebase bygger den, men utan att ändra den delade Database-referensen (trådsäkert)"""
+        parameters = {}
+        if token:
+            parameters['auth'] = token
+        for key, value in query.items():
+            if isinstance(value, bool):
+                parameters[key] = "true" if value else "false"
+            elif isinstance(value, str):
+                parameters[key] = f'"{value}"'
+            else:
+                parameters[key] = value
+        return f"{self.db.database_url}{path.strip('/')}.json?{urlencode(parameters)}"
+
+    def _fetch(self, path: str, query: Dict[str, Any], etag: Optional[str] = None, want_etag: bool = False):
+        """
+        GET via processens single-flight: samtidiga identiska läsningar (samma path, query,
+        ETag och token-scope) delar EN förfrågan. Returnerar (status, ETag, rå JSON).
+        """
+        token = self._get_token()
+        headers = self.db.build_headers(token)
+        if want_etag:
+            headers['X-Firebase-ETag'] = 'true'
+        if etag:
+            headers['If-None-Match'] = etag
+        url = self._request_url(path, token, query)
+
+        def fetch():
+            response = self.firebase.requests.get(url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response.status_code, response.headers.get('ETag'), response.content
+
+        key = (_singleflight_scope(token), path, tuple(sorted(query.items())), etag, want_etag)
+        return single_flight(key, fetch, label=path or "/")
+
+    def get_raw(self, path: str = "", shallow: bool = False, query: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Snabb läsning av en nod: REST GET på Pyrebase poolade session och JSON tolkas
+        direkt till dict/list (orjson om installerat) utan PyreResponse/OrderedDict
+
+        Args:
+            path: Sökväg i databasen ("" = roten)
+            shallow: Hämta bara nycklarna ({key: true})
+            query: Firebase-frågeparametrar, t.ex. {"orderBy": "company_id", "equalTo": "c1"}
+
+        Returns:
+            Nodens värde (None om den saknas)
+        """
+        query = dict(query or {})
+        if shallow:
+            query['shallow'] = True
+        _, _, content = self._fetch(path, query)
+        return json_loads(content)
+
+    def patch_raw(self, updates: Dict[str, Any]) -> None:
+        """
+        Multi-path update (PATCH på roten) via Pyrebase poolade session utan att ändra
+        den delade Database-referensen - säker från bakgrundstrådar (skrivkön)
+        """
+        token = self._get_token()
+        response = self.firebase.requests.patch(
+            self._request_url("", token, {}), headers=self.db.build_headers(token), data=json_dumps(updates)
+        )
+        response.raise_for_status()
+
+    def get_raw_cached(self, path: str) -> Any:
+        """
+        Villkorlig läsning med Firebase ETag: begär X-Firebase-ETag och skickar senast
+        kända ETag som If-None-Match. Vid 304 tolkas den lokalt sparade JSON-kroppen
+        i stället för att ladda ner noden igen.
+
+        Returns:
+            Nodens värde (None om den saknas) - alltid ett nytt objekt
+        """
+        key = ("FirebaseDB.etag", self.db.database_url, path)
+        _, cached = cache_get(key)
+
+        status, etag, content = self._fetch(path, {}, etag=cached[0] if cached else None, want_etag=True)
+
+        if status == 304 and cached:
+            record_event('etag', path, 0, cache_hit=True)
+            return json_loads(cached[1])
+
+        if etag:
+            cache_put(key, (etag, content), ETAG_TTL)
+        return json_loads(content)
+
     def get_companies(self) -> Dict[str, Any]:
         """Hämta alla företag"""
         try:
-            companies_ref = self.get_ref("companies")
-            data = companies_ref.get(self._get_token())
-            return data.val() if data.val() else {}
+            return self.get_raw("companies") or {}
         except Exception as e:
             print(f"Error getting companies: {e}")
             return {}
@@ -95,9 +313,7 @@ class FirebaseDB:
     def get_datasets(self, company_id: Optional[str] = None) -> Dict[str, Any]:
         """Hämta datasets, eventuellt filtrerade på företag"""
         try:
-            datasets_ref = self.get_ref("datasets")
-            data = datasets_ref.get(self._get_token())
-            datasets = data.val() if data.val() else {}
+            datasets = self.get_raw("datasets") or {}
             
             if company_id:
                 return {k: v for k, v in datasets.items() if v.get("company_id") == company_id}
@@ -110,9 +326,7 @@ class FirebaseDB:
     def get_account_categories(self) -> Dict[str, Any]:
         """Hämta alla kontokategorier"""
         try:
-            categories_ref = self.get_ref("account_categories")
-            data = categories_ref.get(self._get_token())
-            return data.val() if data.val() else {}
+            return self.get_raw("account_categories") or {}
         except Exception as e:
             print(f"Error getting account categories: {e}")
             return {}
@@ -120,9 +334,7 @@ class FirebaseDB:
     def get_accounts(self, category_id: Optional[str] = None) -> Dict[str, Any]:
         """Hämta konton, eventuellt filtrerade på kategori"""
         try:
-            accounts_ref = self.get_ref("accounts")
-            data = accounts_ref.get(self._get_token())
-            accounts = data.val() if data.val() else {}
+            accounts = self.get_raw("accounts") or {}
             
             if category_id:
                 return {k: v for k, v in accounts.items() if v.get("category_id") == category_id}
@@ -135,9 +347,7 @@ class FirebaseDB:
     def get_values(self, dataset_id: Optional[str] = None, account_id: Optional[str] = None) -> Dict[str, Any]:
         """Hämta värden med valfri filtrering"""
         try:
-            values_ref = self.get_ref("values")
-            data = values_ref.get(self._get_token())
-            values = data.val() if data.val() else {}
+            values = self.get_raw("values") or {}
             
             if dataset_id:
                 values = {k: v for k, v in values.items() if v.get("dataset_id") == dataset_id}
@@ -153,9 +363,7 @@ class FirebaseDB:
     def get_budgets(self, company_id: Optional[str] = None) -> Dict[str, Any]:
         """Hämta budgetar"""
         try:
-            budgets_ref = self.get_ref("budgets")
-            data = budgets_ref.get(self._get_token())
-            budgets = data.val() if data.val() else {}
+            budgets = self.get_raw("budgets") or {}
             
             if company_id:
                 return {k: v for k, v in budgets.items() if v.get("company_id") == company_id}
@@ -168,9 +376,7 @@ class FirebaseDB:
     def get_budget_values(self, budget_id: Optional[str] = None) -> Dict[str, Any]:
         """Hämta budgetvärden"""
         try:
-            budget_values_ref = self.get_ref("budget_values")
-            data = budget_values_ref.get(self._get_token())
-            values = data.val() if data.val() else {}
+            values = self.get_raw("budget_values") or {}
             
             if budget_id:
                 return {k: v for k, v in values.items() if v.get("budget_id") == budget_id}
@@ -213,15 +419,10 @@ class FirebaseDB:
             
             # Hitta befintligt värde eller skapa nytt
             budget_values_ref = self.get_ref("budget_values")
-            existing_data = budget_values_ref.get(self._get_token())
+            existing_data = self.get_raw("budget_values")
             
-            # Säker hantering av Pyrebase response
-            existing_values = {}
-            if existing_data and existing_data.val():
-                existing_values = existing_data.val()
-                # Säkerställ att det är en dict
-                if not isinstance(existing_values, dict):
-                    existing_values = {}
+            # Säkerställ att det är en dict
+            existing_values = existing_data if isinstance(existing_data, dict) else {}
             
             print(f"🔥 EXISTING VALUES COUNT: {len(existing_values) if existing_values else 0}")
             
@@ -262,23 +463,80 @@ class FirebaseDB:
             print(f"Debug - existing_data: {existing_data if 'existing_data' in locals() else 'Not set'}")
             raise
 
+    def save_budget_values(self, budget_id: str, budget_updates: Dict[Any, Dict[int, float]],
+                           partial: bool = False) -> Dict[str, int]:
+        """
+        Diff-baserad sparning av en hel budget: läser budget_values EN gång och skriver
+        tillagda, ändrade och borttagna celler i EN multi-path update
+        (partial=True: bara angivna celler, t.ex. en batch från skrivkön)
+        """
+        try:
+            existing_values = self._get_budget_values_node()
+
+            updates, stats = diff_budget_values(existing_values, budget_id, budget_updates, partial)
+            if updates:
+                updates[f"budgets/{budget_id}/updated_at"] = datetime.now().isoformat()
+                self.patch_raw(updates)
+
+            print(f"💾 BUDGET DIFF {budget_id}: {stats}")
+            return stats
+        except Exception as e:
+            print(f"Error saving budget values: {e}")
+            raise
+
     # -------- Rensning av budgetdata --------
-    def delete_budget_values_for_budget(self, budget_id: str) -> int:
+    def bulk_delete(self, paths: List[str], chunk_size: Optional[int] = None) -> int:
+        """
+        Ta bort många noder med multi-path update (path -> None) i stället för en
+        remove() per nyckel. Delas upp i chunkar om det är väldigt många paths.
+        Returnerar antal borttagna paths.
+        """
+        paths = list(dict.fromkeys(paths))
+        chunk_size = chunk_size or BULK_DELETE_CHUNK_SIZE
+        removed = 0
+        for i in range(0, len(paths), chunk_size):
+            chunk = paths[i:i + chunk_size]
+            self.get_ref().update({path: None for path in chunk}, self._get_token())
+            removed += len(chunk)
+        return removed
+
+    def _get_budget_values_node(self) -> Dict[str, Any]:
+        """Läs hela budget_values-noden som dict (tom dict vid fel)"""
+        values = self.get_raw("budget_values")
+        return values if isinstance(values, dict) else {}
+
+    def delete_budget_values_for_budget(self, budget_id: str,
+                                        existing_values: Optional[Dict[str, Any]] = None) -> int:
         """Ta bort alla budget_values som hör till ett budget_id. Returnerar antal borttagna."""
         try:
-            ref = self.get_ref("budget_values")
-            snap = ref.get(self._get_token())
-            removed = 0
-            if snap and snap.val():
-                for key, val in snap.val().items():
-                    if isinstance(val, dict) and val.get("budget_id") == budget_id:
-                        ref.child(key).remove(self._get_token())
-                        removed += 1
-            return removed
+            return self.delete_budgets([budget_id], existing_values, delete_budget_nodes=False)
         except Exception as e:
             print(f"Error deleting budget values for budget {budget_id}: {e}")
             return 0
 
+    def delete_budgets(self, budget_ids: List[str], existing_values: Optional[Dict[str, Any]] = None,
+                       delete_budget_nodes: bool = True) -> int:
+        """
+        Ta bort flera budgetar och deras budget_values: läser budget_values en gång
+        (om den inte skickas in) och tar bort allt i en multi-path update.
+        Returnerar antal borttagna budget_values.
+        """
+        budget_ids = set(budget_ids)
+        if not budget_ids:
+            return 0
+        if existing_values is None:
+            existing_values = self._get_budget_values_node()
+
+        value_paths = [f"budget_values/{key}" for key, val in existing_values.items()
+                       if isinstance(val, dict) and val.get("budget_id") in budget_ids]
+        paths = list(value_paths)
+        if delete_budget_nodes:
+            paths += [f"budgets/{bid}" for bid in budget_ids]
+
+        self.bulk_delete(paths)
+        print(f"🗑️ BULK DELETE: {len(budget_ids)} budgetar, {len(value_paths)} budget_values")
+        return len(value_paths)
+
     def delete_budget(self, budget_id: str) -> None:
         """Ta bort en budget-nod."""
         try:
@@ -288,29 +546,21 @@ class FirebaseDB:
 
     def reset_budget_for_company_year(self, company_id: str, year: int) -> int:
         """Ta bort alla budgetar och deras värden för visst företag och år. Returnerar antal rader i budget_values som togs bort."""
-        budgets = self.get_budgets(company_id)
-        total_removed = 0
-        for bid, b in (budgets or {}).items():
-            if b and b.get("year") == year:
-                total_removed += self.delete_budget_values_for_budget(bid)
-                self.delete_budget(bid)
-        return total_removed
+        try:
+            budgets = self.get_budgets(company_id)
+            budget_ids = [bid for bid, b in (budgets or {}).items() if b and b.get("year") == year]
+            return self.delete_budgets(budget_ids)
+        except Exception as e:
+            print(f"Error resetting budget for {company_id}/{year}: {e}")
+            return 0
 
     def nuke_all_budget_data(self) -> int:
         """Ta bort ALLA budgetar och budget_values i databasen. Returnerar antal borttagna budget_values."""
         removed = 0
         try:
-            # Ta bort alla budget_values
-            vals = self.get_ref("budget_values").get(self._get_token())
-            if vals and vals.val():
-                for key in list(vals.val().keys()):
-                    self.get_ref("budget_values").child(key).remove(self._get_token())
-                    removed += 1
-            # Ta bort alla budgets
-            buds = self.get_ref("budgets").get(self._get_token())
-            if buds and buds.val():
-                for key in list(buds.val().keys()):
-                    self.get_ref("budgets").child(key).remove(self._get_token())
+            # Shallow-läsning räcker för att räkna nycklar
+            removed = len(self.get_raw("budget_values", shallow=True) or {})
+            self.bulk_delete(["budget_values", "budgets"])
         except Exception as e:
             print(f"Error nuking all budget data: {e}")
         return removed
@@ -0,0 +1,747 @@
+"""
+Lagringsgränssnitt (repository) för finansiell data
+En gemensam yta för företag, kategorier, konton, värden, budgetar och säsongsindex.
+FirebaseRepository använder Realtime Database, LocalRepository en inbäddad SQLite-fil
+så att appen och benchmarks kan köras helt offline.
+"""
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+
+import streamlit as st
+
+from models_firebase_database import get_firebase_db, get_env_var
+from utils_instrumentation import instrument_class
+from utils_result_cache import cached_call
+from utils_disk_cache import bump_data_version, TAG_TEST_DATA, TAG_SIMPLE_BUDGETS
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun', 'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+
+# Standardfil för lokal lagring (kan överstyras med FINANS_LOCAL_DB)
+LOCAL_DB_PATH = Path(__file__).parent / "data" / "local_store.db"
+
+class FinansRepository(ABC):
+    """Gemensamt gränssnitt för alla lagringsbackends"""
+
+    # -------- Import-data (test_data) --------
+    @abstractmethod
+    def get_test_data(self) -> Dict[str, Any]:
+        """Hämta hela importblobben (meta, companies, categories, accounts, values)"""
+
+    @abstractmethod
+    def save_test_data(self, test_data: Dict[str, Any]) -> None:
+        """Ersätt all importerad data"""
+
+    @abstractmethod
+    def clear_test_data(self) -> None:
+        """Ta bort all importerad data (budgetar behålls)"""
+
+    @abstractmethod
+    def get_meta(self) -> Dict[str, Any]:
+        """Hämta metadata för senaste import"""
+
+    @abstractmethod
+    def get_companies(self) -> Dict[str, Dict[str, Any]]:
+        """Hämta alla företag {company_id: {name, location, ...}}"""
+
+    @abstractmethod
+    def get_categories(self) -> Dict[str, Dict[str, Any]]:
+        """Hämta alla kategorier {category_id: {name, ...}}"""
+
+    @abstractmethod
+    def get_accounts(self, company_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Hämta konton, eventuellt filtrerade på företag"""
+
+    @abstractmethod
+    def get_values(self, company_id: str, years: Optional[List[int]] = None) -> Dict[str, Dict[str, Any]]:
+        """Hämta värden för ett företag, eventuellt filtrerade på år"""
+
+    def get_value_accounts(self, company_id: str, values: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Företagets konton plus konton som dess värden pekar på, även om kontot är sparat
+        under ett annat företag (importen återanvänder konto-id per kontonamn).
+        values = redan hämtade värden, annars läses alla företagets värden.
+        """
+        if values is None:
+            values = self.get_values(company_id)
+        return self._with_referenced_accounts(self.get_accounts(company_id), values)
+
+    def _with_referenced_accounts(self, accounts: Dict[str, Dict[str, Any]],
+                                  values: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Komplettera med konton som saknas bland accounts (en global läsning, bara vid behov)"""
+        missing = {value.get('account_id') for value in values.values()} - set(accounts)
+        missing.discard(None)
+        if not missing:
+            return accounts
+        all_accounts = self.get_accounts()
+        return {**accounts, **{account_id: all_accounts[account_id] for account_id in missing if account_id in all_accounts}}
+
+    def get_years(self, company_id: str) -> List[int]:
+        """Hämta alla år som har värden för ett företag (från meta-index)"""
+        return list(self.get_index().get(company_id, {}).get('years', []))
+
+    # -------- Meta-index (företag, år och antal per företag) --------
+    def get_meta_index(self) -> Optional[Dict[str, Any]]:
+        """Hämta test_data/meta/index (None om importen saknar index)"""
+        return (self.get_meta() or {}).get('index')
+
+    @abstractmethod
+    def save_meta_index(self, index: Dict[str, Any]) -> None:
+        """Skriv test_data/meta/index"""
+
+    def migrate_test_data_layout(self) -> Dict[str, Any]:
+        """Migrera lagrad test_data till aktuell layout (no-op om backend inte behöver det)"""
+        return {'migrated': False, 'accounts': 0, 'values': 0}
+
+    def get_index(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Företagsindex {company_id: {name, location, years, accounts, values}} för
+        företags- och årsväljare. Saknas index (äldre import) byggs det en gång från
+        hela test_data och sparas.
+        """
+        index = self.get_meta_index()
+        if index is None:
+            test_data = self.get_test_data()
+            if not test_data:
+                return {}
+            index = build_meta_index(test_data)
+            try:
+                self.save_meta_index(index)
+                print("🗂️ Meta-index byggt och sparat")
+            except Exception as e:
+                print(f"⚠️ Kunde inte spara meta-index: {e}")
+        return index.get('companies', {}) or {}
+
+    # -------- Budgetar (SIMPLE_BUDGETS) --------
+    @abstractmethod
+    def get_simple_budget(self, company_name: str, year: int, account_name: str) -> Dict[str, float]:
+        """Hämta månadsvärden {'Jan': ..., ...} för ett konto"""
+
+    @abstractmethod
+    def get_simple_budgets(self, company_name: str, year: int) -> Dict[str, Dict[str, float]]:
+        """Hämta månadsvärden för alla konton {account_name: {'Jan': ..., ...}}"""
+
+    @abstractmethod
+    def save_simple_budget(self, company_name: str, year: int, account_name: str, monthly_values: Dict[str, float]) -> None:
+        """Spara månadsvärden för ett konto"""
+
+    @abstractmethod
+    def save_simple_budgets(self, company_name: str, year: int, budgets: Dict[str, Dict[str, float]]) -> None:
+        """Spara månadsvärden för flera konton {account_name: {'Jan': ..., ...}} i en skrivning"""
+
+    @abstractmethod
+    def save_simple_budget_cells(self, company_name: str, year: int, cells: Dict[str, Dict[str, float]]) -> None:
+        """Spara enskilda celler {account_name: {'Mar': ...}} - övriga månader behålls"""
+
+    # -------- Säsongsindex --------
+    @abstractmethod
+    def get_seasonality(self, company_id: str) -> Dict[str, Dict[str, List[float]]]:
+        """Hämta säsongsindex {account_id: {year: [12 index]}}"""
+
+    @abstractmethod
+    def save_seasonality(self, company_id: str, account_id: str, year: int, indices: List[float]) -> None:
+        """Spara 12 säsongsindex för ett konto och år"""
+
+def build_meta_index(test_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Bygg test_data/meta/index: företag med år, antal konton och antal värden"""
+    companies = {
+        company_id: {
+            'name': info.get('name', ''),
+            'location': info.get('location', ''),
+            'years': set(),
+            'accounts': 0,
+            'values': 0
+        }
+        for company_id, info in (test_data.get('companies') or {}).items()
+    }
+    for account in (test_data.get('accounts') or {}).values():
+        entry = companies.get(account.get('company_id')) if isinstance(account, dict) else None
+        if entry:
+            entry['accounts'] += 1
+    for value in (test_data.get('values') or {}).values():
+        entry = companies.get(value.get('company_id')) if isinstance(value, dict) else None
+        if entry and value.get('year') is not None:
+            entry['years'].add(int(value['year']))
+            entry['values'] += 1
+    for entry in companies.values():
+        entry['years'] = sorted(entry['years'])
+    return {'companies': companies, 'updated_at': datetime.now().isoformat()}
+
+def build_compact_budget_node(monthly_values: Dict[str, float]) -> Dict[str, Any]:
+    """Kompakt SIMPLE_BUDGETS-nod: 12 belopp i månadsordning (företag/år/konto finns i sökvägen)"""
+    return {
+        'amounts': [float(monthly_values.get(month, 0) or 0) for month in MONTH_NAMES],
+        'updated_at': datetime.now().isoformat()
+    }
+
+def budget_monthly_values(node: Any) -> Dict[str, float]:
+    """Månadsvärden {'Jan': ..., ...} från en budgetnod - kompakt (amounts) eller äldre (monthly_values)"""
+    if not isinstance(node, dict):
+        return {}
+    if 'amounts' in node:
+        return {month: amount for month, amount in zip(MONTH_NAMES, _month_amounts(node['amounts']))}
+    return node.get('monthly_values', {}) or {}
+
+def _month_amounts(amounts: Any) -> List[float]:
+    """12 belopp från en Firebase-array (lista eller {index: belopp}, null = 0)"""
+    result = [0.0] * 12
+    for key, amount in _children(amounts):
+        index = int(key)
+        if 0 <= index < 12 and amount is not None:
+            result[index] = float(amount)
+    return result
+
+# Lagringslayout för test_data i Firebase (test_data/meta/layout)
+LAYOUT_FLAT = "flat"                # values/value_N, accounts/account_N
+LAYOUT_PARTITIONED = "partitioned"  # values/{company_id}/{year}/value_N, accounts/{company_id}/account_N
+LAYOUT_COMPACT = "compact"          # values/{company_id}/{year}/{account_id}/{type} = [12 belopp]
+PARTITIONED_LAYOUTS = (LAYOUT_PARTITIONED, LAYOUT_COMPACT)
+
+def _children(node: Any):
+    """(nyckel, barn) för en nod som kan vara dict eller lista (Firebase-arrayer)"""
+    if isinstance(node, dict):
+        return node.items()
+    if isinstance(node, list):
+        return ((str(i), child) for i, child in enumerate(node) if child is not None)
+    return ()
+
+def flatten_records(node: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Platta ut konton/värden oavsett layout: poster känns igen på company_id och
+    samlas från alla partitionsnivåer {record_id: post}
+    """
+    records = {}
+    for key, child in _children(node):
+        if isinstance(child, dict) and 'company_id' in child:
+            records[key] = child
+        elif isinstance(child, (dict, list)):
+            records.update(flatten_records(child))
+    return records
+
+def flatten_values(node: Any, company_id: Optional[str] = None, year: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Platta ut värden oavsett layout till {value_id: {company_id, account_id, year, month, amount, type}}.
+    company_id/year anger var i trädet noden lästes (t.ex. test_data/values/{company_id}/{year}).
+    Kompakta 12-månadersarrayer expanderas; 0-belopp hoppas över (lagras aldrig i äldre layout).
+    """
+    values = {}
+    for key, child in _children(node):
+        if isinstance(child, dict) and 'company_id' in child:
+            values[key] = child  # Äldre post (platt eller partitionerad layout)
+        elif company_id is None:
+            values.update(flatten_values(child, key, None))
+        elif year is None:
+            values.update(flatten_values(child, company_id, int(key)))
+        elif isinstance(child, dict):
+            # Kompakt: key = account_id, child = {type: [12 belopp]}
+            for value_type, amounts in child.items():
+                for month_index, amount in enumerate(_month_amounts(amounts)):
+                    if abs(amount) <= 1e-9:
+                        continue
+                    values[f"{key}_{year}_{month_index + 1}_{value_type}"] = {
+                        'company_id': company_id,
+                        'account_id': key,
+                        'year': year,
+                        'month': month_index + 1,
+                        'amount': amount,
+                        'type': value_type
+                    }
+    return values
+
+def compact_test_data(test_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Platt test_data -> kompakt layout: en 12-månadersarray per (konto, år, typ)"""
+    compact = partition_test_data({key: value for key, value in test_data.items() if key != 'values'})
+    compact['meta']['layout'] = LAYOUT_COMPACT
+    compact['accounts'] = partition_accounts(test_data.get('accounts'), test_data.get('values'))
+
+    values = {}
+    for value in (test_data.get('values') or {}).values():
+        month = int(value.get('month') or 0)
+        if not 1 <= month <= 12:
+            continue
+        year_values = values.setdefault(value.get('company_id') or 'okänt', {}).setdefault(str(int(value.get('year') or 0)), {})
+        amounts = year_values.setdefault(value.get('account_id'), {}).setdefault(value.get('type', 'actual'), [0.0] * 12)
+        amounts[month - 1] += float(value.get('amount', 0) or 0)
+
+    compact['values'] = values
+    return compact
+
+def partition_accounts(accounts: Optional[Dict[str, Dict[str, Any]]],
+                       values: Optional[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Konton per företag: under ägaren och dessutom under varje företag vars värden pekar på
+    kontot, så att en företagspartition räcker för att slå upp alla dess värden
+    """
+    referencing: Dict[str, set] = {}
+    for value in (values or {}).values():
+        referencing.setdefault(value.get('account_id'), set()).add(value.get('company_id') or 'okänt')
+
+    partitions = {}
+    for account_id, account in (accounts or {}).items():
+        for company_id in {account.get('company_id') or 'okänt'} | referencing.get(account_id, set()):
+            partitions.setdefault(company_id, {})[account_id] = account
+    return partitions
+
+def partition_test_data(test_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Platt test_data -> partitionerad layout (värden per företag och år, konton per företag)"""
+    partitioned = {key: value for key, value in test_data.items() if key not in ('accounts', 'values')}
+    partitioned['meta'] = {**(test_data.get('meta') or {}), 'layout': LAYOUT_PARTITIONED}
+
+    accounts = partition_accounts(test_data.get('accounts'), test_data.get('values'))
+    values = {}
+    for value_id, value in (test_data.get('values') or {}).items():
+        company_values = values.setdefault(value.get('company_id') or 'okänt', {})
+        company_values.setdefault(str(int(value.get('year') or 0)), {})[value_id] = value
+
+    partitioned['accounts'] = accounts
+    partitioned['values'] = values
+    return partitioned
+
+def _account_partitions_complete(node: Any, flat: Dict[str, Any]) -> bool:
+    """Har varje företagspartition i test_data/accounts alla konton som partition_accounts ger?"""
+    stored = {company_id: set(flatten_records(partition)) for company_id, partition in _children(node)}
+    expected = partition_accounts(flat.get('accounts'), flat.get('values'))
+    return all(set(accounts) <= stored.get(company_id, set()) for company_id, accounts in expected.items())
+
+def flatten_test_data(test_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Valfri layout -> platt test_data (det format importen, snapshot och index använder)"""
+    if not test_data:
+        return {}
+    flat = dict(test_data)
+    flat['accounts'] = flatten_records(test_data.get('accounts'))
+    flat['values'] = flatten_values(test_data.get('values'))
+    return flat
+
+@instrument_class("repository")
+class FirebaseRepository(FinansRepository):
+    """Repository mot Firebase Realtime Database (via FirebaseDB/Pyrebase)"""
+
+    def __init__(self, firebase_db=None):
+        self.firebase_db = firebase_db or get_firebase_db()
+        self._layout = None
+
+    def _get(self, path: str, query: Optional[Dict[str, Any]] = None) -> Any:
+        """Läs en nod och returnera värdet (None om den saknas) - revalideras med ETag om ingen query"""
+        if query:
+            return self.firebase_db.get_raw(path, query=query)
+        return self.firebase_db.get_raw_cached(path)
+
+    def _get_layout(self) -> str:
+        """Layout för test_data (läses en gång per repository-instans)"""
+        if self._layout is None:
+            self._layout = self._get("test_data/meta/layout") or LAYOUT_FLAT
+        return self._layout
+
+    def _cache_scope(self) -> str:
+        return f"firebase:{self.firebase_db.firebase_config.get('databaseURL', '')}"
+
+    def get_test_data(self) -> Dict[str, Any]:
+        # Hela test_data cachas i minnet och på disk (versioneras vid import)
+        return cached_call("FirebaseRepository.get_test_data", (),
+                           lambda: flatten_test_data(self._get("test_data") or {}),
+                           persist=True, depends=(TAG_TEST_DATA,), scope=self._cache_scope())
+
+    def save_test_data(self, test_data: Dict[str, Any]) -> None:
+        self.firebase_db.get_ref("test_data").set(compact_test_data(test_data), self.firebase_db._get_token())
+        self._layout = LAYOUT_COMPACT
+        bump_data_version(TAG_TEST_DATA)
+
+    def clear_test_data(self) -> None:
+        self.firebase_db.get_ref("test_data").remove(self.firebase_db._get_token())
+        self._layout = None
+        bump_data_version(TAG_TEST_DATA)
+
+    def migrate_test_data_layout(self) -> Dict[str, Any]:
+        """
+        Skriv om befintlig test_data till kompakt partitionerad layout (en läsning, en skrivning).
+        Kompakt data skrivs också om när en företagspartition saknar konton som dess värden pekar på.
+        """
+        raw = self._get("test_data") or {}
+        if not raw:
+            return {'migrated': False, 'accounts': 0, 'values': 0}
+        flat = flatten_test_data(raw)
+        if (raw.get('meta') or {}).get('layout') == LAYOUT_COMPACT and \
+                _account_partitions_complete(raw.get('accounts'), flat):
+            return {'migrated': False, 'accounts': 0, 'values': 0}
+        self.save_test_data(flat)
+        print(f"🗂️ test_data migrerad till kompakt layout: {len(flat['accounts'])} konton, {len(flat['values'])} värden")
+        return {'migrated': True, 'accounts': len(flat['accounts']), 'values': len(flat['values'])}
+
+    def get_meta(self) -> Dict[str, Any]:
+        return self._get("test_data/meta") or {}
+
+    def get_meta_index(self) -> Optional[Dict[str, Any]]:
+        return self._get("test_data/meta/index")
+
+    def save_meta_index(self, index: Dict[str, Any]) -> None:
+        self.firebase_db.get_ref("test_data/meta/index").set(index, self.firebase_db._get_token())
+
+    def get_companies(self) -> Dict[str, Dict[str, Any]]:
+        return self._get("test_data/companies") or {}
+
+    def get_categories(self) -> Dict[str, Dict[str, Any]]:
+        return self._get("test_data/categories") or {}
+
+    def get_accounts(self, company_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        if company_id and self._get_layout() in PARTITIONED_LAYOUTS:
+            # Läs endast företagets partition (som även har kopior av andra företags refererade konton)
+            accounts = flatten_records(self._get(f"test_data/accounts/{company_id}"))
+            return {k: v for k, v in accounts.items() if v.get('company_id') == company_id}
+        accounts = flatten_records(self._get("test_data/accounts"))
+        if company_id:
+            return {k: v for k, v in accounts.items() if v.get('company_id') == company_id}
+        return accounts
+
+    def get_value_accounts(self, company_id: str, values: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+        if self._get_layout() in PARTITIONED_LAYOUTS:
+            # Partitionen innehåller alla konton företagets värden pekar på - ingen global läsning
+            accounts = flatten_records(self._get(f"test_data/accounts/{company_id}"))
+            return accounts if values is None else self._with_referenced_accounts(accounts, values)
+        return super().get_value_accounts(company_id, values)
+
+    def get_values(self, company_id: str, years: Optional[List[int]] = None) -> Dict[str, Dict[str, Any]]:
+        if years is not None and len(years) == 0:
+            return {}
+        if self._get_layout() in PARTITIONED_LAYOUTS:
+            # Ett år -> årspartitionen, flera år -> nyckelintervall i företagets partition
+            if years is not None and len(years) == 1:
+                year = int(years[0])
+                values = flatten_values(self._get(f"test_data/values/{company_id}/{year}"), company_id, year)
+            elif years:
+                year_range = {"orderBy": "$key", "startAt": str(min(map(int, years))), "endAt": str(max(map(int, years)))}
+                values = flatten_values(self._get(f"test_data/values/{company_id}", query=year_range), company_id)
+            else:
+                values = flatten_values(self._get(f"test_data/values/{company_id}"), company_id)
+        else:
+            values = flatten_values(self._get("test_data/values"))
+        years = None if years is None else {int(y) for y in years}
+        return {
+            k: v for k, v in values.items()
+            if v.get('company_id') == company_id and (years is None or v.get('year') in years)
+        }
+
+    def get_simple_budget(self, company_name: str, year: int, account_name: str) -> Dict[str, float]:
+        return budget_monthly_values(self._get(f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}"))
+
+    def get_simple_budgets(self, company_name: str, year: int) -> Dict[str, Dict[str, float]]:
+        def load():
+            nodes = self._get(f"SIMPLE_BUDGETS/{company_name}/{year}") or {}
+            return {
+                account_name: budget_monthly_values(node)
+                for account_name, node in nodes.items() if isinstance(node, dict)
+            }
+        return cached_call("FirebaseRepository.get_simple_budgets", (company_name, int(year)), load,
+                           persist=True, depends=(TAG_SIMPLE_BUDGETS,), scope=self._cache_scope())
+
+    def save_simple_budget(self, company_name: str, year: int, account_name: str, monthly_values: Dict[str, float]) -> None:
+        budget_ref = self.firebase_db.get_ref(f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}")
+        budget_ref.set(build_compact_budget_node(monthly_values), self.firebase_db._get_token())
+        bump_data_version(TAG_SIMPLE_BUDGETS)
+
+    def save_simple_budgets(self, company_name: str, year: int, budgets: Dict[str, Dict[str, float]]) -> None:
+        if not budgets:
+            return
+        # EN multi-path update med en kompakt nod per ändrat konto
+        updates = {
+            f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}": build_compact_budget_node(monthly_values)
+            for account_name, monthly_values in budgets.items()
+        }
+        self.firebase_db.patch_raw(updates)
+        bump_data_version(TAG_SIMPLE_BUDGETS)
+
+    def save_simple_budget_cells(self, company_name: str, year: int, cells: Dict[str, Dict[str, float]]) -> None:
+        if not cells:
+            return
+        # Färsk läsning (ingen cache) - körs från skrivkön och ska se andra sessioners ändringar
+        nodes = self.firebase_db.get_raw(f"SIMPLE_BUDGETS/{company_name}/{year}") or {}
+        now = datetime.now().isoformat()
+        updates = {}
+        for account_name, months in cells.items():
+            path = f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}"
+            node = nodes.get(account_name)
+            if isinstance(node, dict) and 'amounts' in node:
+                for month, amount in months.items():
+                    updates[f"{path}/amounts/{MONTH_NAMES.index(month)}"] = float(amount or 0)
+                updates[f"{path}/updated_at"] = now
+            else:
+                # Nytt konto eller äldre format (monthly_values) - hela den kompakta noden skrivs
+                updates[path] = build_compact_budget_node({**budget_monthly_values(node), **months})
+        self.firebase_db.patch_raw(updates)
+        bump_data_version(TAG_SIMPLE_BUDGETS)
+
+    def get_seasonality(self, company_id: str) -> Dict[str, Dict[str, List[float]]]:
+        return self._get(f"SEASONALITY/{company_id}") or {}
+
+    def save_seasonality(self, company_id: str, account_id: str, year: int, indices: List[float]) -> None:
+        ref = self.firebase_db.get_ref(f"SEASONALITY/{company_id}/{account_id}/{year}")
+        ref.set([float(v) for v in indices], self.firebase_db._get_token())
+
+@instrument_class("sql")
+class LocalRepository(FinansRepository):
+    """Repository mot en lokal inbäddad SQLite-fil - kräver varken nätverk eller inloggning"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 1), data TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS companies (id TEXT PRIMARY KEY, name TEXT NOT NULL, location TEXT, created_at TEXT);
+    CREATE TABLE IF NOT EXISTS categories (id TEXT PRIMARY KEY, name TEXT NOT NULL, description TEXT, created_at TEXT);
+    CREATE TABLE IF NOT EXISTS accounts (
+        id TEXT PRIMARY KEY, name TEXT NOT NULL, category_id TEXT, company_id TEXT, created_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS fin_values (
+        id TEXT PRIMARY KEY, company_id TEXT NOT NULL, account_id TEXT NOT NULL,
+        year INTEGER NOT NULL, month INTEGER NOT NULL, amount REAL NOT NULL,
+        type TEXT NOT NULL, created_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_values_company_year ON fin_values (company_id, year);
+    CREATE TABLE IF NOT EXISTS simple_budgets (
+        company TEXT NOT NULL, year INTEGER NOT NULL, account TEXT NOT NULL, data TEXT NOT NULL,
+        PRIMARY KEY (company, year, account)
+    );
+    CREATE TABLE IF NOT EXISTS seasonality (
+        company_id TEXT NOT NULL, account_id TEXT NOT NULL, year INTEGER NOT NULL, indices TEXT NOT NULL,
+        PRIMARY KEY (company_id, account_id, year)
+    );
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = str(db_path or LOCAL_DB_PATH)
+        if self.db_path != ":memory:":
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # Streamlit kör varje session i egen tråd - en delad anslutning skyddad av lås
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_test_data(self) -> Dict[str, Any]:
+        companies = self.get_companies()
+        if not companies:
+            return {}
+        values = {}
+        for row in self._query("SELECT * FROM fin_values"):
+            values[row['id']] = self._value_dict(row)
+        return {
+            'meta': self.get_meta(),
+            'companies': companies,
+            'categories': self.get_categories(),
+            'accounts': self.get_accounts(),
+            'values': values
+        }
+
+    def save_test_data(self, test_data: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._clear_test_data_locked()
+            self._conn.execute(
+                "INSERT INTO meta (id, data) VALUES (1, ?)",
+                (json.dumps(test_data.get('meta', {}), ensure_ascii=False),)
+            )
+            self._conn.executemany(
+                "INSERT INTO companies (id, name, location, created_at) VALUES (?, ?, ?, ?)",
+                [(cid, c.get('name'), c.get('location'), c.get('created_at'))
+                 for cid, c in (test_data.get('companies') or {}).items()]
+            )
+            self._conn.executemany(
+                "INSERT INTO categories (id, name, description, created_at) VALUES (?, ?, ?, ?)",
+                [(cid, c.get('name'), c.get('description'), c.get('created_at'))
+                 for cid, c in (test_data.get('categories') or {}).items()]
+            )
+            self._conn.executemany(
+                "INSERT INTO accounts (id, name, category_id, company_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(aid, a.get('name'), a.get('category_id'), a.get('company_id'), a.get('created_at'))
+                 for aid, a in (test_data.get('accounts') or {}).items()]
+            )
+            self._conn.executemany(
+                "INSERT INTO fin_values (id, company_id, account_id, year, month, amount, type, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(vid, v.get('company_id'), v.get('account_id'), int(v.get('year')), int(v.get('month')),
+                  float(v.get('amount', 0)), v.get('type', 'actual'), v.get('created_at'))
+                 for vid, v in (test_data.get('values') or {}).items()]
+            )
+        bump_data_version(TAG_TEST_DATA)
+
+    def _clear_test_data_locked(self) -> None:
+        for table in ("meta", "companies", "categories", "accounts", "fin_values"):
+            self._conn.execute(f"DELETE FROM {table}")
+
+    def clear_test_data(self) -> None:
+        with self._lock, self._conn:
+            self._clear_test_data_locked()
+        bump_data_version(TAG_TEST_DATA)
+
+    def get_meta(self) -> Dict[str, Any]:
+        rows = self._query("SELECT data FROM meta WHERE id = 1")
+        return json.loads(rows[0]['data']) if rows else {}
+
+    def save_meta_index(self, index: Dict[str, Any]) -> None:
+        meta = self.get_meta()
+        meta['index'] = index
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (id, data) VALUES (1, ?)",
+                (json.dumps(meta, ensure_ascii=False),)
+            )
+
+    def get_companies(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            row['id']: {'name': row['name'], 'location': row['location'], 'created_at': row['created_at']}
+            for row in self._query("SELECT * FROM companies")
+        }
+
+    def get_categories(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            row['id']: {'name': row['name'], 'description': row['description'], 'created_at': row['created_at']}
+            for row in self._query("SELECT * FROM categories")
+        }
+
+    def get_accounts(self, company_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        if company_id:
+            rows = self._query("SELECT * FROM accounts WHERE company_id = ?", (company_id,))
+        else:
+            rows = self._query("SELECT * FROM accounts")
+        return {row['id']: self._account_dict(row) for row in rows}
+
+    def get_value_accounts(self, company_id: str, values: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+        # Alla företagets värden finns i tabellen - en fråga oavsett vilka värden som hämtats
+        rows = self._query(
+            "SELECT * FROM accounts WHERE company_id = ? "
+            "OR id IN (SELECT DISTINCT account_id FROM fin_values WHERE company_id = ?)",
+            (company_id, company_id)
+        )
+        return {row['id']: self._account_dict(row) for row in rows}
+
+    @staticmethod
+    def _account_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'name': row['name'], 'category_id': row['category_id'],
+            'company_id': row['company_id'], 'created_at': row['created_at']
+        }
+
+    @staticmethod
+    def _value_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'company_id': row['company_id'], 'account_id': row['account_id'],
+            'year': row['year'], 'month': row['month'], 'amount': row['amount'],
+            'type': row['type'], 'created_at': row['created_at']
+        }
+
+    def get_values(self, company_id: str, years: Optional[List[int]] = None) -> Dict[str, Dict[str, Any]]:
+        sql = "SELECT * FROM fin_values WHERE company_id = ?"
+        params: List[Any] = [company_id]
+        if years is not None:
+            years = [int(y) for y in years]
+            if not years:
+                return {}
+            sql += f" AND year IN ({','.join('?' * len(years))})"
+            params.extend(years)
+        return {row['id']: self._value_dict(row) for row in self._query(sql, tuple(params))}
+
+    def get_years(self, company_id: str) -> List[int]:
+        rows = self._query("SELECT DISTINCT year FROM fin_values WHERE company_id = ? ORDER BY year", (company_id,))
+        return [row['year'] for row in rows]
+
+    def get_simple_budget(self, company_name: str, year: int, account_name: str) -> Dict[str, float]:
+        rows = self._query(
+            "SELECT data FROM simple_budgets WHERE company = ? AND year = ? AND account = ?",
+            (company_name, int(year), account_name)
+        )
+        return budget_monthly_values(json.loads(rows[0]['data'])) if rows else {}
+
+    def get_simple_budgets(self, company_name: str, year: int) -> Dict[str, Dict[str, float]]:
+        rows = self._query(
+            "SELECT account, data FROM simple_budgets WHERE company = ? AND year = ?",
+            (company_name, int(year))
+        )
+        return {row['account']: budget_monthly_values(json.loads(row['data'])) for row in rows}
+
+    def save_simple_budget(self, company_name: str, year: int, account_name: str, monthly_values: Dict[str, float]) -> None:
+        node = build_compact_budget_node(monthly_values)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO simple_budgets (company, year, account, data) VALUES (?, ?, ?, ?)",
+                (company_name, int(year), account_name, json.dumps(node, ensure_ascii=False))
+            )
+        bump_data_version(TAG_SIMPLE_BUDGETS)
+
+    def save_simple_budgets(self, company_name: str, year: int, budgets: Dict[str, Dict[str, float]]) -> None:
+        if not budgets:
+            return
+        rows = [
+            (company_name, int(year), account_name, json.dumps(build_compact_budget_node(monthly_values), ensure_ascii=False))
+            for account_name, monthly_values in budgets.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO simple_budgets (company, year, account, data) VALUES (?, ?, ?, ?)", rows
+            )
+        bump_data_version(TAG_SIMPLE_BUDGETS)
+
+    def save_simple_budget_cells(self, company_name: str, year: int, cells: Dict[str, Dict[str, float]]) -> None:
+        if not cells:
+            return
+        with self._lock, self._conn:
+            rows = []
+            for account_name, months in cells.items():
+                row = self._conn.execute(
+                    "SELECT data FROM simple_budgets WHERE company = ? AND year = ? AND account = ?",
+                    (company_name, int(year), account_name)
+                ).fetchone()
+                current = budget_monthly_values(json.loads(row[0])) if row else {}
+                node = build_compact_budget_node({**current, **months})
+                rows.append((company_name, int(year), account_name, json.dumps(node, ensure_ascii=False)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO simple_budgets (company, year, account, data) VALUES (?, ?, ?, ?)", rows
+            )
+        bump_data_version(TAG_SIMPLE_BUDGETS)
+
+    def get_seasonality(self, company_id: str) -> Dict[str, Dict[str, List[float]]]:
+        result: Dict[str, Dict[str, List[float]]] = {}
+        for row in self._query("SELECT * FROM seasonality WHERE company_id = ?", (company_id,)):
+            result.setdefault(row['account_id'], {})[str(row['year'])] = json.loads(row['indices'])
+        return result
+
+    def save_seasonality(self, company_id: str, account_id: str, year: int, indices: List[float]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO seasonality (company_id, account_id, year, indices) VALUES (?, ?, ?, ?)",
+                (company_id, account_id, int(year), json.dumps([float(v) for v in indices]))
+            )
+
+def create_repository(backend: Optional[str] = None) -> FinansRepository:
+    """Skapa repository för angiven backend ('firebase' eller 'local'), default från FINANS_STORAGE_BACKEND"""
+    backend = (backend or get_env_var("FINANS_STORAGE_BACKEND") or "firebase").lower()
+    if backend in ("local", "sqlite"):
+        return LocalRepository(get_env_var("FINANS_LOCAL_DB"))
+    return FirebaseRepository()
+
+# Repository för bakgrundsjobb utan användarsession (per tråd)
+_thread_repository = threading.local()
+
+@contextmanager
+def use_repository(repo: FinansRepository):
+    """Låt get_repository() returnera repo i aktuell tråd (t.ex. uppvärmningen) - rör inte session_state"""
+    previous = getattr(_thread_repository, 'repo', None)
+    _thread_repository.repo = repo
+    try:
+        yield repo
+    finally:
+        _thread_repository.repo = previous
+
+# Global instans
+def get_repository() -> FinansRepository:
+    """Hämta repository-instans för sessionen (eller trådens, se use_repository)"""
+    repo = getattr(_thread_repository, 'repo', None)
+    if repo is not None:
+        return repo
+    if 'finans_repository' not in st.session_state:
+        st.session_state.finans_repository = create_repository()
+    return st.session_state.finans_repository
@@ -12,7 +12,6 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime
 import numpy as np
-import time
 
 # Path setup
 project_root = Path(__file__).parent.parent.parent
@@ -24,69 +23,52 @@ from utils_firebase_helpers import (
     get_companies, get_years_for_company, get_financial_data, 
     get_account_categories, get_company_by_id
 )
-from models_firebase_database import get_firebase_db
+from models_repository import get_repository
+from models_dimension_index import get_dimension_index
+from utils_instrumentation import instrument, last_event
+from utils_result_cache import bounded_cache
+from utils_disk_cache import TAG_TEST_DATA
+from utils_prefetch import prefetch_company
+from utils_parquet_snapshot import use_snapshot, load_manifest, load_snapshot_actuals, snapshot_years
 
+@instrument("loader", cached=True)
 @st.cache_data(ttl=300)
-def get_company_and_years_info(company_id):
+def get_company_and_years_info(company_id, from_snapshot=False):
     """Hämta endast företagsinfo och tillgängliga år - lättvikt"""
     try:
-        firebase_db = get_firebase_db()
+        if from_snapshot:
+            # Manifestet har redan år per företag - ingen genomsökning av värden
+            return load_manifest().get('companies', {}).get(company_id), snapshot_years(company_id)
         
-        # Hämta endast företagsinfo och år
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        repo = get_repository()
         
-        if not test_data or not test_data.val():
+        # Hämta endast företagsinfo och år
+        # Företagsinfo och år finns i meta-index - ingen genomsökning av värden
+        company_info = repo.get_index().get(company_id)
+        if not company_info:
             return None, []
         
-        data_dict = test_data.val()
-        companies_data = data_dict.get('companies', {})
-        values_data = data_dict.get('values', {})
-        
-        # Hämta företagsinfo
-        company_info = companies_data.get(company_id)
-        
-        # Hämta tillgängliga år
-        years_found = set()
-        for value_id, value_data in values_data.items():
-            if value_data.get('company_id') == company_id:
-                years_found.add(value_data.get('year'))
-        
-        return company_info, sorted(list(years_found))
+        return company_info, list(company_info.get('years', []))
         
     except Exception as e:
         st.error(f"Fel vid hämtning av företagsinfo: {e}")
         return None, []
 
-@st.cache_data(ttl=300)
-def get_accounts_list(company_id):
+@instrument("loader", cached=True)
+@bounded_cache(ttl=300, persist=True, depends=(TAG_TEST_DATA,))
+def get_accounts_list(company_id, from_snapshot=False):
     """Hämta endast kontolista för företaget - lättvikt med samma sortering som budget-sidan"""
     try:
-        firebase_db = get_firebase_db()
-
-        # Hämta endast konton och kategorier
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
-
-        if not test_data or not test_data.val():
-            return pd.DataFrame()
-
-        data_dict = test_data.val()
-        accounts_data = data_dict.get('accounts', {})
-        categories_data = data_dict.get('categories', {})
-
-        # Bygg kontolista
-        accounts_list = []
-        for account_id, account_info in accounts_data.items():
-            if account_info.get('company_id') == company_id:
-                category_id = account_info.get('category_id')
-                category_info = categories_data.get(category_id, {})
-
-                accounts_list.append({
-                    'account_id': account_id,
-                    'account_name': account_info.get('name', 'Okänt konto'),
-                    'category': category_info.get('name', 'Okänd kategori')
-                })
+        # Konton och kategorinamn ur dimensionsindexet - inga genomsökningar
+        index = get_dimension_index(from_snapshot)
+        accounts_list = [
+            {
+                'account_id': account_id,
+                'account_name': index.account_name(account_id),
+                'category': index.account_category(account_id)
+            }
+            for account_id in index.accounts_for_company(company_id)
+        ]
 
         df = pd.DataFrame(accounts_list)
         
@@ -100,136 +82,126 @@ def get_accounts_list(company_id):
         st.error(f"Fel vid hämtning av kontolista: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
-def get_seasonal_data_optimized(company_id, years, selected_accounts, show_budget_ref):
-    """Hämta data för säsongsanalys - optimerad för valda konton endast"""
-    try:
-        firebase_db = get_firebase_db()
-        
-        # Hämta ALLT från test_data i EN enda call
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
-        
-        if not test_data or not test_data.val():
-            return pd.DataFrame(), {'firebase_reads': 1, 'fetch_time': 0}
-        
-        start_time = time.time()
-        firebase_reads = 1  # test_data call
-        
-        data_dict = test_data.val()
-        values_data = data_dict.get('values', {})
-        accounts_data = data_dict.get('accounts', {})
-        categories_data = data_dict.get('categories', {})
-        companies_data = data_dict.get('companies', {})
-        
-        # Bygg DataFrame för faktiska värden över alla år - ENDAST valda konton
-        data = []
-        
-        # Skapa account_id lookup för valda konton
-        selected_account_ids = set()
-        for account_id, account_info in accounts_data.items():
-            if (account_info.get('company_id') == company_id and 
-                account_info.get('name') in selected_accounts):
-                selected_account_ids.add(account_id)
+@bounded_cache(ttl=300, persist=True)
+def get_company_slice(company_id, from_snapshot=False):
+    """
+    Nivå 1: alla faktiska värden och budgetar för företagets samtliga år och konton.
+    Cachas en gång per företag (även på disk) - urval av konton/år görs billigt i nivå 2.
+    """
+    repo = get_repository()
+    # Namn/id-uppslag via dimensionsindexet (byggs en gång per datauppsättning)
+    index = get_dimension_index(from_snapshot)
+    
+    if from_snapshot:
+        # Värden läses kolumnärt nedan
+        values_data = {}
+        years = snapshot_years(company_id)
+    else:
+        if not index.companies:
+            return pd.DataFrame()
+        # Företagets värden för alla år via repository
+        values_data = repo.get_values(company_id)
+        years = sorted({v.get('year') for v in values_data.values() if v.get('year') is not None})
+    
+    # Företagets konton: account_id -> (kontonamn, kategori)
+    company_accounts = {
+        account_id: (index.account_name(account_id), index.account_category(account_id))
+        for account_id in index.accounts_for_company(company_id)
+    }
+    
+    # Snapshot: en lokal kolumnär läsning för alla år och konton
+    snapshot_df = pd.DataFrame()
+    if from_snapshot and years:
+        snapshot_df = load_snapshot_actuals(company_id, years)
+    
+    # Faktiska värden för alla år
+    data = []
+    for value_id, value_data in values_data.items():
+        if (value_data.get('company_id') == company_id and 
+            value_data.get('type') == 'actual' and
+            value_data.get('account_id') in company_accounts):
+            
+            account_id = value_data.get('account_id')
+            account_name, category = company_accounts[account_id]
+            data.append({
+                'account_id': account_id,
+                'account_name': account_name,
+                'category': category,
+                'month': value_data.get('month'),
+                'amount': value_data.get('amount', 0),
+                'year': value_data.get('year'),
+                'type': 'Faktiskt'
+            })
+    
+    # Budgetvärden för alla år - endast konton som finns hos företaget
+    company_name = index.company_name(company_id)
+    if company_name:
+        month_mapping = {
+            'Jan':1,'Feb':2,'Mar':3,'Apr':4,'Maj':5,'May':5,'Jun':6,'Jul':7,
+            'Aug':8,'Sep':9,'Okt':10,'Oct':10,'Nov':11,'Dec':12
+        }
         
-        # Lägg till faktiska värden för alla valda år - ENDAST valda konton
-        for value_id, value_data in values_data.items():
-            if (value_data.get('company_id') == company_id and 
-                value_data.get('year') in years and
-                value_data.get('type') == 'actual' and
-                value_data.get('account_id') in selected_account_ids):
-                
-                account_id = value_data.get('account_id')
-                account_info = accounts_data.get(account_id, {})
-                category_id = account_info.get('category_id')
-                category_info = categories_data.get(category_id, {})
+        for year in years:
+            for account_name, monthly_values in repo.get_simple_budgets(company_name, year).items():
+                account_id = index.account_id(company_id, account_name)
+                if not account_id or not monthly_values:
+                    continue
+                category = company_accounts[account_id][1]
                 
-                data.append({
-                    'account_id': account_id,
-                    'account_name': account_info.get('name', 'Okänt konto'),
-                    'category': category_info.get('name', 'Okänd kategori'),
-                    'month': value_data.get('month'),
-                    'amount': value_data.get('amount', 0),
-                    'year': value_data.get('year'),
-                    'type': 'Faktiskt'
-                })
-        
-        # Lägg till budgetvärden för alla valda år - ENDAST valda konton
-        company_name = None
-        for comp_id, comp_info in companies_data.items():
-            if comp_id == company_id:
-                company_name = comp_info.get('name')
-                break
-        
-        if company_name and show_budget_ref:
-            month_mapping = {
-                'Jan':1,'Feb':2,'Mar':3,'Apr':4,'Maj':5,'May':5,'Jun':6,'Jul':7,
-                'Aug':8,'Sep':9,'Okt':10,'Oct':10,'Nov':11,'Dec':12
-            }
-            
-            # Hämta budget endast för valda konton
-            for account_name in selected_accounts:
-                for year in years:
-                    budget_path = f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}/monthly_values"
-                    budget_ref = firebase_db.get_ref(budget_path)
-                    budget_data = budget_ref.get(firebase_db._get_token())
-                    firebase_reads += 1
-                    
-                    monthly_values = budget_data.val() if (budget_data and budget_data.val()) else {}
-                    
-                    if not monthly_values:
+                for month_name, amount in monthly_values.items():
+                    m = month_mapping.get(month_name)
+                    if not m or not amount:
                         continue
-                    
-                    # Hitta account_id för detta kontonamn
-                    account_id = None
-                    for aid, account_info in accounts_data.items():
-                        if (account_info.get('company_id') == company_id and 
-                            account_info.get('name') == account_name):
-                            account_id = aid
-                            break
-                    
-                    if not account_id:
+                    try:
+                        amt = float(amount)
+                    except (TypeError, ValueError):
                         continue
                     
-                    category_id = accounts_data.get(account_id, {}).get('category_id')
-                    category_info = categories_data.get(category_id, {})
-                    
-                    for month_name, amount in monthly_values.items():
-                        m = month_mapping.get(month_name)
-                        if not m or not amount:
-                            continue
-                        try:
-                            amt = float(amount)
-                        except (TypeError, ValueError):
-                            continue
-                        
-                        data.append({
-                            'account_id': account_id,
-                            'account_name': account_name,
-                            'category': category_info.get('name', 'Okänd kategori'),
-                            'month': m,
-                            'amount': amt,
-                            'year': year,
-                            'type': 'Budget'
-                        })
-        
-        df = pd.DataFrame(data)
-        
-        if not df.empty:
-            # Dedupe budget-rader på kontonamn+månad+år
-            mask = df['type'] == 'Budget'
-            df_budget = df[mask].drop_duplicates(subset=['account_name','month','year'])
-            df_actual = df[~mask]
-            df = pd.concat([df_actual, df_budget], ignore_index=True) \
-                   .sort_values(['category','account_name','year','month'])
-        
-        fetch_time = (time.time() - start_time) * 1000  # ms
+                    data.append({
+                        'account_id': account_id,
+                        'account_name': account_name,
+                        'category': category,
+                        'month': m,
+                        'amount': amt,
+                        'year': year,
+                        'type': 'Budget'
+                    })
+    
+    df = pd.concat([snapshot_df, pd.DataFrame(data)], ignore_index=True) if not snapshot_df.empty else pd.DataFrame(data)
+    
+    if not df.empty:
+        # Dedupe budget-rader på kontonamn+månad+år
+        mask = df['type'] == 'Budget'
+        df_budget = df[mask].drop_duplicates(subset=['account_name','month','year'])
+        df_actual = df[~mask]
+        df = pd.concat([df_actual, df_budget], ignore_index=True) \
+               .sort_values(['category','account_name','year','month']) \
+               .reset_index(drop=True)
+    
+    return df
+
+@instrument("loader", cached=True)
+@bounded_cache(ttl=300)
+def get_seasonal_data_optimized(company_id, years, selected_accounts, show_budget_ref, from_snapshot=False):
+    """Nivå 2: urval av valda konton/år ur företagets cachade data (nivå 1)"""
+    try:
+        df = get_company_slice(company_id, from_snapshot)
+        if df.empty:
+            return df
         
-        return df, {'firebase_reads': firebase_reads, 'fetch_time': fetch_time}
+        mask = df['year'].isin(list(years)) & df['account_name'].isin(list(selected_accounts))
+        if not show_budget_ref:
+            mask &= df['type'] != 'Budget'
+        return df[mask].reset_index(drop=True)
         
     except Exception as e:
         st.error(f"Fel vid hämtning av säsongsdata: {e}")
-        return pd.DataFrame(), {'firebase_reads': 0, 'fetch_time': 0}
+        return pd.DataFrame()
+
+def clear_seasonal_cache():
+    """Töm båda nivåerna av säsongsdatan (används av benchmark och efter import)"""
+    get_company_slice.clear()
+    get_seasonal_data_optimized.clear()
 
 def calculate_seasonal_metrics(df, selected_accounts, years):
     """Beräkna säsongsmätvärden för valda konton"""
@@ -323,6 +295,7 @@ def calculate_seasonal_metrics(df, selected_accounts, years):
     
     return pd.DataFrame(results)
 
+@instrument("chart")
 def create_seasonal_chart(seasonal_df, chart_type, show_budget, show_ma3, show_bands):
     """Skapa säsongsanalys-diagram med säker fillcolor-hantering"""
     if seasonal_df.empty:
@@ -525,6 +498,7 @@ def create_seasonal_chart(seasonal_df, chart_type, show_budget, show_ma3, show_b
     
     st.plotly_chart(fig, use_container_width=True)
 
+@instrument("chart")
 def create_index_chart(seasonal_df):
     """Skapa säsongsindex-diagram (bas=100)"""
     if seasonal_df.empty:
@@ -576,6 +550,7 @@ def create_index_chart(seasonal_df):
     
     st.plotly_chart(fig, use_container_width=True)
 
+@instrument("chart")
 def create_percentage_chart(seasonal_df):
     """Skapa andel av årsintäkt-diagram"""
     if seasonal_df.empty:
@@ -623,6 +598,7 @@ def create_percentage_chart(seasonal_df):
     
     st.plotly_chart(fig, use_container_width=True)
 
+@instrument("chart")
 def create_heatmap_chart(seasonal_df):
     """Skapa värmekarta för säsongsanalys"""
     if seasonal_df.empty:
@@ -671,15 +647,18 @@ def show():
     st.title("📅 Säsongsanalys")
     st.markdown("**Analysera säsongsmönster för intäkter per månad**")
     
-    # Hämta företag från test_data - lättvikt
+    from_snapshot = use_snapshot()
+    
+    # Hämta företag från test_data (eller snapshotens manifest) - lättvikt
     try:
-        firebase_db = get_firebase_db()
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        if from_snapshot:
+            companies_data = load_manifest().get('companies', {})
+        else:
+            # Endast meta-index (företag + år) - en liten läsning
+            companies_data = get_repository().get_index()
         
         companies_list = []
-        if test_data and test_data.val():
-            companies_data = test_data.val().get('companies', {})
+        if companies_data:
             for company_id, company_info in companies_data.items():
                 companies_list.append({
                     'id': company_id,
@@ -717,10 +696,12 @@ def show():
             list(company_options.keys()),
         )
         selected_company_id = company_options[selected_company_name]
+        # Börja ladda företagets konton, värden för alla år och budgetar direkt
+        prefetch_company(selected_company_id, from_snapshot=from_snapshot)
     
     with col2:
         # Årval för säsongsanalys - lättvikt
-        company_info, available_years = get_company_and_years_info(selected_company_id)
+        company_info, available_years = get_company_and_years_info(selected_company_id, from_snapshot)
         
         if not available_years:
             st.warning("Inga år hittade för detta företag")
@@ -738,7 +719,7 @@ def show():
         return
     
     # Hämta kontolista - lättvikt
-    accounts_df = get_accounts_list(selected_company_id)
+    accounts_df = get_accounts_list(selected_company_id, from_snapshot)
     
     if accounts_df.empty:
         st.warning("Inga konton hittade för detta företag")
@@ -883,7 +864,7 @@ def show():
         st.write(f"- Budgetreferens: {show_budget_ref}")
         
         # Debug: visa alla tillgängliga konton för jämförelse
-        all_accounts_df = get_accounts_list(selected_company_id)
+        all_accounts_df = get_accounts_list(selected_company_id, from_snapshot)
         if not all_accounts_df.empty:
             st.write(f"**Tillgängliga konton i databasen:**")
             for category in all_accounts_df['category'].unique():
@@ -892,9 +873,11 @@ def show():
         
         # Hämta säsongsdata - ENDAST för valda konton
         with st.spinner("🔄 Hämtar data för valda konton..."):
-            seasonal_data_df, performance_metrics = get_seasonal_data_optimized(
-                selected_company_id, selected_years, selected_accounts, show_budget_ref
+            seasonal_data_df = get_seasonal_data_optimized(
+                selected_company_id, selected_years, selected_accounts, show_budget_ref, from_snapshot
             )
+        # Mätning från instrumenteringen (0 anrop vid cache-träff)
+        performance_metrics = last_event("get_seasonal_data_optimized")
         
         # Debug: visa vad som hittades
         st.write(f"🔍 **Debug:** Hittade {len(seasonal_data_df)} rader data")
@@ -937,10 +920,11 @@ def show():
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("Firebase-reads", performance_metrics['firebase_reads'])
+            st.metric("Firebase-reads", performance_metrics.get('requests', 0))
         
         with col2:
-            st.metric("Hämtningstid", f"{performance_metrics['fetch_time']:.0f} ms")
+            cache_label = " (cache)" if performance_metrics.get('cache_hit') else ""
+            st.metric("Hämtningstid", f"{performance_metrics.get('wall_ms', 0):.0f} ms{cache_label}")
         
         with col3:
             actual_accounts = seasonal_metrics_df[seasonal_metrics_df['has_actual_data'] == True]['account_name'].nunique()
@@ -24,61 +24,55 @@ from utils_firebase_helpers import (
     get_companies, get_years_for_company, get_financial_data,
     get_account_categories, get_company_by_id
 )
-from models_firebase_database import get_firebase_db
+from models_repository import get_repository
+from utils_instrumentation import instrument
+from utils_parquet_snapshot import use_snapshot, load_manifest, load_snapshot_actuals, snapshot_years
+from models_dimension_index import DimensionIndex
 
+@instrument("loader", cached=True)
 @st.cache_data(ttl=300)
-def get_company_and_years_info(company_id):
+def get_company_and_years_info(company_id, from_snapshot=False):
     """Hämta endast företagsinfo och tillgängliga år - lättvikt med samma datakälla som nya Excel-sidan"""
     try:
-        firebase_db = get_firebase_db()
+        if from_snapshot:
+            # Manifestet har redan år per företag - ingen genomsökning av värden
+            return load_manifest().get('companies', {}).get(company_id), snapshot_years(company_id)
 
-        # Använd samma datakälla som nya Excel-sidan: test_data
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        repo = get_repository()
 
-        if not test_data or not test_data.val():
+        # Företagsinfo och år finns i meta-index - ingen genomsökning av värden
+        company_info = repo.get_index().get(company_id)
+        if not company_info:
             return None, []
 
-        data_dict = test_data.val()
-        companies_data = data_dict.get('companies', {})
-        values_data = data_dict.get('values', {})
-
-        # Hämta företagsinfo
-        company_info = companies_data.get(company_id)
-
-        # Hämta tillgängliga år
-        years_found = set()
-        for value_id, value_data in values_data.items():
-            if value_data.get('company_id') == company_id:
-                years_found.add(value_data.get('year'))
-
-        return company_info, sorted(list(years_found))
+        return company_info, list(company_info.get('years', []))
 
     except Exception as e:
         st.error(f"Fel vid hämtning av företagsinfo: {e}")
         return None, []
 
+@instrument("loader", cached=True)
 @st.cache_data(ttl=300)
-def get_accounts_list_simple(company_id):
+def get_accounts_list_simple(company_id, from_snapshot=False):
     """Hämta kontolista för företaget - förenklad version med samma datakälla som nya Excel-sidan"""
     try:
-        firebase_db = get_firebase_db()
-
-        # Använd samma datakälla som nya Excel-sidan: test_data
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
-
-        if not test_data or not test_data.val():
-            return pd.DataFrame()
-
-        data_dict = test_data.val()
+        if from_snapshot:
+            data_dict = load_manifest()
+        else:
+            # Samma datakälla som nya Excel-sidan, via repository
+            repo = get_repository()
+            # Företagets konton plus konton som dess värden pekar på (även under annat företag)
+            data_dict = {
+                'accounts': repo.get_value_accounts(company_id),
+                'categories': repo.get_categories()
+            }
         accounts_data = data_dict.get('accounts', {})
         categories_data = data_dict.get('categories', {})
 
-        # Bygg kontolista
+        # Bygg kontolista (manifestet innehåller alla företags konton)
         accounts_list = []
         for account_id, account_info in accounts_data.items():
-            if account_info.get('company_id') == company_id:
+            if not from_snapshot or account_info.get('company_id') == company_id:
                 category_id = account_info.get('category_id')
                 category_info = categories_data.get(category_id, {})
 
@@ -100,34 +94,53 @@ def get_accounts_list_simple(company_id):
         st.error(f"Fel vid hämtning av kontolista: {e}")
         return pd.DataFrame()
 
+@instrument("loader", cached=True)
 @st.cache_data(ttl=300)
-def get_seasonal_data_simple(company_id, years, selected_accounts):
+def get_seasonal_data_simple(company_id, years, selected_accounts, from_snapshot=False):
     """Hämta data för säsongsanalys - förenklad version med både faktiska och budgetdata från samma källa som nya Excel-sidan"""
     try:
-        firebase_db = get_firebase_db()
+        repo = get_repository()
 
-        # Använd samma datakälla som nya Excel-sidan: test_data
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        if from_snapshot:
+            # Dimensioner från manifest, värden läses kolumnärt nedan
+            data_dict = load_manifest()
+        else:
+            # Samma datakälla som nya Excel-sidan, via repository
+            values = repo.get_values(company_id, list(years))
+            data_dict = {
+                'companies': repo.get_companies(),
+                'accounts': repo.get_value_accounts(company_id, values),
+                'categories': repo.get_categories(),
+                'values': values
+            }
 
-        if not test_data or not test_data.val():
-            return pd.DataFrame()
+            if not data_dict['companies']:
+                return pd.DataFrame()
 
-        data_dict = test_data.val()
         values_data = data_dict.get('values', {})
         accounts_data = data_dict.get('accounts', {})
         categories_data = data_dict.get('categories', {})
         companies_data = data_dict.get('companies', {})
+        index = DimensionIndex(companies_data, accounts_data, categories_data)
 
         # Bygg DataFrame för både faktiska värden och budgetdata
         data = []
 
         # Skapa account_id lookup för valda konton
-        selected_account_ids = set()
-        for account_id, account_info in accounts_data.items():
-            if (account_info.get('company_id') == company_id and
-                account_info.get('name') in selected_accounts):
-                selected_account_ids.add(account_id)
+        # Från repository är alla konton relevanta för företaget (även de värdena pekar på)
+        selected_names = set(selected_accounts)
+        company_account_ids = index.accounts_for_company(company_id) if from_snapshot else list(accounts_data)
+        selected_account_ids = {account_id for account_id in company_account_ids
+                                if index.accounts[account_id].get('name') in selected_names}
+        selected_ids_by_name = {}
+        for account_id in company_account_ids:
+            if account_id in selected_account_ids:
+                selected_ids_by_name.setdefault(index.account_name(account_id), account_id)
+
+        # Snapshot: en lokal kolumnär läsning för alla valda år och konton
+        snapshot_df = pd.DataFrame()
+        if from_snapshot:
+            snapshot_df = load_snapshot_actuals(company_id, years, list(selected_account_ids))
 
         # Lägg till faktiska värden för alla valda år - ENDAST valda konton
         for value_id, value_data in values_data.items():
@@ -137,14 +150,11 @@ def get_seasonal_data_simple(company_id, years, selected_accounts):
                 value_data.get('account_id') in selected_account_ids):
 
                 account_id = value_data.get('account_id')
-                account_info = accounts_data.get(account_id, {})
-                category_id = account_info.get('category_id')
-                category_info = categories_data.get(category_id, {})
 
                 data.append({
                     'account_id': account_id,
-                    'account_name': account_info.get('name', 'Okänt konto'),
-                    'category': category_info.get('name', 'Okänd kategori'),
+                    'account_name': index.account_name(account_id),
+                    'category': index.account_category(account_id),
                     'month': value_data.get('month'),
                     'amount': value_data.get('amount', 0),
                     'year': value_data.get('year'),
@@ -152,11 +162,7 @@ def get_seasonal_data_simple(company_id, years, selected_accounts):
                 })
 
         # Lägg till budgetvärden för alla valda år - ENDAST valda konton
-        company_name = None
-        for comp_id, comp_info in companies_data.items():
-            if comp_id == company_id:
-                company_name = comp_info.get('name')
-                break
+        company_name = index.company_name(company_id)
 
         if company_name:
             month_mapping = {
@@ -164,31 +170,21 @@ def get_seasonal_data_simple(company_id, years, selected_accounts):
                 'Aug':8,'Sep':9,'Okt':10,'Oct':10,'Nov':11,'Dec':12
             }
 
-            # Hämta budget endast för valda konton
+            # Hämta alla budgetar per år i EN läsning
+            budgets_per_year = {year: repo.get_simple_budgets(company_name, year) for year in years}
+
+            # Budget endast för valda konton
             for account_name in selected_accounts:
                 for year in years:
-                    budget_path = f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}/monthly_values"
-                    budget_ref = firebase_db.get_ref(budget_path)
-                    budget_data = budget_ref.get(firebase_db._get_token())
-
-                    monthly_values = budget_data.val() if (budget_data and budget_data.val()) else {}
+                    monthly_values = budgets_per_year[year].get(account_name, {})
 
                     if not monthly_values:
                         continue
 
-                    # Hitta account_id för detta kontonamn
-                    account_id = None
-                    for aid, account_info in accounts_data.items():
-                        if (account_info.get('company_id') == company_id and
-                            account_info.get('name') == account_name):
-                            account_id = aid
-                            break
-
+                    account_id = index.account_id(company_id, account_name) or selected_ids_by_name.get(account_name)
                     if not account_id:
                         continue
-
-                    category_id = accounts_data.get(account_id, {}).get('category_id')
-                    category_info = categories_data.get(category_id, {})
+                    category_name = index.account_category(account_id)
 
                     for month_name, amount in monthly_values.items():
                         m = month_mapping.get(month_name)
@@ -202,14 +198,14 @@ def get_seasonal_data_simple(company_id, years, selected_accounts):
                         data.append({
                             'account_id': account_id,
                             'account_name': account_name,
-                            'category': category_info.get('name', 'Okänd kategori'),
+                            'category': category_name,
                             'month': m,
                             'amount': amt,
                             'year': year,
                             'type': 'Budget'
                         })
 
-        df = pd.DataFrame(data)
+        df = pd.concat([snapshot_df, pd.DataFrame(data)], ignore_index=True) if not snapshot_df.empty else pd.DataFrame(data)
 
         if not df.empty:
             # Dedupe budget-rader på kontonamn+månad+år
@@ -323,6 +319,7 @@ def calculate_seasonal_metrics_simple(df, selected_accounts):
 
     return pd.DataFrame(results)
 
+@instrument("chart")
 def create_simple_chart(seasonal_df, chart_type):
     """Skapa förenklat säsongsanalys-diagram med både faktiska och budgetdata"""
     if seasonal_df.empty:
@@ -466,15 +463,18 @@ def show():
     st.title("📅 Säsongsanalys (Förenklad)")
     st.markdown("**Analysera säsongsmönster för intäkter per månad**")
 
-    # Hämta företag från samma datakälla som nya Excel-sidan
+    from_snapshot = use_snapshot()
+
+    # Hämta företag från samma datakälla som nya Excel-sidan (eller snapshotens manifest)
     try:
-        firebase_db = get_firebase_db()
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        if from_snapshot:
+            companies_data = load_manifest().get('companies', {})
+        else:
+            # Endast meta-index (företag + år) - en liten läsning
+            companies_data = get_repository().get_index()
 
         companies_list = []
-        if test_data and test_data.val():
-            companies_data = test_data.val().get('companies', {})
+        if companies_data:
             for company_id, company_info in companies_data.items():
                 companies_list.append({
                     'id': company_id,
@@ -515,7 +515,7 @@ def show():
 
     with col2:
         # Årval för säsongsanalys - lättvikt
-        company_info, available_years = get_company_and_years_info(selected_company_id)
+        company_info, available_years = get_company_and_years_info(selected_company_id, from_snapshot)
 
         if not available_years:
             st.warning("Inga år hittade för detta företag")
@@ -533,7 +533,7 @@ def show():
         return
 
     # Hämta kontolista - lättvikt
-    accounts_df = get_accounts_list_simple(selected_company_id)
+    accounts_df = get_accounts_list_simple(selected_company_id, from_snapshot)
 
     if accounts_df.empty:
         st.warning("Inga konton hittade för detta företag")
@@ -615,7 +615,7 @@ def show():
 
     # Hämta och visa data direkt
     with st.spinner("🔄 Hämtar säsongsdata..."):
-        seasonal_data_df = get_seasonal_data_simple(selected_company_id, selected_years, selected_accounts)
+        seasonal_data_df = get_seasonal_data_simple(selected_company_id, selected_years, selected_accounts, from_snapshot)
 
     # Debug: visa vad som hittades
     st.write(f"🔍 **Debug:** Hittade {len(seasonal_data_df)} rader data")
@@ -20,26 +20,43 @@ from utils_firebase_helpers import (
     get_companies, get_years_for_company, get_financial_data, 
     get_account_categories, get_company_by_id
 )
-from models_firebase_database import get_firebase_db
+from models_repository import get_repository
+from utils_instrumentation import instrument
+from utils_result_cache import bounded_cache
+from utils_parquet_snapshot import use_snapshot, load_manifest, load_snapshot_actuals, snapshot_years
+from models_dimension_index import DimensionIndex
 
-@st.cache_data(ttl=300)
-def get_visualization_data(company_id, year):
+@instrument("loader", cached=True)
+@bounded_cache(ttl=300, persist=True)
+def get_visualization_data(company_id, year, from_snapshot=False):
     """Hämta data för visualisering - enkel och snabb version"""
     try:
-        firebase_db = get_firebase_db()
+        repo = get_repository()
         
-        # Hämta ALLT från test_data i EN enda call
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
-        
-        if not test_data or not test_data.val():
-            return pd.DataFrame()
+        if from_snapshot:
+            # Faktiska värden från lokal Parquet-snapshot, dimensioner från manifest
+            data_dict = load_manifest()
+            values_data = {}
+            snapshot_df = load_snapshot_actuals(company_id, [year]).drop(columns=['year'])
+        else:
+            # Dimensioner och värden för valt företag/år via repository
+            data_dict = {
+                'companies': repo.get_companies(),
+                'categories': repo.get_categories()
+            }
+            
+            if not data_dict['companies']:
+                return pd.DataFrame()
+            
+            values_data = repo.get_values(company_id, [year])
+            # Kontonamn för alla konton värdena pekar på (även konton sparade under annat företag)
+            data_dict['accounts'] = repo.get_value_accounts(company_id, values_data)
+            snapshot_df = pd.DataFrame()
         
-        data_dict = test_data.val()
-        values_data = data_dict.get('values', {})
         accounts_data = data_dict.get('accounts', {})
         categories_data = data_dict.get('categories', {})
         companies_data = data_dict.get('companies', {})
+        index = DimensionIndex(companies_data, accounts_data, categories_data)
         
         # Bygg DataFrame för faktiska värden
         data = []
@@ -51,26 +68,18 @@ def get_visualization_data(company_id, year):
                 value_data.get('type') == 'actual'):
                 
                 account_id = value_data.get('account_id')
-                account_info = accounts_data.get(account_id, {})
-                category_id = account_info.get('category_id')
-                category_info = categories_data.get(category_id, {})
                 
                 data.append({
                     'account_id': account_id,
-                    'account_name': account_info.get('name', 'Okänt konto'),
-                    'category': category_info.get('name', 'Okänd kategori'),
+                    'account_name': index.account_name(account_id),
+                    'category': index.account_category(account_id),
                     'month': value_data.get('month'),
                     'amount': value_data.get('amount', 0),
                     'type': 'Faktiskt'
                 })
         
         # --- Budgetvärden: hämta EN gång per kontonamn ---
-        companies_data = data_dict.get('companies', {})
-        company_name = None
-        for comp_id, comp_info in companies_data.items():
-            if comp_id == company_id:
-                company_name = comp_info.get('name')
-                break
+        company_name = index.company_name(company_id)
         
         if not company_name:
             print(f"DEBUG: company_name saknas för {company_id}")
@@ -80,26 +89,22 @@ def get_visualization_data(company_id, year):
                 'Aug':8,'Sep':9,'Okt':10,'Oct':10,'Nov':11,'Dec':12
             }
             
+            # Alla budgetar för företaget/året i EN läsning
+            company_budgets = repo.get_simple_budgets(company_name, year)
+            
             processed_names = set()   # ✅ lägg inte samma kontonamn två gånger
-            for account_id, account_info in accounts_data.items():
-                if account_info.get('company_id') != company_id:
-                    continue
-                
-                account_name = account_info.get('name')
+            for account_id in index.accounts_for_company(company_id):
+                account_name = index.accounts[account_id].get('name')
                 if account_name in processed_names:
                     continue
                 processed_names.add(account_name)
                 
-                budget_path = f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}/monthly_values"
-                budget_ref = firebase_db.get_ref(budget_path)
-                budget_data = budget_ref.get(firebase_db._get_token())
-                monthly_values = budget_data.val() if (budget_data and budget_data.val()) else {}
+                monthly_values = company_budgets.get(account_name, {})
                 
                 if not monthly_values:
                     continue
                 
-                category_id = account_info.get('category_id')
-                category_info = categories_data.get(category_id, {})
+                category_name = index.account_category(account_id)
                 
                 for month_name, amount in monthly_values.items():
                     m = month_mapping.get(month_name)
@@ -113,14 +118,14 @@ def get_visualization_data(company_id, year):
                     data.append({
                         'account_id': account_id,            # första id:et för namnet
                         'account_name': account_name,
-                        'category': category_info.get('name', 'Okänd kategori'),
+                        'category': category_name,
                         'month': m,
                         'amount': amt,
                         'type': 'Budget'
                     })
             print(f"DEBUG: lade till {len([r for r in data if r['type']=='Budget'])} budgetrader.")
         
-        df = pd.DataFrame(data)
+        df = pd.concat([snapshot_df, pd.DataFrame(data)], ignore_index=True) if not snapshot_df.empty else pd.DataFrame(data)
         
         if not df.empty:
             # dedupe bara budget-rader på kontonamn+månad
@@ -145,6 +150,7 @@ def get_visualization_data(company_id, year):
         st.error(f"Fel vid hämtning av data: {e}")
         return pd.DataFrame()
 
+@instrument("chart")
 def create_simple_chart(df, selected_accounts):
     """Skapa enkel linjediagram"""
     if df.empty or not selected_accounts:
@@ -233,15 +239,18 @@ def show():
     st.title("📈 Datavisualisering v2")
     st.markdown("**Ny, snabb version som faktiskt fungerar!**")
     
-    # Hämta företag från test_data
+    from_snapshot = use_snapshot()
+    
+    # Hämta företag från test_data (eller snapshotens manifest)
     try:
-        firebase_db = get_firebase_db()
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        if from_snapshot:
+            companies_data = load_manifest().get('companies', {})
+        else:
+            # Endast meta-index (företag + år) - en liten läsning
+            companies_data = get_repository().get_index()
         
         companies_list = []
-        if test_data and test_data.val():
-            companies_data = test_data.val().get('companies', {})
+        if companies_data:
             for company_id, company_info in companies_data.items():
                 companies_list.append({
                     'id': company_id,
@@ -283,18 +292,11 @@ def show():
     with col2:
         # Årval
         try:
-            firebase_db = get_firebase_db()
-            test_data_ref = firebase_db.get_ref("test_data")
-            test_data = test_data_ref.get(firebase_db._get_token())
-            
             available_years = []
-            if test_data and test_data.val():
-                values_data = test_data.val().get('values', {})
-                years_found = set()
-                for value_id, value_data in values_data.items():
-                    if value_data.get('company_id') == selected_company_id:
-                        years_found.add(value_data.get('year'))
-                available_years = sorted(list(years_found))
+            if from_snapshot:
+                available_years = snapshot_years(selected_company_id)
+            else:
+                available_years = list(companies_data.get(selected_company_id, {}).get('years', []))
         except Exception as e:
             st.error(f"Fel vid hämtning av år: {e}")
             available_years = []
@@ -313,7 +315,7 @@ def show():
     
     # Hämta data
     with st.spinner("🔄 Hämtar data..."):
-        all_data_df = get_visualization_data(selected_company_id, selected_year)
+        all_data_df = get_visualization_data(selected_company_id, selected_year, from_snapshot)
     
     if all_data_df.empty:
         st.warning("Ingen data hittad för valt företag och år")
@@ -1,23 +1,30 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-from utils_firebase_helpers import get_firebase_db
+from models_repository import get_repository
+from utils_instrumentation import instrument
+from utils_result_cache import bounded_cache
+from utils_disk_cache import TAG_TEST_DATA
+from utils_prefetch import prefetch_company
+from utils_grid_diff import diff_grids, MONTH_LABELS
+from utils_write_behind import get_write_queue, register_handler, PENDING, SYNCING, SYNCED, FAILED
 
+# Cellredigeringar i griden sparas via skrivkön (utils_write_behind)
+BUDGET_CELL_KIND = "simple_budget_cell"
+# Sekunder mellan uppdateringar av synkstatus medan celler väntar
+SYNC_REFRESH = 1.0
+CELL_STATUS_LABELS = {PENDING: "⏳ Väntar", SYNCING: "🔄 Skickas", SYNCED: "✅ Synkad", FAILED: "❌ Misslyckades"}
+
+@instrument("loader")
 def load_companies_and_years():
     """Hämta alla företag och år från Excel-data - OPTIMERAD VERSION"""
     try:
-        firebase_db = get_firebase_db()
-        
-        # Hämta ALLT på en gång från test_data root
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        repo = get_repository()
         
-        if not test_data or not test_data.val():
-            return [], 2025
-        
-        data_dict = test_data.val()
-        companies_data = data_dict.get('companies', {})
-        meta_data = data_dict.get('meta', {})
+        # Metadata inklusive index (företag och år) - en liten läsning
+        meta_data = repo.get_meta()
+        companies_data = (meta_data.get('index') or {}).get('companies') if meta_data else None
+        if companies_data is None:
+            companies_data = repo.get_index()
         
         year = meta_data.get('year', 2025) if meta_data else 2025
         
@@ -37,134 +44,122 @@ def load_companies_and_years():
         st.error(f"❌ Fel vid laddning av företag: {e}")
         return [], 2025
 
+@bounded_cache(ttl=300, persist=True, depends=(TAG_TEST_DATA,))
+def get_company_accounts(company_id: str):
+    """Företagets konton med kategorinamn (cachas - används även av förhämtningen)"""
+    repo = get_repository()
+    
+    accounts_data = repo.get_accounts(company_id)
+    categories_data = repo.get_categories()
+    
+    accounts = []
+    if accounts_data:
+        for account_id, account_info in accounts_data.items():
+            # Hämta kategorinamn baserat på category_id
+            category_id = account_info.get('category_id')
+            category_name = "Okänd"
+            if category_id and categories_data:
+                category_data = categories_data.get(category_id)
+                if category_data:
+                    category_name = category_data.get('name', 'Okänd')
+            
+            accounts.append({
+                'id': account_id,
+                'name': account_info['name'],
+                'category': category_name,
+                'category_id': category_id
+            })
+    
+    return accounts
+
+@instrument("loader", cached=True)
 def load_accounts_for_company(company_id: str):
     """Hämta alla konton för ett specifikt företag med kategoriinformation - OPTIMERAD VERSION"""
     try:
-        firebase_db = get_firebase_db()
-        
-        # Hämta ALLT på en gång från test_data root
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
-        
-        if not test_data or not test_data.val():
-            return []
-        
-        data_dict = test_data.val()
-        accounts_data = data_dict.get('accounts', {})
-        categories_data = data_dict.get('categories', {})
-        
-        accounts = []
-        if accounts_data:
-            for account_id, account_info in accounts_data.items():
-                if account_info.get('company_id') == company_id:
-                    # Hämta kategorinamn baserat på category_id från test_data
-                    category_id = account_info.get('category_id')
-                    category_name = "Okänd"
-                    if category_id and categories_data:
-                        category_data = categories_data.get(category_id)
-                        if category_data:
-                            category_name = category_data.get('name', 'Okänd')
-                    
-                    accounts.append({
-                        'id': account_id,
-                        'name': account_info['name'],
-                        'category': category_name,
-                        'category_id': category_id
-                    })
-        
-        return accounts
+        return get_company_accounts(company_id)
         
     except Exception as e:
         st.error(f"❌ Fel vid laddning av konton: {e}")
         return []
 
-def save_simple_budget(company_name: str, year: int, account_name: str, monthly_values: dict):
-    """Spara budget med ENKLA namn i Firebase"""
-    try:
-        firebase_db = get_firebase_db()
-        
-        # ENKEL path med riktiga namn
-        budget_path = f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}"
-        budget_ref = firebase_db.get_ref(budget_path)
-        
-        # Spara med månadsnamn istället för siffror
-        budget_data = {
-            'company': company_name,
-            'year': year,
-            'account': account_name,
-            'created_at': datetime.now().isoformat(),
-            'monthly_values': {
-                'Jan': monthly_values.get('Jan', 0),
-                'Feb': monthly_values.get('Feb', 0),
-                'Mar': monthly_values.get('Mar', 0),
-                'Apr': monthly_values.get('Apr', 0),
-                'Maj': monthly_values.get('Maj', 0),
-                'Jun': monthly_values.get('Jun', 0),
-                'Jul': monthly_values.get('Jul', 0),
-                'Aug': monthly_values.get('Aug', 0),
-                'Sep': monthly_values.get('Sep', 0),
-                'Okt': monthly_values.get('Okt', 0),
-                'Nov': monthly_values.get('Nov', 0),
-                'Dec': monthly_values.get('Dec', 0)
-            }
-        }
-        
-        budget_ref.set(budget_data, firebase_db._get_token())
-        return True
-        
-    except Exception as e:
-        st.error(f"❌ Fel vid sparande: {e}")
-        return False
+def flush_budget_cells(payloads: list):
+    """Skrivköns handler: cellerna skrivs per företag och år i EN skrivning (kastar vid fel -> nytt försök)"""
+    grouped = {}
+    for payload in payloads:
+        cells = grouped.setdefault((payload['company'], payload['year']), {})
+        cells.setdefault(payload['account'], {})[payload['month']] = payload['amount']
+    repo = get_repository()
+    for (company_name, year), cells in grouped.items():
+        repo.save_simple_budget_cells(company_name, year, cells)
+
+register_handler(BUDGET_CELL_KIND, flush_budget_cells)
+
+def queue_budget_changes(queue, company_name: str, year: int, changes: list) -> int:
+    """Lägg ändrade celler i skrivkön (samma värde igen = ingen ny post). Returnerar antal nya/ersatta."""
+    queued = 0
+    for change in changes:
+        month = MONTH_LABELS[change.month - 1]
+        payload = {'company': company_name, 'year': int(year), 'account': change.account_id,
+                   'month': month, 'amount': change.new}
+        if queue.enqueue(BUDGET_CELL_KIND, f"{company_name}|{year}|{change.account_id}|{month}", payload):
+            queued += 1
+    return queued
+
+def load_cell_states(queue, company_name: str, year: int) -> dict:
+    """Skrivköns poster för företaget och året {(konto, månad): {status, payload, ...}}"""
+    return {
+        (state['payload']['account'], state['payload']['month']): state
+        for state in queue.statuses(BUDGET_CELL_KIND).values()
+        if state['payload']['company'] == company_name and state['payload']['year'] == int(year)
+    }
 
-def load_simple_budget(company_name: str, year: int, account_name: str):
-    """Ladda budget med ENKLA namn"""
+def overlay_unsynced(budgets: dict, cell_states: dict) -> dict:
+    """Sparad budget med osynkade celler från skrivkön inlagda (griden visar senaste värdet)"""
+    merged = {account: dict(months) for account, months in budgets.items()}
+    for (account, month), state in cell_states.items():
+        if state['status'] != SYNCED:
+            merged.setdefault(account, {})[month] = state['payload']['amount']
+    return merged
+
+@instrument("loader", cached=True)
+def load_company_budgets(company_name: str, year: int):
+    """Alla kontons budgetar för företaget och året i EN läsning {konto: {'Jan': ..., ...}}"""
     try:
-        firebase_db = get_firebase_db()
-        
-        # ENKEL path med riktiga namn
-        budget_path = f"SIMPLE_BUDGETS/{company_name}/{year}/{account_name}"
-        budget_ref = firebase_db.get_ref(budget_path)
-        data = budget_ref.get(firebase_db._get_token())
-        
-        if data and data.val():
-            return data.val().get('monthly_values', {})
-        return {}
+        return get_repository().get_simple_budgets(company_name, year)
         
     except Exception as e:
         st.error(f"❌ Fel vid laddning: {e}")
         return {}
 
-def show_company_budget_summary(company_name: str, year: int, accounts: list):
-    """Visa sammanfattning av alla budgetar för företaget, grupperat efter kategori"""
+def build_budget_grid(accounts: list, budgets: dict) -> pd.DataFrame:
+    """En rad per konto (Kategori, Konto, Jan-Dec) ur årets budgetar"""
+    rows = []
+    seen = set()
+    for account in accounts:
+        name = account['name']
+        if name in seen:  # budgetar lagras per kontonamn
+            continue
+        seen.add(name)
+        budget = budgets.get(name) or {}
+        rows.append({
+            'Kategori': account.get('category', 'Okänd'),
+            'Konto': name,
+            **{month: float(budget.get(month, 0) or 0) for month in MONTH_LABELS}
+        })
+    return pd.DataFrame(rows, columns=['Kategori', 'Konto'] + MONTH_LABELS)
+
+def show_company_budget_summary(grid: pd.DataFrame):
+    """Visa sammanfattning av alla budgetar för företaget, grupperat efter kategori (ur griden i minnet)"""
     try:
-        # Samla alla budgetar för företaget
-        category_totals = {}
-        account_budgets = {}
-        
-        for account in accounts:
-            account_name = account['name']
-            category = account.get('category', 'Okänd')
-            
-            # Ladda budget för detta konto
-            budget = load_simple_budget(company_name, year, account_name)
-            
-            if budget and any(v != 0 for v in budget.values()):
-                total = sum(budget.values())
-                account_budgets[account_name] = {
-                    'total': total,
-                    'category': category,
-                    'budget': budget
-                }
-                
-                # Lägg till i kategoritotal
-                if category not in category_totals:
-                    category_totals[category] = 0
-                category_totals[category] += total
+        totals = grid[MONTH_LABELS].sum(axis=1)
+        account_budgets = grid.assign(total=totals)[grid[MONTH_LABELS].ne(0).any(axis=1)]
         
-        if not account_budgets:
+        if account_budgets.empty:
             st.info("Inga budgetar skapade ännu för detta företag.")
             return
         
+        category_totals = account_budgets.groupby('Kategori')['total'].sum()
+        
         # Visa kategoritotaler
         st.markdown("**📋 Totaler per kategori:**")
         
@@ -199,16 +194,50 @@ def show_company_budget_summary(company_name: str, year: int, accounts: list):
         for category, total in sorted_categories:
             st.markdown(f"**{category}** ({total:,.0f} kr):")
             
-            category_accounts = [(name, data) for name, data in account_budgets.items() 
-                               if data['category'] == category]
-            category_accounts.sort(key=lambda x: x[1]['total'], reverse=True)
-            
-            for account_name, data in category_accounts:
-                st.markdown(f"  • {account_name}: {data['total']:,.0f} kr")
+            category_accounts = account_budgets[account_budgets['Kategori'] == category].sort_values('total', ascending=False)
+            for account_name, account_total in zip(category_accounts['Konto'], category_accounts['total']):
+                st.markdown(f"  • {account_name}: {account_total:,.0f} kr")
         
     except Exception as e:
         st.error(f"❌ Fel vid laddning av budgetsammanfattning: {e}")
 
+def show_sync_status(queue, company_name: str, year: int, polling: bool = False):
+    """
+    Synkstatus per cell för företaget och året (läser bara skrivkön, körs som fragment).
+    polling=True: fragmentet körs med run_every och gör en full omkörning när kön är tom.
+    """
+    cell_states = load_cell_states(queue, company_name, year)
+    counts = {status: 0 for status in CELL_STATUS_LABELS}
+    for state in cell_states.values():
+        counts[state['status']] += 1
+    
+    waiting = counts[PENDING] + counts[SYNCING]
+    if polling and not waiting:
+        # Allt skickat - full omkörning stoppar run_every och visar den sparade budgeten
+        st.rerun()
+    if not cell_states:
+        return
+    
+    if waiting:
+        st.info(f"⏳ {waiting} celler sparas i bakgrunden...")
+    elif counts[FAILED]:
+        st.error(f"❌ {counts[FAILED]} celler kunde inte sparas")
+    else:
+        st.success(f"✅ Alla ändringar sparade ({counts[SYNCED]} celler)")
+    
+    if counts[FAILED] and st.button("🔁 Försök igen", key=f"simple_budget_retry_{company_name}_{year}"):
+        queue.retry_failed()
+    
+    with st.expander("🔄 Synkstatus per cell", expanded=bool(counts[FAILED])):
+        st.dataframe(pd.DataFrame([{
+            'Konto': account,
+            'Månad': month,
+            'Belopp': state['payload']['amount'],
+            'Status': CELL_STATUS_LABELS[state['status']],
+            'Fel': state['error'] or ''
+        } for (account, month), state in sorted(cell_states.items(), key=lambda item: (item[0][0], MONTH_LABELS.index(item[0][1])))]),
+            hide_index=True, use_container_width=True)
+
 def show_simple_budget_page():
     """Visa ENKEL budget-sida"""
     st.title("📊 Budgethantering")
@@ -238,9 +267,12 @@ def show_simple_budget_page():
         company_id = selected_company['id']
         company_name = selected_company['name']
     
+    # Vanliga budgetår - förhämta konton, värden och budgetar för valt företag i bakgrunden
+    available_years = [2024, 2025, 2026, 2027, 2028]
+    prefetch_company(company_id, company_name, available_years)
+    
     with col2:
         # År-väljare
-        available_years = [2024, 2025, 2026, 2027, 2028]  # Vanliga budgetår
         selected_year = st.selectbox(
             "Välj år:",
             available_years,
@@ -249,8 +281,8 @@ def show_simple_budget_page():
         )
     
     
-    # STEG 2: Välj kategori och konto
-    st.markdown("### 2. Välj konto")
+    # STEG 2: Välj kategori
+    st.markdown("### 2. Välj kategori")
     
     accounts = load_accounts_for_company(company_id)
     if not accounts:
@@ -300,101 +332,50 @@ def show_simple_budget_page():
         st.warning(f"Inga konton hittade för {category_filter}")
         return
     
-    with col2:
-        # Skapa dropdown-alternativ med kategoriinformation
-        account_display_options = {}
-        for account in filtered_accounts:
-            category = account.get('category', 'Okänd')
-            name = account['name']
-            
-            # Lägg till emoji baserat på kategori
-            if 'intäkt' in category.lower():
-                emoji = "💰"
-            elif 'kostnad' in category.lower():
-                emoji = "💸"
-            else:
-                emoji = "📊"
-            
-            # Om vi visar alla kategorier, visa kategorin i dropdown
-            if category_filter == "Alla":
-                display_name = f"{emoji} {name} ({category})"
-            else:
-                display_name = f"{emoji} {name}"
-            
-            account_display_options[display_name] = account
-        
-        selected_account_display = st.selectbox(
-            "Konto:",
-            list(account_display_options.keys()),
-            key="simple_account_select"
-        )
-        
-        selected_account = account_display_options[selected_account_display]
-        selected_account_name = selected_account['name']
-    
-    # Visa valt konto med kategoriinformation
-    category = selected_account.get('category', 'Okänd')
-    if 'intäkt' in category.lower():
-        st.success(f"📈 **Valt konto:** {selected_account_name} (**{category}**)")
-    elif 'kostnad' in category.lower():
-        st.error(f"📉 **Valt konto:** {selected_account_name} (**{category}**)")
-    else:
-        st.info(f"📊 **Valt konto:** {selected_account_name} (**{category}**)")
-    
-    # STEG 3: Redigera månadsbudget
+    # STEG 3: Redigera månadsbudget för alla konton i en tabell
     st.markdown("### 3. Ange månadsbudget")
+    st.caption("Ändrade celler sparas automatiskt i bakgrunden - ⏳ väntar, ✅ synkad.")
     
-    # Ladda befintlig budget om den finns
-    existing_budget = load_simple_budget(company_name, selected_year, selected_account_name)
-    
-    # 12 input-fält för månader i korrekt ordning (Jan-Dec) - KOMPAKT
-    months = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun', 'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
-    monthly_values = {}
-    
-    # Kompakt layout: Alla månader i 2 rader med 6 månader per rad
-    cols = st.columns(6)
-    for i in range(12):
-        month = months[i]
-        col_index = i % 6
-        with cols[col_index]:
-            current_value = existing_budget.get(month, 0)
-            monthly_values[month] = st.number_input(
-                f"{month}",
-                value=float(current_value),
-                step=1000.0,
-                key=f"simple_budget_{month}",
-                format="%.0f",
-                label_visibility="visible"
-            )
-    
-    # SPARA-knapp - kompakt
-    total = sum(monthly_values.values())
-    col1, col2 = st.columns([2, 1])
+    # Skrivkön läses före budgeten - en cell som synkas under tiden finns då i någon av dem
+    queue = get_write_queue()
+    cell_states = load_cell_states(queue, company_name, selected_year)
     
-    with col1:
-        st.metric("Total årsbudget", f"{total:,.0f} kr")
+    # Alla kontons budgetar för året i EN läsning, osynkade ändringar ovanpå
+    budgets = overlay_unsynced(load_company_budgets(company_name, selected_year), cell_states)
+    full_grid = build_budget_grid(accounts, budgets)
+    original_grid = build_budget_grid(filtered_accounts, budgets)
     
-    with col2:
-        if st.button("Spara budget", type="primary", use_container_width=True):
-            if save_simple_budget(company_name, selected_year, selected_account_name, monthly_values):
-                st.success("✓ Sparat")
-            else:
-                st.error("Fel vid sparande")
-    
-    # Visa befintliga budgetar - kompakt
-    if existing_budget and any(v != 0 for v in existing_budget.values()):
-        with st.expander("📋 Visa sparad budget", expanded=False):
-            # Visa i tabell-format med rätt månadsordning
-            ordered_budget = {}
-            for month in months:
-                ordered_budget[month] = existing_budget.get(month, 0)
-            
-            budget_df = pd.DataFrame([ordered_budget])
-            st.dataframe(budget_df, use_container_width=True)
+    edited_grid = st.data_editor(
+        original_grid,
+        hide_index=True,
+        use_container_width=True,
+        disabled=['Kategori', 'Konto'],
+        column_config={
+            'Kategori': st.column_config.TextColumn(label='Kategori', width='small'),
+            'Konto': st.column_config.TextColumn(label='Konto', width='medium'),
+            **{month: st.column_config.NumberColumn(label=month, step=1000.0, format="%.0f")
+               for month in MONTH_LABELS}
+        },
+        key=f"simple_budget_grid_{company_id}_{selected_year}_{category_filter}"
+    )
+    
+    # Ändrade celler går direkt till skrivkön - ingen väntan på nätverket
+    changes = diff_grids(original_grid, edited_grid, key='Konto')
+    queued = queue_budget_changes(queue, company_name, selected_year, changes)
+    
+    total = edited_grid[MONTH_LABELS].sum().sum()
+    st.metric("Total årsbudget (visade konton)", f"{total:,.0f} kr")
+    
+    # Statusen uppdateras av sig själv så länge något väntar på att skickas
+    waiting = queued or any(state['status'] in (PENDING, SYNCING) for state in cell_states.values())
+    st.fragment(run_every=SYNC_REFRESH if waiting else None)(show_sync_status)(
+        queue, company_name, selected_year, polling=bool(waiting))
     
-    # Visa sammanfattning av alla budgetar för detta företag
+    # Sammanfattning ur griden i minnet (osparade ändringar inräknade)
+    summary_grid = full_grid.set_index('Konto')
+    summary_grid.update(edited_grid.set_index('Konto')[MONTH_LABELS])
     with st.expander("📊 Budgetöversikt för företaget", expanded=False):
-        show_company_budget_summary(company_name, selected_year, accounts)
+        show_company_budget_summary(summary_grid.reset_index())
 
 if __name__ == "__main__":
     show_simple_budget_page()
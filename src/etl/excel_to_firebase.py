@@ -14,13 +14,17 @@ from datetime import datetime
 current_dir = os.path.dirname(os.path.abspath(__file__))
 src_dir = os.path.dirname(current_dir)
 sys.path.insert(0, src_dir)
+sys.path.insert(0, os.path.dirname(src_dir))
 
 from models.firebase_database import FirebaseDB
+from models_dimension_index import DimensionIndex, index_from_firebase
 
 class ExcelToFirebaseETL:
     def __init__(self, excel_path: str):
         self.excel_path = Path(excel_path)
         self.firebase_db = FirebaseDB()
+        # Företag, kategorier och konton hämtas en gång per import
+        self._index: Optional[DimensionIndex] = None
         
         # Månadsmappning
         self.months = {
@@ -182,6 +186,12 @@ class ExcelToFirebaseETL:
         # Default till kostnader
         return "Kostnader"
 
+    def get_index(self) -> DimensionIndex:
+        """Dimensionsindex för importen (byggs vid första anropet)"""
+        if self._index is None:
+            self._index = index_from_firebase(self.firebase_db)
+        return self._index
+    
     def process_sheet(self, sheet_name: str, df: pd.DataFrame) -> bool:
         """Processera ett enskilt sheet"""
         print(f"\n📋 Processar sheet: {sheet_name}")
@@ -210,16 +220,12 @@ class ExcelToFirebaseETL:
             return False
         
         # Skapa eller hämta företag
-        companies = self.firebase_db.get_companies()
-        company_id = None
-        
-        for cid, company_data in companies.items():
-            if company_data.get('name') == company_name:
-                company_id = cid
-                break
+        index = self.get_index()
+        company_id = index.company_id(company_name)
         
         if not company_id:
             company_id = self.firebase_db.create_company(company_name, "Stockholm")
+            index.add_company(company_id, {'name': company_name, 'location': "Stockholm"})
             print(f"   ✅ Skapat företag: {company_name} (ID: {company_id})")
         else:
             print(f"   ✅ Hittade befintligt företag: {company_name} (ID: {company_id})")
@@ -230,15 +236,8 @@ class ExcelToFirebaseETL:
         print(f"   ✅ Skapat dataset: {dataset_name} (ID: {dataset_id})")
         
         # Hämta kategorier
-        categories = self.firebase_db.get_account_categories()
-        revenue_category_id = None
-        expense_category_id = None
-        
-        for cat_id, cat_data in categories.items():
-            if cat_data.get('name') == 'Intäkter':
-                revenue_category_id = cat_id
-            elif cat_data.get('name') == 'Kostnader':
-                expense_category_id = cat_id
+        revenue_category_id = index.category_id('Intäkter')
+        expense_category_id = index.category_id('Kostnader')
         
         # Processera datarader
         processed_accounts = 0
@@ -274,16 +273,11 @@ class ExcelToFirebaseETL:
             print(f"      → Kategoriserad som: {category_name}")
             
             # Skapa eller hämta konto
-            accounts = self.firebase_db.get_accounts(category_id)
-            account_id = None
-            
-            for acc_id, acc_data in accounts.items():
-                if acc_data.get('name') == account_name:
-                    account_id = acc_id
-                    break
+            account_id = index.account_id_in_category(category_id, account_name)
             
             if not account_id:
                 account_id = self.firebase_db.create_account(account_name, category_id)
+                index.add_account(account_id, {'name': account_name, 'category_id': category_id})
                 print(f"      ✅ Skapat konto: {account_name} → {category_name}")
             
             # Skapa raw label och mappning
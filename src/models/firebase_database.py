@@ -36,6 +36,78 @@ def get_env_var(key: str) -> str:
 print(f"🔍 Debug - Database URL: {get_env_var('FIREBASE_DATABASE_URL')}")
 print(f"🔍 Debug - Project ID: {get_env_var('FIREBASE_PROJECT_ID')}")
 
+def diff_budget_values(existing_values: Dict[str, Any], budget_id: str,
+                       budget_updates: Dict[Any, Dict[int, float]], partial: bool = False):
+    """
+    Jämför befintliga budget_values mot nya värden för en budget
+
+    Args:
+        existing_values: Hela budget_values-noden {key: {budget_id, account_id, month, amount}}
+        budget_id: Budgeten som sparas
+        budget_updates: {account_id: {month: amount}} - celler som saknas tas bort
+        partial: True = bara cellerna i budget_updates berörs (övriga behålls)
+
+    Returns:
+        (updates, stats) - multi-path updates relativt databasroten (None = ta bort)
+        och antal 'added', 'changed', 'removed', 'unchanged'
+    """
+    now = datetime.now().isoformat()
+    updates = {}
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+    # Befintliga celler (account_id, month) -> (key, amount)
+    current = {}
+    for key, value in (existing_values or {}).items():
+        if not isinstance(value, dict) or value.get("budget_id") != budget_id:
+            continue
+        cell = (str(value.get("account_id")), int(value.get("month", 0)))
+        if cell in current:
+            # Dubblett från tidigare delete-and-recreate - städa bort
+            updates[f"budget_values/{key}"] = None
+            continue
+        current[cell] = (key, float(value.get("amount", 0) or 0))
+
+    seen = set()
+    for account_id, months in budget_updates.items():
+        for month, amount in months.items():
+            cell = (str(account_id), int(month))
+            amount = float(amount or 0)
+            seen.add(cell)
+            existing = current.get(cell)
+
+            # Policy: spara aldrig 0-värden
+            if abs(amount) <= 1e-9:
+                if existing:
+                    updates[f"budget_values/{existing[0]}"] = None
+                    stats["removed"] += 1
+                else:
+                    stats["unchanged"] += 1
+                continue
+
+            if existing is None:
+                key = f"{budget_id}_{account_id}_{int(month)}"
+                updates[f"budget_values/{key}"] = {
+                    "budget_id": budget_id,
+                    "account_id": account_id,
+                    "month": int(month),
+                    "amount": amount,
+                    "updated_at": now
+                }
+                stats["added"] += 1
+            elif abs(existing[1] - amount) > 1e-9:
+                updates[f"budget_values/{existing[0]}/amount"] = amount
+                updates[f"budget_values/{existing[0]}/updated_at"] = now
+                stats["changed"] += 1
+            else:
+                stats["unchanged"] += 1
+
+    for cell, (key, _) in current.items():
+        if cell not in seen and not partial:
+            updates[f"budget_values/{key}"] = None
+            stats["removed"] += 1
+
+    return updates, stats
+
 class FirebaseDB:
     """Firebase Realtime Database hanterare"""
     
@@ -329,6 +401,20 @@ class FirebaseDB:
         new_value_ref = budget_values_ref.push(value_data)
         return new_value_ref.key
 
+    def save_budget_values(self, budget_id: str, budget_updates: Dict[Any, Dict[int, float]],
+                           partial: bool = False) -> Dict[str, int]:
+        """
+        Diff-baserad sparning av en hel budget: läser budget_values EN gång och skriver
+        tillagda, ändrade och borttagna celler i EN multi-path update
+        (partial=True: bara angivna celler, t.ex. en batch från skrivkön)
+        """
+        existing_values = self.get_ref("budget_values").get() or {}
+        updates, stats = diff_budget_values(existing_values, budget_id, budget_updates, partial)
+        if updates:
+            updates[f"budgets/{budget_id}/updated_at"] = datetime.now().isoformat()
+            self.get_ref().update(updates)
+        return stats
+
     def get_budget_values(self, budget_id: Optional[str] = None) -> Dict[str, Any]:
         """Hämta budgetvärden"""
         budget_values_ref = self.get_ref("budget_values")
@@ -3,6 +3,7 @@ Excel-liknande vy för säsongsfaktorer och budgetredigering
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
 import sys
 from pathlib import Path
 from datetime import datetime
@@ -18,6 +19,8 @@ from utils.firebase_helpers import (
     get_account_categories, get_company_by_id
 )
 from models.firebase_database import get_firebase_db
+from utils.excel_table import build_excel_table
+from utils_grid_diff import MONTH_LABELS, diff_grids, long_to_grid, grid_to_updates, apply_changes, match_account_ids
 
 def get_financial_data_with_categories(company_id, year):
     """Hämta finansiell data med kategorier för företag och år"""
@@ -180,39 +183,8 @@ def update_account_category(account_id, new_category_id):
         return False
 
 def create_excel_table_with_categories(actual_df, budget_df):
-    """Skapa Excel-liknande tabell med kategorival"""
-    month_names = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 
-                   'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
-    
-    result_data = []
-    
-    # Hämta alla unika konton och kategorier
-    if not actual_df.empty:
-        unique_accounts = actual_df[['account_name', 'category', 'account_id', 'category_id']].drop_duplicates()
-        
-        for _, account_info in unique_accounts.iterrows():
-            account = account_info['account_name']
-            category = account_info['category']
-            account_id = account_info['account_id']
-            category_id = account_info['category_id']
-            
-            row = {
-                'account': account, 
-                'category': category,
-                'account_id': account_id,
-                'category_id': category_id
-            }
-            
-            # Faktiska värden
-            account_data = actual_df[actual_df['account_name'] == account]
-            for i, month in enumerate(month_names, 1):
-                month_data = account_data[account_data['month'] == i]
-                value = month_data['amount'].sum() if len(month_data) > 0 else 0
-                row[month] = value
-            
-            result_data.append(row)
-    
-    return pd.DataFrame(result_data)
+    """Skapa Excel-liknande tabell med kategorival (faktiska månader + budget_month_1..12)"""
+    return build_excel_table(actual_df, budget_df)
 
 def save_budget(company_id, year, budget_updates):
     """Spara budget till databasen"""
@@ -232,42 +204,23 @@ def save_budget(company_id, year, budget_updates):
                     latest_date = updated_at
                     target_budget_id = budget_id
         
-        if target_budget_id:
-            # Uppdatera befintlig budget
-            budget_ref = firebase_db.get_ref(f"budgets/{target_budget_id}")
-            budget_ref.update({
-                "updated_at": datetime.now().isoformat()
-            })
-        else:
+        if not target_budget_id:
             # Skapa ny budget
             target_budget_id = firebase_db.create_budget(company_id, year, f"Budget {year}")
         
-        # Debug: visa vad som ska sparas
-        saved_count = 0
         st.write(f"💾 Sparar budget för {len(budget_updates)} konton till budget_id: {target_budget_id}")
         
-        # Debug: visa vilka konton som ska sparas
-        for account_id, months_data in budget_updates.items():
-            non_zero_months = {m: v for m, v in months_data.items() if v != 0}
-            if non_zero_months:
-                st.write(f"   Konto {account_id}: {len(non_zero_months)} månader med värden")
-        
-        # Ta bort alla befintliga budget-värden för denna budget först
-        budget_values_ref = firebase_db.get_ref("budget_values")
-        existing_values = budget_values_ref.get() or {}
-        
-        for value_id, value_data in existing_values.items():
-            if value_data.get("budget_id") == target_budget_id:
-                budget_values_ref.child(value_id).delete()
-        
-        # Spara budget-värden
-        for account_id, months_data in budget_updates.items():
-            for month, amount in months_data.items():
-                # Lägg till nytt värde (även om det är 0 för fullständighet)
-                firebase_db.update_budget_value(target_budget_id, account_id, month, float(amount))
-                saved_count += 1
+        # Diff mot befintlig budget - en läsning och EN multi-path update
+        # (updated_at på budgeten sätts i samma skrivning när något ändrats)
+        stats = firebase_db.save_budget_values(target_budget_id, budget_updates)
         
-        st.success(f"✅ Budget sparad! {saved_count} värden sparade för budget_id: {target_budget_id}")
+        if stats['added'] or stats['changed'] or stats['removed']:
+            st.success(
+                f"✅ Budget sparad! {stats['added']} nya, {stats['changed']} ändrade, "
+                f"{stats['removed']} borttagna värden ({stats['unchanged']} oförändrade)"
+            )
+        else:
+            st.info("ℹ️ Inga ändringar att spara")
         return True
     except Exception as e:
         st.error(f"❌ Fel vid sparande av budget: {e}")
@@ -278,30 +231,23 @@ def collect_budget_updates(actual_df, budget_df):
 
     Faller tillbaka till befintlig budget om ett fält inte finns i sessionen.
     """
-    month_numbers = list(range(1, 13))
-    updates = {}
-    # Befintlig budget per (account_id, month)
-    existing = {}
-    if not budget_df.empty:
-        for _, row in budget_df.iterrows():
-            existing[(int(row['account_id']), int(row['month']))] = float(row['amount'])
+    accounts = actual_df[['category', 'account_id']].drop_duplicates('account_id')
+    budget_grid = long_to_grid(budget_df)
+    # Budgetens id kan ha annan typ än kontonas (str/int) - annars matchar merge ingenting
+    budget_grid['account_id'] = match_account_ids(budget_grid['account_id'], accounts['account_id'])
+    original = accounts[['account_id']].merge(budget_grid, on='account_id', how='left').fillna(0.0)
+
+    # Nycklar {kategori}_budget_{account_id}_{månad} för alla konton och månader på en gång
+    session = st.session_state.to_dict()
+    edited = original.copy()
+    prefix = accounts['category'].astype(str) + "_budget_" + accounts['account_id'].astype(str) + "_"
+    for month, label in enumerate(MONTH_LABELS, 1):
+        keys = prefix + str(month)
+        present = keys.isin(list(session)).to_numpy()
+        values = pd.to_numeric(keys.map(session), errors='coerce').fillna(0.0).to_numpy()
+        edited[label] = np.where(present, values, original[label].to_numpy())
 
-    unique_accounts = actual_df[['account_name', 'category', 'account_id']].drop_duplicates()
-    for _, acc in unique_accounts.iterrows():
-        account_id = int(acc['account_id'])
-        category = acc['category']
-        month_map = {}
-        for m in month_numbers:
-            key = f"{category}_budget_{account_id}_{m}"
-            if key in st.session_state:
-                try:
-                    month_map[m] = float(st.session_state[key])
-                except Exception:
-                    month_map[m] = 0.0
-            else:
-                month_map[m] = existing.get((account_id, m), 0.0)
-        updates[account_id] = month_map
-    return updates
+    return apply_changes(grid_to_updates(original), diff_grids(original, edited))
 
 def show():
     """Visa finansdatabas-sida"""
@@ -475,43 +421,22 @@ def show():
         categories = ["Intäkter", "Kostnader"]
         tabs = st.tabs([f"📊 Budget - {cat}" for cat in categories])
 
+        existing_grid = long_to_grid(budget_df)
+        existing_grid['account_id'] = match_account_ids(existing_grid['account_id'], actual_df['account_id'])
+        existing_updates = grid_to_updates(existing_grid)
+
         def build_budget_grid(category: str) -> pd.DataFrame:
-            month_map = [('Jan',1),('Feb',2),('Mar',3),('Apr',4),('Maj',5),('Jun',6),
-                         ('Jul',7),('Aug',8),('Sep',9),('Okt',10),('Nov',11),('Dec',12)]
             accounts = (
                 actual_df[actual_df['category'] == category]
                 [['account_name','account_id']]
                 .drop_duplicates()
                 .sort_values('account_name')
+                .rename(columns={'account_name': 'Konto'})
             )
-            rows = []
-            for _, r in accounts.iterrows():
-                account_id = r['account_id']  # Firebase använder string-IDs
-                account_name = r['account_name']
-                row = { 'Konto': account_name, 'account_id': account_id }
-                for label, num in month_map:
-                    existing = 0.0
-                    if not budget_df.empty:
-                        match = budget_df[(budget_df['account_id'] == account_id) & (budget_df['month'] == num)]
-                        if not match.empty:
-                            existing = float(match['amount'].iloc[0])
-                    row[label] = existing
-                rows.append(row)
-            return pd.DataFrame(rows)
-
-        def grid_to_updates(df: pd.DataFrame) -> dict:
-            month_map = [('Jan',1),('Feb',2),('Mar',3),('Apr',4),('Maj',5),('Jun',6),
-                         ('Jul',7),('Aug',8),('Sep',9),('Okt',10),('Nov',11),('Dec',12)]
-            updates: dict[str, dict[int, float]] = {}  # Firebase använder string-IDs
-            for _, r in df.iterrows():
-                aid = r['account_id']  # Firebase använder string-IDs
-                updates[aid] = {}
-                for label, num in month_map:
-                    try:
-                        updates[aid][num] = float(r[label]) if pd.notna(r[label]) else 0.0
-                    except Exception:
-                        updates[aid][num] = 0.0
-            return updates
+            # Firebase använder string-IDs
+            grid = accounts.merge(existing_grid, on='account_id', how='left')
+            grid[MONTH_LABELS] = grid[MONTH_LABELS].fillna(0.0)
+            return grid.reset_index(drop=True)
 
         for i, category in enumerate(categories):
             with tabs[i]:
@@ -537,9 +462,11 @@ def show():
                 )
 
                 if st.button(f"💾 Spara budget – {category}", type="primary", key=f"save_{category}"):
-                    # data_editor returnerar bara diff i st.session_state om inte vi tar edited_df
-                    updates = grid_to_updates(edited_df)
-                    if save_budget(selected_company_id, selected_year, updates):
+                    # Ändrade celler läggs på hela befintliga budgeten - övriga kategorier behålls
+                    changes = diff_grids(grid_df, edited_df)
+                    if not changes:
+                        st.info("ℹ️ Inga ändringar att spara")
+                    elif save_budget(selected_company_id, selected_year, apply_changes(existing_updates, changes)):
                         st.success("✅ Budget sparad till databasen!")
                         import time
                         time.sleep(1)
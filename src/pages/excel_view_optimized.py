@@ -3,73 +3,128 @@ Optimerad Excel-vy med effektiv sparning av enskilda celler
 """
 import streamlit as st
 import pandas as pd
-import time
 from datetime import datetime
-from src.models.database import get_companies, get_financial_data_with_categories, get_budget_data, get_all_categories, update_account_category
 # Import from root level pyrebase version instead of complex firebase_admin version
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from models_firebase_database import get_firebase_db
-from typing import Dict, Any
+from utils_grid_diff import diff_grids, MONTH_LABELS
+from utils_write_behind import get_write_queue, register_handler, PENDING, SYNCING, SYNCED, FAILED
+from typing import Dict, Any, List
 
 # Import original functions
 from src.pages.excel_view import (
+    get_companies,
     get_years_for_company, 
+    get_financial_data_with_categories,
+    get_budget_data,
     create_excel_table_with_categories,
     collect_budget_updates
 )
 
-def save_single_budget_cell(company_id: str, year: int, account_id: str, month: int, amount: float) -> bool:
+# Cellredigeringar sparas via skrivkön (utils_write_behind)
+BUDGET_CELL_KIND = "budget_cell"
+SYNC_REFRESH = 1.0
+CELL_STATUS_LABELS = {PENDING: "⏳ Väntar", SYNCING: "🔄 Skickas", SYNCED: "✅ Synkad", FAILED: "❌ Misslyckades"}
+
+def find_budget_id(budgets: Dict[str, Any], company_id: str, year: int):
+    """Senast uppdaterade budgeten för företaget och året (samma som get_budget_data visar)"""
+    target_budget_id, latest_date = None, None
+    for budget_id, budget_data in (budgets or {}).items():
+        if isinstance(budget_data, dict) and budget_data.get('company_id') == company_id and budget_data.get('year') == year:
+            updated_at = budget_data.get('updated_at', budget_data.get('created_at')) or ''
+            if latest_date is None or updated_at > latest_date:
+                target_budget_id, latest_date = budget_id, updated_at
+    return target_budget_id
+
+def flush_budget_cells(payloads: List[Dict[str, Any]]) -> None:
     """
-    Spara en enskild budget-cell effektivt till Firebase
-    
-    Args:
-        company_id: Företagets ID
-        year: År för budgeten
-        account_id: Kontots ID  
-        month: Månad (1-12)
-        amount: Belopp att spara
+    Skrivköns handler: cellerna grupperas per företag och år och skrivs med
+    save_budget_values(partial=True) - en läsning och en multi-path update per budget.
+    Kastar vid fel så att batchen försöks igen.
+    """
+    firebase_db = get_firebase_db()
+    grouped: Dict[tuple, Dict[str, Dict[int, float]]] = {}
+    for payload in payloads:
+        cells = grouped.setdefault((payload['company_id'], payload['year']), {})
+        cells.setdefault(payload['account_id'], {})[payload['month']] = payload['amount']
     
-    Returns:
-        bool: True om sparning lyckades
+    # get_raw kastar vid nätverksfel (get_budgets returnerar {} och skulle skapa en dubblett)
+    budgets = firebase_db.get_raw("budgets") or {}
+    for (company_id, year), budget_updates in grouped.items():
+        budget_id = find_budget_id(budgets, company_id, year)
+        if not budget_id:
+            # Förutsägbart id - ett nytt försök skapar inte en andra budget
+            budget_id = f"budget_{company_id}_{year}"
+            now = datetime.now().isoformat()
+            firebase_db.patch_raw({f"budgets/{budget_id}": {
+                "company_id": company_id, "year": year, "name": f"Budget {year}",
+                "created_at": now, "updated_at": now
+            }})
+        firebase_db.save_budget_values(budget_id, budget_updates, partial=True)
+
+register_handler(BUDGET_CELL_KIND, flush_budget_cells)
+
+def load_cell_states(queue, company_id: str, year: int) -> Dict[tuple, Dict[str, Any]]:
+    """Skrivköns poster för företaget och året {(account_id, månad): {status, payload, ...}}"""
+    return {
+        (state['payload']['account_id'], state['payload']['month']): state
+        for state in queue.statuses(BUDGET_CELL_KIND).values()
+        if state['payload']['company_id'] == company_id and state['payload']['year'] == int(year)
+    }
+
+def overlay_unsynced(table_df: pd.DataFrame, cell_states: Dict[tuple, Dict[str, Any]]) -> pd.DataFrame:
+    """Budgetkolumnerna med osynkade celler från skrivkön inlagda (griden visar senaste värdet)"""
+    unsynced = {cell: state for cell, state in cell_states.items() if state['status'] != SYNCED}
+    if not unsynced or table_df.empty:
+        return table_df
+    table_df = table_df.copy()
+    # Journalen har account_id som str - tabellens id kan vara int/numpy-int
+    rows = {str(account_id): i for i, account_id in enumerate(table_df['account_id'])}
+    for (account_id, month), state in unsynced.items():
+        column = f'budget_month_{month}'
+        if str(account_id) in rows:
+            if column not in table_df.columns:
+                table_df[column] = 0.0
+            table_df.iloc[rows[str(account_id)], table_df.columns.get_loc(column)] = state['payload']['amount']
+    return table_df
+
+def show_sync_status(queue, company_id: str, year: int, account_names: Dict[str, str], polling: bool = False):
     """
-    try:
-        firebase_db = get_firebase_db()
-        
-        # Hitta eller skapa budget för detta företag och år
-        budgets = firebase_db.get_budgets(company_id)
-        target_budget_id = None
-        
-        # Leta efter befintlig budget för detta år
-        if budgets and isinstance(budgets, dict):
-            for budget_id, budget_data in budgets.items():
-                if budget_data and budget_data.get('year') == year:
-                    target_budget_id = budget_id
-                    break
-        
-        # Skapa ny budget om ingen finns
-        if not target_budget_id:
-            target_budget_id = firebase_db.create_budget(company_id, year, f"Budget {year}")
-            st.info(f"📝 Skapade ny budget för {year}")
-        
-        # Spara endast denna cell
-        firebase_db.update_budget_value(target_budget_id, str(account_id), int(month), float(amount))
-        
-        # Visa sparningsbekräftelse
-        month_names = ['Jan','Feb','Mar','Apr','Maj','Jun','Jul','Aug','Sep','Okt','Nov','Dec']
-        month_name = month_names[month-1] if 1 <= month <= 12 else str(month)
-        
-        if abs(amount) <= 1e-9:  # Nollvärde
-            st.success(f"🗑️ Tog bort värde för {month_name}")
-        else:
-            st.success(f"💾 Sparade {amount:,.0f} kr för {month_name}")
-        
-        return True
-        
-    except Exception as e:
-        st.error(f"❌ Fel vid sparande av cell: {e}")
-        return False
+    Synkstatus per cell (läser bara skrivkön, körs som fragment).
+    polling=True: fragmentet körs med run_every och gör en full omkörning när kön är tom.
+    """
+    cell_states = load_cell_states(queue, company_id, year)
+    counts = {status: 0 for status in CELL_STATUS_LABELS}
+    for state in cell_states.values():
+        counts[state['status']] += 1
+    
+    waiting = counts[PENDING] + counts[SYNCING]
+    if polling and not waiting:
+        # Allt skickat - full omkörning stoppar run_every och visar den sparade budgeten
+        st.rerun()
+    if not cell_states:
+        return
+    
+    if waiting:
+        st.info(f"⏳ {waiting} celler sparas i bakgrunden...")
+    elif counts[FAILED]:
+        st.error(f"❌ {counts[FAILED]} celler kunde inte sparas")
+    else:
+        st.success(f"✅ Alla ändringar sparade ({counts[SYNCED]} celler)")
+    
+    if counts[FAILED] and st.button("🔁 Försök igen", key=f"budget_cell_retry_{company_id}_{year}"):
+        queue.retry_failed()
+    
+    with st.expander("🔄 Synkstatus per cell", expanded=bool(counts[FAILED])):
+        st.dataframe(pd.DataFrame([{
+            'Konto': account_names.get(account_id, account_id),
+            'Månad': MONTH_LABELS[month - 1],
+            'Belopp': state['payload']['amount'],
+            'Status': CELL_STATUS_LABELS[state['status']],
+            'Fel': state['error'] or ''
+        } for (account_id, month), state in sorted(cell_states.items())]), hide_index=True, use_container_width=True)
 
 def create_interactive_budget_grid(category_data: pd.DataFrame, category: str, company_id: str, year: int) -> pd.DataFrame:
     """
@@ -131,10 +186,10 @@ def create_interactive_budget_grid(category_data: pd.DataFrame, category: str, c
     
     return edited_df
 
-def detect_and_save_changes(original_df: pd.DataFrame, edited_df: pd.DataFrame, 
-                           company_id: str, year: int, category: str) -> int:
+def detect_and_queue_changes(original_df: pd.DataFrame, edited_df: pd.DataFrame, 
+                             company_id: str, year: int, category: str) -> int:
     """
-    Detektera ändringar och spara endast de celler som ändrats
+    Detektera ändringar och lägg de ändrade cellerna i skrivkön (returnerar direkt)
     
     Args:
         original_df: Ursprunglig data
@@ -144,35 +199,19 @@ def detect_and_save_changes(original_df: pd.DataFrame, edited_df: pd.DataFrame,
         category: Kategorinamn
         
     Returns:
-        int: Antal sparade celler
+        int: Antal köade celler (en cell som ändras igen ersätter sin väntande post)
     """
-    changes_saved = 0
-    month_names = ['Jan','Feb','Mar','Apr','Maj','Jun','Jul','Aug','Sep','Okt','Nov','Dec']
+    queue = get_write_queue()
+    changes_queued = 0
     
-    # Jämför rad för rad
-    for idx in range(len(edited_df)):
-        account_id = edited_df.iloc[idx]['account_id']
-        account_name = edited_df.iloc[idx]['Konto']
-        
-        # Jämför månadskolumner
-        for month_idx, month_name in enumerate(month_names, 1):
-            old_value = original_df.iloc[idx][month_name] if idx < len(original_df) else 0.0
-            new_value = edited_df.iloc[idx][month_name]
-            
-            # Kontrollera om värdet ändrats (med tolerans för flyttal)
-            if abs(old_value - new_value) > 1e-6:
-                # Spara den ändrade cellen
-                if save_single_budget_cell(company_id, year, account_id, month_idx, new_value):
-                    changes_saved += 1
-                    
-                    # Visa vilken ändring som gjordes
-                    with st.expander(f"📝 Ändring sparad för {account_name}", expanded=False):
-                        st.write(f"**Månad:** {month_name}")
-                        st.write(f"**Gammalt värde:** {old_value:,.0f} kr")
-                        st.write(f"**Nytt värde:** {new_value:,.0f} kr")
-                        st.write(f"**Differens:** {new_value - old_value:+,.0f} kr")
+    # Rader matchas på account_id och månadsmatriserna jämförs i ett steg
+    for change in diff_grids(original_df, edited_df):
+        payload = {'company_id': company_id, 'year': int(year), 'account_id': str(change.account_id),
+                   'month': change.month, 'amount': change.new}
+        queue.enqueue(BUDGET_CELL_KIND, f"{company_id}|{year}|{change.account_id}|{change.month}", payload)
+        changes_queued += 1
     
-    return changes_saved
+    return changes_queued
 
 def show_optimized():
     """
@@ -189,7 +228,7 @@ def show_optimized():
         - ⚡ Snabbare prestanda - ingen massa-sparning 
         - 🔍 Visar exakt vilka ändringar som gjorts
         - 💾 Effektivare databasanvändning
-        - ⏱️ Omedelbar sparning när du klickar "Spara ändringar"
+        - ⏱️ "Spara ändringar" köar cellerna direkt - de skickas i bakgrunden med nya försök vid fel
         """)
     
     # Hämta företag
@@ -241,8 +280,12 @@ def show_optimized():
         st.warning("Ingen data hittad för valt företag och år")
         return
     
+    # Skrivkön läses före tabellen - osynkade celler visas med sitt senaste värde
+    queue = get_write_queue()
+    cell_states = load_cell_states(queue, selected_company_id, selected_year)
+    
     # Skapa tabellen med kategorival
-    table_df = create_excel_table_with_categories(actual_df, budget_df)
+    table_df = overlay_unsynced(create_excel_table_with_categories(actual_df, budget_df), cell_states)
     
     if not table_df.empty:
         st.markdown("### 📊 Budget-redigering per kategori")
@@ -279,8 +322,8 @@ def show_optimized():
                         original_key = f"{category}_{selected_company_id}_{selected_year}"
                         original_data = st.session_state.original_data.get(original_key, original_grid)
                         
-                        # Detektera och spara ändringar
-                        changes_saved = detect_and_save_changes(
+                        # Detektera ändringar och lägg dem i skrivkön
+                        changes_queued = detect_and_queue_changes(
                             original_data, 
                             original_grid,  # Använd current state från data_editor
                             selected_company_id, 
@@ -288,12 +331,10 @@ def show_optimized():
                             category
                         )
                         
-                        if changes_saved > 0:
-                            st.success(f"✅ {changes_saved} ändringar sparade för {category}")
+                        if changes_queued > 0:
+                            st.success(f"✅ {changes_queued} ändringar köade för {category}")
                             # Uppdatera original data
                             st.session_state.original_data[original_key] = original_grid.copy()
-                            time.sleep(1)
-                            st.rerun()
                         else:
                             st.info("ℹ️ Inga ändringar att spara")
                 
@@ -319,6 +360,12 @@ def show_optimized():
                             year_total = sum(original_grid[month].sum() for month in month_names)
                             st.write(f"**Årssum:** {year_total:,.0f} kr")
     
+        # Synkstatus per cell uppdateras av sig själv så länge något väntar på att skickas
+        waiting = any(state['status'] in (PENDING, SYNCING) for state in load_cell_states(queue, selected_company_id, selected_year).values())
+        account_names = dict(zip(table_df['account_id'].astype(str), table_df['account']))
+        st.fragment(run_every=SYNC_REFRESH if waiting else None)(show_sync_status)(
+            queue, selected_company_id, selected_year, account_names, polling=waiting)
+    
     # Footer
     st.markdown("---")
     st.markdown(f"""
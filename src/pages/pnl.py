@@ -10,6 +10,7 @@ from utils.database_helpers import (
     get_companies, get_years_for_company, get_financial_data,
     get_budget_comparison, format_currency
 )
+from utils.pnl_builder import MONTH_NAMES, build_pnl, flatten_rows, category_totals, export_tables
 
 def show():
     """Visa P&L-sidan"""
@@ -84,119 +85,41 @@ def show():
     st.markdown("---")
     st.markdown(f"### 📊 Resultaträkning - {selected_company.name} {selected_year}")
     
-    # Skapa pivot-tabell för faktiska värden
-    actual_pivot = actual_data.pivot_table(
-        index=['category', 'account_name'],
-        columns='month',
-        values='amount',
-        aggfunc='sum',
-        fill_value=0
-    )
-    
-    # Skapa budget pivot om budget finns
-    budget_pivot = None
-    if budget_data is not None and not budget_data.empty:
-        budget_pivot = budget_data.pivot_table(
-            index=['category', 'account_name'],
-            columns='month',
-            values='amount',
-            aggfunc='sum',
-            fill_value=0
-        )
-    
-    # Månadsnamn
-    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun',
-                   'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+    # Hela resultaträkningen byggs i ett steg (12-månadersgrid, avvikelse och YTD som matriser)
+    pnl_tables = build_pnl(actual_data, budget_data, show_budget, show_variance)
+    actual_tables = build_pnl(actual_data)
     
     # Bygg resultaträkning per kategori
-    for category in ['Intäkter', 'Kostnader']:
-        if category in actual_pivot.index.get_level_values(0):
-            st.markdown(f"#### 💰 {category}")
-            
-            # Filtrera data för denna kategori
-            category_data = actual_pivot.loc[category]
-            
-            # Säkerställ att alla månader finns (1-12)
-            for month in range(1, 13):
-                if month not in category_data.columns:
-                    category_data[month] = 0
-            
-            # Sortera kolumner
-            category_data = category_data.reindex(sorted(category_data.columns), axis=1)
-            
-            # Byt namn på kolumner till månadnamn
-            category_data.columns = [month_names[i-1] for i in category_data.columns]
-            
-            # Lägg till YTD-kolumn
-            category_data['YTD'] = category_data.sum(axis=1)
-            
-            # Budget-data om tillgänglig
-            if budget_pivot is not None and category in budget_pivot.index.get_level_values(0):
-                budget_category = budget_pivot.loc[category]
-                
-                # Säkerställ samma struktur
-                for month in range(1, 13):
-                    if month not in budget_category.columns:
-                        budget_category[month] = 0
-                
-                budget_category = budget_category.reindex(sorted(budget_category.columns), axis=1)
-                budget_category.columns = [month_names[i-1] for i in budget_category.columns]
-                budget_category['YTD'] = budget_category.sum(axis=1)
-                
-                # Kombinera faktiskt och budget
-                display_data = pd.DataFrame()
-                
-                for account in category_data.index:
-                    actual_row = category_data.loc[account]
-                    budget_row = budget_category.loc[account] if account in budget_category.index else pd.Series(0, index=actual_row.index)
-                    variance_row = actual_row - budget_row
-                    
-                    # Lägg till rader
-                    display_data.loc[f"{account} (Faktiskt)", :] = actual_row
-                    if show_budget:
-                        display_data.loc[f"{account} (Budget)", :] = budget_row
-                    if show_variance:
-                        display_data.loc[f"{account} (Avvikelse)", :] = variance_row
-            else:
-                display_data = category_data
-            
-            # Formatera som valuta
-            formatted_data = display_data.map(format_currency)
-            
-            # Visa tabell
-            st.dataframe(formatted_data, use_container_width=True)
-            
-            # Visa diagram för denna kategori
-            if len(category_data) > 0:
-                fig = px.bar(
-                    x=category_data.columns[:-1],  # Exkludera YTD
-                    y=category_data.sum(axis=0)[:-1],  # Exkludera YTD
-                    title=f"{category} per månad",
-                    labels={'x': 'Månad', 'y': 'Belopp (SEK)'},
-                    color_discrete_sequence=['#2E8B57' if category == 'Intäkter' else '#DC143C']
-                )
-                fig.update_layout(template='plotly_white')
-                st.plotly_chart(fig, use_container_width=True)
+    for category, display_data in pnl_tables.items():
+        st.markdown(f"#### 💰 {category}")
+        category_data = actual_tables[category]
+        
+        # Formatera som valuta
+        formatted_data = flatten_rows(display_data).map(format_currency)
+        
+        # Visa tabell
+        st.dataframe(formatted_data, use_container_width=True)
+        
+        # Visa diagram för denna kategori
+        if len(category_data) > 0:
+            fig = px.bar(
+                x=category_data.columns[:-1],  # Exkludera YTD
+                y=category_data.sum(axis=0)[:-1],  # Exkludera YTD
+                title=f"{category} per månad",
+                labels={'x': 'Månad', 'y': 'Belopp (SEK)'},
+                color_discrete_sequence=['#2E8B57' if category == 'Intäkter' else '#DC143C']
+            )
+            fig.update_layout(template='plotly_white')
+            st.plotly_chart(fig, use_container_width=True)
     
     # Sammanfattning
     st.markdown("---")
     st.markdown("#### 📊 Sammanfattning")
     
     # Beräkna totaler per månad
-    total_revenue = pd.Series(0, index=range(1, 13))
-    total_expenses = pd.Series(0, index=range(1, 13))
-    
-    if 'Intäkter' in actual_pivot.index.get_level_values(0):
-        revenue_data = actual_pivot.loc['Intäkter']
-        for month in range(1, 13):
-            if month in revenue_data.columns:
-                total_revenue[month] = revenue_data[month].sum()
-    
-    if 'Kostnader' in actual_pivot.index.get_level_values(0):
-        expense_data = actual_pivot.loc['Kostnader']
-        for month in range(1, 13):
-            if month in expense_data.columns:
-                total_expenses[month] = expense_data[month].sum()
+    totals = category_totals(actual_data)
+    total_revenue = totals.loc['Intäkter']
+    total_expenses = totals.loc['Kostnader']
     
     results = total_revenue - total_expenses
     
@@ -205,7 +128,7 @@ def show():
         'Intäkter': [format_currency(x) for x in total_revenue],
         'Kostnader': [format_currency(x) for x in total_expenses],
         'Resultat': [format_currency(x) for x in results]
-    }, index=month_names)
+    }, index=MONTH_NAMES)
     
     # Lägg till YTD
     summary_data.loc['YTD'] = [
@@ -218,7 +141,7 @@ def show():
     
     # Resultatdiagram
     fig_result = px.bar(
-        x=month_names,
+        x=MONTH_NAMES,
         y=results,
         title="Månadsresultat",
         labels={'x': 'Månad', 'y': 'Resultat (SEK)'},
@@ -241,10 +164,8 @@ def show():
                 summary_data.to_excel(writer, sheet_name='Sammanfattning')
                 
                 # Exportera detaljer per kategori
-                for category in ['Intäkter', 'Kostnader']:
-                    if category in actual_pivot.index.get_level_values(0):
-                        category_data = actual_pivot.loc[category]
-                        category_data.to_excel(writer, sheet_name=category)
+                for category, category_data in export_tables(actual_data).items():
+                    category_data.to_excel(writer, sheet_name=category)
             
             output.seek(0)
             
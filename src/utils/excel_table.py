@@ -0,0 +1,37 @@
+"""
+Excel-liknande kontotabell (faktiska månader och budget per konto)
+Byggs med pivot_table istället för ett filter per konto och månad.
+"""
+import pandas as pd
+from typing import Optional
+
+MONTHS = list(range(1, 13))
+MONTH_COLUMNS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+                 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+BUDGET_COLUMNS = [f'budget_month_{m}' for m in MONTHS]
+ACCOUNT_COLUMNS = ['account_name', 'category', 'account_id', 'category_id']
+
+def _month_pivot(df: pd.DataFrame, key: str, columns: list) -> pd.DataFrame:
+    """Summa per nyckel och månad 1-12 (saknade månader = 0)"""
+    pivot = df.pivot_table(index=key, columns='month', values='amount', aggfunc='sum', fill_value=0)
+    pivot = pivot.reindex(columns=MONTHS, fill_value=0)
+    pivot.columns = columns
+    return pivot
+
+def build_excel_table(actual_df: pd.DataFrame, budget_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    En rad per konto: account, category, account_id, category_id, jan..dec (faktiskt,
+    summerat per kontonamn) samt budget_month_1..12 (per account_id) när budget finns
+    """
+    if actual_df is None or actual_df.empty:
+        return pd.DataFrame()
+
+    accounts = actual_df[ACCOUNT_COLUMNS].drop_duplicates()
+    table = accounts.join(_month_pivot(actual_df, 'account_name', MONTH_COLUMNS), on='account_name')
+
+    if budget_df is not None and not budget_df.empty:
+        budget = _month_pivot(budget_df, 'account_id', BUDGET_COLUMNS)
+        table = table.join(budget, on='account_id')
+        table[BUDGET_COLUMNS] = table[BUDGET_COLUMNS].fillna(0.0)
+
+    return table.rename(columns={'account_name': 'account'}).reset_index(drop=True)
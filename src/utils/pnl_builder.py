@@ -0,0 +1,111 @@
+"""
+Byggare för resultaträkningar (P&L)
+Faktiskt- och budgetvärden pivoteras till ett fullt 12-månadersgrid i ett steg,
+avvikelse och YTD räknas som matrisoperationer och raderna Faktiskt/Budget/Avvikelse
+flätas ihop per konto med en MultiIndex-concat. Används av alla sidor som visar P&L.
+"""
+import pandas as pd
+from typing import Dict, List, Optional, Sequence
+
+MONTHS = list(range(1, 13))
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+CATEGORIES = ['Intäkter', 'Kostnader']
+
+ACTUAL = 'Faktiskt'
+BUDGET = 'Budget'
+VARIANCE = 'Avvikelse'
+
+def month_grid(data: Optional[pd.DataFrame], index: Sequence[str] = ('category', 'account_name'),
+               full_year: bool = True) -> pd.DataFrame:
+    """
+    Pivot (kategori, konto) × månad, tomma celler blir 0.
+    Med full_year fylls saknade månader ut till 1-12, annars bara månader med data.
+    """
+    index = list(index)
+    if data is None or data.empty:
+        empty_index = pd.MultiIndex.from_arrays([[] for _ in index], names=index)
+        return pd.DataFrame(0.0, index=empty_index, columns=MONTHS if full_year else [])
+    pivot = data.pivot_table(index=index, columns='month', values='amount', aggfunc='sum', fill_value=0)
+    if not full_year:
+        return pivot
+    return pivot.reindex(columns=MONTHS, fill_value=0).astype('float64')
+
+def with_ytd(grid: pd.DataFrame) -> pd.DataFrame:
+    """Månadsnamn som kolumner och YTD-kolumn sist"""
+    values = grid.to_numpy(dtype='float64')
+    table = pd.DataFrame(values, index=grid.index, columns=MONTH_NAMES)
+    table['YTD'] = values.sum(axis=1)
+    return table
+
+def category_slice(grid: pd.DataFrame, category: str) -> Optional[pd.DataFrame]:
+    """Kontorader för en kategori (None om kategorin saknas)"""
+    if category not in grid.index.get_level_values(0):
+        return None
+    return grid.xs(category, level=0)
+
+def build_pnl_table(actual: pd.DataFrame, budget: Optional[pd.DataFrame] = None,
+                    show_budget: bool = True, show_variance: bool = True) -> pd.DataFrame:
+    """
+    P&L-tabell för en kategori från månadsgrid (konto × 1-12).
+    Utan budget returneras bara faktiska värden, annars index (konto, typ) med
+    raderna Faktiskt/Budget/Avvikelse efter varandra för varje konto.
+    """
+    if budget is None:
+        return with_ytd(actual)
+
+    # Bara konton med faktiska värden visas, budget saknas = 0
+    budget = budget.reindex(index=actual.index, columns=actual.columns, fill_value=0)
+    parts = {ACTUAL: actual}
+    if show_budget:
+        parts[BUDGET] = budget
+    if show_variance:
+        parts[VARIANCE] = actual - budget
+
+    stacked = pd.concat(parts, names=['type'])
+    order = pd.MultiIndex.from_product([actual.index, list(parts)], names=[actual.index.name, 'type'])
+    return with_ytd(stacked.swaplevel(0, 1).reindex(order))
+
+def flatten_rows(table: pd.DataFrame) -> pd.DataFrame:
+    """Radetiketter som 'Konto (Faktiskt)' för visning"""
+    if not isinstance(table.index, pd.MultiIndex):
+        return table
+    flat = table.copy()
+    flat.index = [f"{account} ({row_type})" for account, row_type in table.index]
+    return flat
+
+def build_pnl(actual_data: pd.DataFrame, budget_data: Optional[pd.DataFrame] = None,
+              show_budget: bool = True, show_variance: bool = True,
+              categories: List[str] = CATEGORIES) -> Dict[str, pd.DataFrame]:
+    """
+    P&L-tabell per kategori (endast kategorier med faktiska värden).
+    Budget- och avvikelserader läggs bara till för kategorier som har budgetdata,
+    övriga kategorier visar enbart faktiska värden.
+    """
+    actual_grid = month_grid(actual_data)
+    budget_grid = month_grid(budget_data) if budget_data is not None and not budget_data.empty else None
+
+    tables = {}
+    for category in categories:
+        actual = category_slice(actual_grid, category)
+        if actual is None:
+            continue
+        # Kategori utan budget -> None (inga nollfyllda Budget/Avvikelse-rader)
+        budget = category_slice(budget_grid, category) if budget_grid is not None else None
+        tables[category] = build_pnl_table(actual, budget, show_budget, show_variance)
+    return tables
+
+def export_tables(actual_data: pd.DataFrame, categories: List[str] = CATEGORIES) -> Dict[str, pd.DataFrame]:
+    """Faktiska värden per kategori för Excel-export (konto × månadsnummer med data)"""
+    grid = month_grid(actual_data, full_year=False)
+    tables = {}
+    for category in categories:
+        table = category_slice(grid, category)
+        if table is not None:
+            tables[category] = table
+    return tables
+
+def category_totals(actual_data: pd.DataFrame, categories: List[str] = CATEGORIES) -> pd.DataFrame:
+    """Summa per kategori och månad (kategori × 1-12), saknade kategorier blir 0"""
+    grid = month_grid(actual_data)
+    return grid.groupby(level=0).sum().reindex(index=categories, fill_value=0)
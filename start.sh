@@ -3,4 +3,9 @@ echo "🚀 Startar Finansiell Analys App..."
 echo "📊 Öppnar i din webbläsare på http://localhost:8501"
 echo "⏹️  Tryck Ctrl+C för att stoppa appen"
 echo ""
-streamlit run app.py
+# Valfri uppvärmning av cachen (FINANS_WARMUP=1) - körs i appens process vid första
+# sidladdningen så att även minnescachen fylls (Firebase: FINANS_WARMUP_EMAIL/PASSWORD)
+if [ "$FINANS_WARMUP" = "1" ]; then
+    echo "🔥 Cachen värms upp i bakgrunden vid första sidladdningen"
+fi
+streamlit run streamlit_app.py
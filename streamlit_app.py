@@ -14,37 +14,39 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Fix för pkg_resources
-try:
-    import pkg_resources
-except ImportError:
+# Starta prestandamätning för denna rerun
+from utils_instrumentation import start_rerun, show_instrumentation_panel
+start_rerun()
+
+# Fix för pkg_resources - importera inte (långsamt), installera bara ersättare om det saknas
+import importlib.util
+if importlib.util.find_spec("pkg_resources") is None:
     import importlib.metadata as pkg_resources
-    import sys
     if not hasattr(pkg_resources, 'get_distribution'):
         pkg_resources.get_distribution = lambda name: type('Distribution', (), {'version': '1.0.0'})()
     sys.modules['pkg_resources'] = pkg_resources
 
-# Importera moduler från root-nivån (endast de som INTE använder firebase_admin)
+# Importera endast det inloggningssidan behöver - sidmoduler laddas först när de väljs
 try:
     import pages_auth as auth
-    import pages_visualization2 as visualization
-    import pages_seasonal_analysis as seasonal_analysis
-    import pages_seasonal_analysis_simple as seasonal_analysis_simple
     from utils_auth import require_authentication, show_user_info, get_auth
-    
-    # Importera ENDAST från fungerende sidor
-    from test_excel_import import show_excel_import_test
-    from simple_budget_page import show_simple_budget_page
+    from utils_page_registry import page_names, load_page
     
 except ImportError as e:
     st.error(f"Import fel: {e}")
     st.error("Kontrollera att alla nödvändiga filer finns på root-nivån")
     st.stop()
 
+# Valfri uppvärmning av cachen i appens process (FINANS_WARMUP=1, en gång per process,
+# eget repository och egna inloggningsuppgifter - oberoende av användarnas sessioner)
+from utils_cache_warmup import start_background_warmup
+start_background_warmup()
+
 # Kontrollera autentisering
 firebase_auth = get_auth()
 
 # Sidebar navigation
+page = None
 st.sidebar.title("📊 Finansiell Analys")
 st.sidebar.markdown("---")
 
@@ -56,26 +58,31 @@ if firebase_auth.is_authenticated():
     # Navigation för inloggade användare (endast fungerende sidor)
     page = st.sidebar.selectbox(
         "Välj sida",
-        ["📊 Test Excel-import", "💰 Budget-redigering", "📈 Visualisering v2", "📅 Säsongsanalys", "📅 Säsongsanalys (Förenklad)"],
+        page_names(),
         index=0  # Börja med Excel-import
     )
     
+    # Läs analysdata från lokal Parquet-snapshot om en sådan finns
+    from utils_parquet_snapshot import snapshot_available
+    if snapshot_available():
+        st.sidebar.checkbox(
+            "📦 Läs från Parquet-snapshot",
+            key="use_parquet_snapshot",
+            help="Faktiska värden läses från lokala Parquet-filer istället för Firebase"
+        )
+    
     st.sidebar.markdown("---")
     
     # Kräv autentisering för alla sidor
     require_authentication()
     
-    # Visa vald sida
-    if page == "📊 Test Excel-import":
-        show_excel_import_test()
-    elif page == "💰 Budget-redigering":
-        show_simple_budget_page()
-    elif page == "📈 Visualisering v2":
-        visualization.show()
-    elif page == "📅 Säsongsanalys":
-        seasonal_analysis.show()
-    elif page == "📅 Säsongsanalys (Förenklad)":
-        seasonal_analysis_simple.show()
+    # Visa vald sida (modulen importeras först nu)
+    try:
+        show_page = load_page(page)
+    except ImportError as e:
+        st.error(f"Import fel för sidan {page}: {e}")
+        st.stop()
+    show_page()
         
 else:
     # Visa inloggningsalternativ för ej inloggade användare
@@ -87,6 +94,10 @@ else:
         # Visa inloggningssidan som standard
         auth.show()
 
+# Prestandapanel (anrop, bytes, tid och cache-träffar för denna rerun)
+st.sidebar.markdown("---")
+show_instrumentation_panel(page)
+
 # Footer
 st.sidebar.markdown("---")
 st.sidebar.markdown(
@@ -5,6 +5,9 @@ Sparas i separat "test_data" mapp som lätt kan rensas
 import streamlit as st
 import pandas as pd
 from models_firebase_database import get_firebase_db
+from models_repository import get_repository, build_meta_index
+from utils_instrumentation import instrument
+from utils_parquet_snapshot import export_snapshot, pyarrow_available
 from datetime import datetime
 import io
 
@@ -218,6 +221,7 @@ def categorize_account_by_values(account_name: str, row_data, month_cols: list)
         else:
             return "Kostnader"
 
+@instrument("loader")
 def save_test_data_to_firebase(df: pd.DataFrame) -> bool:
     """
     Spara Excel-data till Firebase under "test_data" nod
@@ -229,8 +233,6 @@ def save_test_data_to_firebase(df: pd.DataFrame) -> bool:
         bool: True om sparning lyckades
     """
     try:
-        firebase_db = get_firebase_db()
-        
         st.info("🔍 Analyserar Excel-data...")
         st.write("**Kolumner hittade:**", list(df.columns))
         
@@ -429,9 +431,23 @@ def save_test_data_to_firebase(df: pd.DataFrame) -> bool:
                                 "created_at": datetime.now().isoformat()
                             }
         
-        # Spara till Firebase under test_data nod
-        test_ref = firebase_db.get_ref("test_data")
-        test_ref.set(test_data, firebase_db._get_token())
+        # Litet index (företag, år, antal) så att väljarna slipper läsa alla värden
+        test_data["meta"]["index"] = build_meta_index(test_data)
+        
+        # Spara under test_data (Firebase eller lokal backend)
+        get_repository().save_test_data(test_data)
+        
+        # Exportera läsoptimerad Parquet-snapshot av samma data
+        if pyarrow_available():
+            try:
+                files_written = export_snapshot(test_data)
+                st.info(f"📦 Parquet-snapshot uppdaterad ({files_written} filer)")
+            except Exception as e:
+                st.warning(f"⚠️ Kunde inte exportera Parquet-snapshot: {e}")
+        
+        # Säsongsdatan kan även bygga på snapshoten - töm båda nivåerna
+        from pages_seasonal_analysis import clear_seasonal_cache
+        clear_seasonal_cache()
         
         # Visa kategoriseringssammanfattning
         category_counts = {}
@@ -456,16 +472,15 @@ def save_test_data_to_firebase(df: pd.DataFrame) -> bool:
         st.error(f"❌ Fel vid sparande till Firebase: {e}")
         return False
 
+@instrument("loader")
 def load_test_companies():
     """Ladda test-företag från Firebase"""
     try:
-        firebase_db = get_firebase_db()
-        companies_ref = firebase_db.get_ref("test_data/companies")
-        data = companies_ref.get(firebase_db._get_token())
+        companies_data = get_repository().get_companies()
         
-        if data and data.val():
+        if companies_data:
             companies = []
-            for company_id, company_data in data.val().items():
+            for company_id, company_data in companies_data.items():
                 companies.append({
                     'id': company_id,
                     'name': company_data['name'],
@@ -478,35 +493,31 @@ def load_test_companies():
         st.error(f"❌ Fel vid laddning av företag: {e}")
         return []
 
+@instrument("loader")
 def load_test_accounts(company_id: str):
     """Ladda test-konton för ett företag"""
     try:
-        firebase_db = get_firebase_db()
-        accounts_ref = firebase_db.get_ref("test_data/accounts")
-        categories_ref = firebase_db.get_ref("test_data/categories")
-        
-        accounts_data = accounts_ref.get(firebase_db._get_token())
-        categories_data = categories_ref.get(firebase_db._get_token())
+        repo = get_repository()
+        # Företagets konton och konton som dess värden pekar på
+        accounts_data = repo.get_value_accounts(company_id)
         
-        if not (accounts_data and accounts_data.val()):
+        if not accounts_data:
             return []
         
         # Skapa kategori-mappning
         categories = {}
-        if categories_data and categories_data.val():
-            for cat_id, cat_data in categories_data.val().items():
-                categories[cat_id] = cat_data['name']
+        for cat_id, cat_data in repo.get_categories().items():
+            categories[cat_id] = cat_data['name']
         
-        # Filtrera konton för företag (enkel version)
+        # Konton för företaget (enkel version)
         accounts = []
-        for account_id, account_data in accounts_data.val().items():
-            if account_data.get('company_id') == company_id:
-                accounts.append({
-                    'id': account_id,
-                    'name': account_data['name'],
-                    'category': categories.get(account_data.get('category_id', ''), 'Okänd'),
-                    'category_id': account_data.get('category_id', '')
-                })
+        for account_id, account_data in accounts_data.items():
+            accounts.append({
+                'id': account_id,
+                'name': account_data['name'],
+                'category': categories.get(account_data.get('category_id', ''), 'Okänd'),
+                'category_id': account_data.get('category_id', '')
+            })
         
         return accounts
         
@@ -514,22 +525,20 @@ def load_test_accounts(company_id: str):
         st.error(f"❌ Fel vid laddning av konton: {e}")
         return []
 
+@instrument("loader")
 def load_test_data_with_categories(company_id: str, year: int = 2025):
     """Ladda test-data med kategorier för ett företag och år - OPTIMERAD VERSION"""
     try:
-        firebase_db = get_firebase_db()
+        repo = get_repository()
         
-        # Hämta ALLT på en gång från test_data root
-        test_data_ref = firebase_db.get_ref("test_data")
-        test_data = test_data_ref.get(firebase_db._get_token())
+        # Endast värden för valt företag och år
+        values = repo.get_values(company_id, [year])
         
-        if not test_data or not test_data.val():
+        if not values:
             return pd.DataFrame()
         
-        data_dict = test_data.val()
-        values = data_dict.get('values', {})
-        accounts = data_dict.get('accounts', {})
-        categories = data_dict.get('categories', {})
+        accounts = repo.get_value_accounts(company_id, values)
+        categories = repo.get_categories()
         
         # Bygg DataFrame med kategorier
         data = []
@@ -590,29 +599,25 @@ def load_test_data_with_categories(company_id: str, year: int = 2025):
         st.error(f"❌ Fel vid laddning av data med kategorier: {e}")
         return pd.DataFrame()
 
+@instrument("loader")
 def load_test_values(company_id: str, year: int = 2025):
     """Ladda test-värden för ett företag och år"""
     try:
-        firebase_db = get_firebase_db()
-        values_ref = firebase_db.get_ref("test_data/values")
-        data = values_ref.get(firebase_db._get_token())
+        data = get_repository().get_values(company_id, [year])
         
-        if not (data and data.val()):
+        if not data:
             return {}
         
-        # Filtrera värden för företag och år
+        # Gruppera värden per konto och månad
         values = {}
-        for value_id, value_data in data.val().items():
-            if (value_data.get('company_id') == company_id and 
-                value_data.get('year') == year):
-                
-                account_id = value_data.get('account_id')
-                month = value_data.get('month')
-                amount = value_data.get('amount', 0)
-                
-                if account_id not in values:
-                    values[account_id] = {}
-                values[account_id][month] = amount
+        for value_id, value_data in data.items():
+            account_id = value_data.get('account_id')
+            month = value_data.get('month')
+            amount = value_data.get('amount', 0)
+            
+            if account_id not in values:
+                values[account_id] = {}
+            values[account_id][month] = amount
         
         return values
         
@@ -624,15 +629,14 @@ def load_budget_values(company_id: str, year: int = 2025):
     """Ladda budget-värden från BUDGET_DATABASE"""
     try:
         firebase_db = get_firebase_db()
-        budget_ref = firebase_db.get_ref(f"BUDGET_DATABASE/{company_id}/{year}/accounts")
-        data = budget_ref.get(firebase_db._get_token())
+        data = firebase_db.get_raw(f"BUDGET_DATABASE/{company_id}/{year}/accounts")
         
-        if not (data and data.val()):
+        if not data:
             return {}
         
         # Läs från ny struktur
         budget_values = {}
-        for account_id, account_data in data.val().items():
+        for account_id, account_data in data.items():
             if 'months' in account_data:
                 budget_values[account_id] = {}
                 for month_idx, month_data in account_data['months'].items():
@@ -675,12 +679,32 @@ def save_single_budget_value(company_id: str, year: int, account_id: str, accoun
         st.error(f"❌ Fel vid sparande av {month_name}: {e}")
         return False
 
+def export_test_data_snapshot() -> int:
+    """Exportera befintlig test_data till Parquet-snapshot. Returnerar antal filer."""
+    try:
+        test_data = get_repository().get_test_data()
+        
+        if not test_data:
+            return 0
+        
+        return export_snapshot(test_data)
+        
+    except Exception as e:
+        st.error(f"❌ Fel vid export av snapshot: {e}")
+        return 0
+
+def migrate_test_data_layout() -> dict:
+    """Migrera befintlig test_data till kompakt layout (12-månadersarrayer per företag och år)"""
+    try:
+        return get_repository().migrate_test_data_layout()
+    except Exception as e:
+        st.error(f"❌ Fel vid migrering av test_data: {e}")
+        return {}
+
 def clear_test_data():
     """Rensa ENDAST Excel test-data från Firebase (behåller budget)"""
     try:
-        firebase_db = get_firebase_db()
-        test_ref = firebase_db.get_ref("test_data")
-        test_ref.remove(firebase_db._get_token())
+        get_repository().clear_test_data()
         
         # RENSA INTE budget-data längre!
         # budget_ref = firebase_db.get_ref("test_budget_data")
@@ -761,6 +785,29 @@ def show_excel_import_test():
             else:
                 st.error("❌ Kunde inte ladda Excel-data")
     
+    if pyarrow_available():
+        if st.button("📦 Exportera Parquet-snapshot", help="Skriv befintlig test_data till lokala Parquet-filer (en per företag och år)"):
+            files_written = export_test_data_snapshot()
+            if files_written:
+                st.success(f"✅ Snapshot exporterad: {files_written} filer")
+            else:
+                st.warning("Ingen test-data att exportera")
+    
+    if st.button("🗂️ Migrera test-data till kompakt layout", help="Skriv om äldre import så att värden lagras per företag och år som 12-månadersarrayer"):
+        result = migrate_test_data_layout()
+        if result.get('migrated'):
+            st.success(f"✅ Migrerat {result['accounts']} konton och {result['values']} värden")
+        elif result:
+            st.info("ℹ️ Test-data har redan kompakt layout (eller saknas)")
+    
+    if st.button("🔥 Värm upp cache", help="Hämta test_data och budgetar för alla företag och förberäkna standardvyerna"):
+        from utils_cache_warmup import run_warmup
+        with st.spinner("🔥 Värmer upp cache..."):
+            # Manuell uppvärmning körs med den inloggade användarens repository
+            status = run_warmup(get_repository())
+        st.success(f"✅ Uppvärmning klar: {status['companies']} företag, {len(status['steps'])} steg "
+                   f"på {status['wall_ms'] / 1000:.1f} s ({status['errors']} fel)")
+    
     # Visa importerad data
     st.markdown("---")
     st.markdown("### 🔍 Importerad data")
@@ -781,18 +828,7 @@ def show_excel_import_test():
             
             # Hämta alla tillgängliga år för detta företag - OPTIMERAD VERSION
             try:
-                firebase_db = get_firebase_db()
-                test_data_ref = firebase_db.get_ref("test_data")
-                test_data = test_data_ref.get(firebase_db._get_token())
-                
-                available_years = set()
-                if test_data and test_data.val():
-                    values_data = test_data.val().get('values', {})
-                    for value_id, value_data in values_data.items():
-                        if value_data.get('company_id') == selected_company_id:
-                            available_years.add(value_data.get('year'))
-                
-                available_years = sorted(list(available_years))
+                available_years = get_repository().get_years(selected_company_id)
                 
                 if available_years:
                     selected_year = st.selectbox(
@@ -819,25 +855,22 @@ def show_excel_import_test():
                 st.dataframe(df_with_categories, use_container_width=True, height=400)
                 st.info(f"📊 Visar {len(df_with_categories)} rader med finansiell data")
             else:
-                st.warning(f"Ingen data hittad för {selected_company_name} år {import_year}")
+                st.warning(f"Ingen data hittad för {selected_company_name} år {selected_year}")
                 
                 # Debug för att se vad som finns
                 st.write("🔍 DEBUG: Kontrollerar vad som finns i databasen...")
                 try:
-                    firebase_db = get_firebase_db()
-                    values_ref = firebase_db.get_ref("test_data/values")
-                    all_values = values_ref.get(firebase_db._get_token())
+                    index = get_repository().get_index()
+                    unique_companies = list(index.keys())
                     
-                    if all_values and all_values.val():
-                        unique_companies = set()
+                    if unique_companies:
                         unique_years = set()
-                        for val_data in all_values.val().values():
-                            unique_companies.add(val_data.get('company_id'))
-                            unique_years.add(val_data.get('year'))
+                        for entry in index.values():
+                            unique_years.update(entry.get('years', []))
                         
-                        st.write(f"📋 Company IDs i databasen: {list(unique_companies)}")
-                        st.write(f"📋 År i databasen: {list(unique_years)}")
-                        st.write(f"🎯 Söker efter: company_id='{selected_company_id}', year={import_year}")
+                        st.write(f"📋 Company IDs i databasen: {unique_companies}")
+                        st.write(f"📋 År i databasen: {sorted(unique_years)}")
+                        st.write(f"🎯 Söker efter: company_id='{selected_company_id}', year={selected_year}")
                 except Exception as e:
                     st.error(f"Debug fel: {e}")
             
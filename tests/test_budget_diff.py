@@ -0,0 +1,62 @@
+"""
+Tester för diff_budget_values (diff-baserad sparning av budget_values)
+
+Användning:
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from models_firebase_database import diff_budget_values
+
+BUDGET_ID = 'budget_1'
+
+def cell(account_id, month, amount, budget_id=BUDGET_ID):
+    return {'budget_id': budget_id, 'account_id': account_id, 'month': month, 'amount': amount}
+
+def test_new_changed_and_unchanged_cells():
+    existing = {'a': cell('acc_1', 1, 100.0), 'b': cell('acc_1', 2, 200.0)}
+    updates, stats = diff_budget_values(existing, BUDGET_ID, {'acc_1': {1: 100.0, 2: 250.0, 3: 300.0}})
+
+    assert stats == {'added': 1, 'changed': 1, 'removed': 0, 'unchanged': 1}
+    assert updates['budget_values/b/amount'] == 250.0
+    assert 'budget_values/b/updated_at' in updates
+    added = updates[f'budget_values/{BUDGET_ID}_acc_1_3']
+    assert (added['account_id'], added['month'], added['amount']) == ('acc_1', 3, 300.0)
+    assert not any(path.startswith('budget_values/a') for path in updates)
+
+def test_duplicate_cells_are_cleaned_up():
+    existing = {'a': cell('acc_1', 1, 100.0), 'dup': cell('acc_1', 1, 100.0)}
+    updates, stats = diff_budget_values(existing, BUDGET_ID, {'acc_1': {1: 100.0}})
+
+    assert updates == {'budget_values/dup': None}
+    assert stats['unchanged'] == 1
+
+def test_zero_amounts_remove_cells_and_are_never_written():
+    existing = {'a': cell('acc_1', 1, 100.0)}
+    updates, stats = diff_budget_values(existing, BUDGET_ID, {'acc_1': {1: 0.0, 2: 0.0, 3: None}})
+
+    assert updates == {'budget_values/a': None}
+    assert stats == {'added': 0, 'changed': 0, 'removed': 1, 'unchanged': 2}
+
+def test_missing_cells_are_removed_unless_partial():
+    existing = {'a': cell('acc_1', 1, 100.0), 'b': cell('acc_2', 5, 50.0)}
+
+    updates, stats = diff_budget_values(existing, BUDGET_ID, {'acc_1': {1: 100.0}})
+    assert updates == {'budget_values/b': None}
+    assert stats['removed'] == 1
+
+    updates, stats = diff_budget_values(existing, BUDGET_ID, {'acc_1': {1: 100.0}}, partial=True)
+    assert updates == {}
+    assert stats['removed'] == 0
+
+def test_other_budgets_and_id_types():
+    existing = {'other': cell('acc_1', 1, 100.0, budget_id='budget_2'), 'a': cell(7, 1, 10.0)}
+    # account_id 7 och '7' är samma cell
+    updates, stats = diff_budget_values(existing, BUDGET_ID, {'7': {1: 10.0}})
+
+    assert updates == {}
+    assert stats == {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 1}
@@ -0,0 +1,65 @@
+"""
+Tester för diffmotorn i utils_grid_diff (budgetredigerarna)
+
+Användning:
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from utils_grid_diff import (MONTH_LABELS, TOLERANCE, CellChange, diff_grids, match_account_ids,
+                             grid_to_updates, apply_changes, long_to_grid)
+
+def grid(rows):
+    """{account_id: [12 belopp]} -> grid med månadskolumner"""
+    return pd.DataFrame([{'account_id': account_id, **dict(zip(MONTH_LABELS, values))}
+                         for account_id, values in rows.items()])
+
+def test_rows_are_matched_on_key_not_position():
+    original = grid({'a': [1.0] * 12, 'b': [2.0] * 12})
+    edited = grid({'b': [2.0] * 12, 'a': [1.0] * 11 + [5.0]})
+
+    assert diff_grids(original, edited) == [CellChange('a', 12, 1.0, 5.0)]
+
+def test_mismatched_id_types_are_matched():
+    original = grid({12: [100.0] * 12, 7.0: [0.0] * 12})
+    edited = grid({'12': [100.0] * 12, '7': [0.0] * 11 + [3.0]})
+
+    # 12 / '12' och 7.0 / '7' är samma konto - bara den verkliga ändringen rapporteras
+    assert diff_grids(original, edited) == [CellChange('7', 12, 0.0, 3.0)]
+
+def test_match_account_ids_uses_reference_values():
+    ids = pd.Series([12, '7', 'kassa', 99])
+    reference = pd.Series(['12', 7, 'kassa'])
+
+    assert match_account_ids(ids, reference).tolist() == ['12', 7, 'kassa', 99]
+
+def test_float_tolerance():
+    values = [1000.0] * 12
+    original = grid({'a': values})
+    edited = grid({'a': [v + TOLERANCE / 10 for v in values[:6]] + [v + 0.01 for v in values[6:]]})
+
+    changes = diff_grids(original, edited)
+    assert [change.month for change in changes] == [7, 8, 9, 10, 11, 12]
+    assert diff_grids(original, edited, atol=0.1) == []
+
+def test_missing_and_empty_cells_count_as_zero():
+    original = grid({'a': [None] * 12})
+    edited = grid({'a': [''] * 11 + ['250'], 'b': [0.0] * 11 + [4.0]})
+
+    assert diff_grids(original, edited) == [CellChange('a', 12, 0.0, 250.0), CellChange('b', 12, 0.0, 4.0)]
+    assert diff_grids(None, None) == []
+
+def test_changes_applied_to_long_format_budget():
+    values = pd.DataFrame({'account_id': ['a', 'a'], 'month': [1, 3], 'amount': [10.0, 30.0]})
+    original = long_to_grid(values)
+    edited = original.copy()
+    edited.loc[0, 'Feb'] = 20.0
+
+    updates = apply_changes(grid_to_updates(original), diff_grids(original, edited))
+    assert [updates['a'][month] for month in (1, 2, 3, 4)] == [10.0, 20.0, 30.0, 0.0]
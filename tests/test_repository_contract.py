@@ -0,0 +1,170 @@
+"""
+Kontraktstester för FinansRepository
+Samma tester körs mot LocalRepository (SQLite i en temporär fil) och mot
+FirebaseRepository via den lokala Firebase-servern (utils_local_firebase).
+
+Användning:
+    python -m pytest -q tests
+"""
+import io
+import sys
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import streamlit as st
+
+from benchmark_loaders import generate_test_data, _quiet_streamlit
+from models_repository import FirebaseRepository, LocalRepository, MONTH_NAMES, compact_test_data
+from utils_local_firebase import LocalFirebaseServer, connect_firebase_db
+from utils_result_cache import clear_result_cache
+
+COMPANY_ID = 'company_1'
+COMPANY_NAME = 'KLAB'
+
+_quiet_streamlit()
+
+@pytest.fixture(params=['local', 'firebase'])
+def repo(request, tmp_path, monkeypatch):
+    """Tomt repository för varje backend"""
+    monkeypatch.setenv('FINANS_DISK_CACHE', '0')
+    clear_result_cache()
+    if request.param == 'local':
+        yield LocalRepository(str(tmp_path / 'finans.db'))
+        return
+    server = LocalFirebaseServer().start()
+    with redirect_stdout(io.StringIO()):
+        firebase_db = connect_firebase_db(server)
+    st.session_state['firebase_db'] = firebase_db
+    try:
+        yield FirebaseRepository(firebase_db)
+    finally:
+        server.stop()
+        clear_result_cache()
+
+@pytest.fixture
+def test_data():
+    return generate_test_data(companies=2, years=2, accounts=6, start_year=2023, seed=7)
+
+def save(repo, test_data):
+    with redirect_stdout(io.StringIO()):
+        repo.save_test_data(test_data)
+
+def value_rows(values):
+    """Värdenas innehåll utan nycklar (nycklarna beror på lagringslayout)"""
+    return sorted((v['account_id'], v['year'], v['month'], v['type'], v['amount']) for v in values.values())
+
+def expected_values(test_data, company_id, years=None):
+    return value_rows({
+        key: value for key, value in test_data['values'].items()
+        if value['company_id'] == company_id and (years is None or value['year'] in years)
+    })
+
+def test_empty_repository(repo):
+    assert repo.get_companies() == {}
+    assert repo.get_accounts() == {}
+    assert repo.get_values(COMPANY_ID) == {}
+    assert repo.get_index() == {}
+    assert repo.get_simple_budgets(COMPANY_NAME, 2025) == {}
+
+def test_save_test_data_round_trip(repo, test_data):
+    save(repo, test_data)
+
+    assert repo.get_companies() == test_data['companies']
+    assert repo.get_categories() == test_data['categories']
+    assert repo.get_accounts() == test_data['accounts']
+    assert repo.get_accounts(COMPANY_ID) == {
+        key: account for key, account in test_data['accounts'].items() if account['company_id'] == COMPANY_ID
+    }
+    assert value_rows(repo.get_values(COMPANY_ID)) == expected_values(test_data, COMPANY_ID)
+    assert repo.get_years(COMPANY_ID) == [2023, 2024]
+
+def test_get_values_filters_years(repo, test_data):
+    save(repo, test_data)
+
+    assert value_rows(repo.get_values(COMPANY_ID, [2024])) == expected_values(test_data, COMPANY_ID, [2024])
+    assert value_rows(repo.get_values(COMPANY_ID, [2023, 2024])) == expected_values(test_data, COMPANY_ID)
+    assert repo.get_values(COMPANY_ID, [1999]) == {}
+
+def test_get_index(repo, test_data):
+    save(repo, test_data)
+
+    index = repo.get_index()
+    assert set(index) == set(test_data['companies'])
+    entry = index[COMPANY_ID]
+    assert entry['name'] == COMPANY_NAME
+    assert entry['years'] == [2023, 2024]
+    assert entry['accounts'] == 6
+    assert entry['values'] == len(expected_values(test_data, COMPANY_ID))
+
+def test_clear_test_data(repo, test_data):
+    save(repo, test_data)
+    with redirect_stdout(io.StringIO()):
+        repo.clear_test_data()
+
+    assert repo.get_companies() == {}
+    assert repo.get_values(COMPANY_ID) == {}
+
+def test_simple_budget_round_trip(repo):
+    rent = {month: 1000.0 * i for i, month in enumerate(MONTH_NAMES, 1)}
+    repo.save_simple_budget(COMPANY_NAME, 2025, 'Hyra', rent)
+
+    assert repo.get_simple_budget(COMPANY_NAME, 2025, 'Hyra') == rent
+    assert repo.get_simple_budget(COMPANY_NAME, 2025, 'Saknas') == {}
+    assert repo.get_simple_budgets(COMPANY_NAME, 2026) == {}
+
+def test_save_simple_budgets(repo):
+    salaries = {month: 50000.0 for month in MONTH_NAMES}
+    sales = {**{month: 0.0 for month in MONTH_NAMES}, 'Dec': 90000.0}
+    repo.save_simple_budgets(COMPANY_NAME, 2025, {'Löner': salaries, 'Försäljning': sales})
+
+    assert repo.get_simple_budgets(COMPANY_NAME, 2025) == {'Löner': salaries, 'Försäljning': sales}
+
+def test_save_simple_budget_cells_keeps_other_months(repo):
+    rent = {month: 1000.0 for month in MONTH_NAMES}
+    repo.save_simple_budget(COMPANY_NAME, 2025, 'Hyra', rent)
+    repo.save_simple_budget_cells(COMPANY_NAME, 2025, {'Hyra': {'Mar': 2500.0}, 'El': {'Jan': 300.0}})
+
+    budgets = repo.get_simple_budgets(COMPANY_NAME, 2025)
+    assert budgets['Hyra'] == {**rent, 'Mar': 2500.0}
+    assert budgets['El'] == {**{month: 0.0 for month in MONTH_NAMES}, 'Jan': 300.0}
+
+def point_values_at(test_data, company_id, account_id):
+    """Låt ett företags värden peka på ett annat företags konto (som Excel-importen kan göra)"""
+    for value in test_data['values'].values():
+        if value['company_id'] == company_id:
+            value['account_id'] = account_id
+    return test_data
+
+def test_value_accounts_include_other_companies_accounts(repo, test_data):
+    save(repo, point_values_at(test_data, 'company_2', 'account_1'))
+
+    values = repo.get_values('company_2', [2024])
+    for accounts in (repo.get_value_accounts('company_2', values), repo.get_value_accounts('company_2')):
+        assert accounts['account_1'] == test_data['accounts']['account_1']
+        assert all(value['account_id'] in accounts for value in values.values())
+    # get_accounts(company_id) är fortfarande bara företagets egna konton
+    assert 'account_1' not in repo.get_accounts('company_2')
+
+@pytest.mark.parametrize('repo', ['firebase'], indirect=True)
+def test_migration_copies_referenced_accounts_into_partitions(repo, test_data):
+    # Äldre kompakt layout: varje konto bara under ägarens partition
+    raw = compact_test_data(point_values_at(test_data, 'company_2', 'account_1'))
+    raw['accounts'] = {
+        company_id: {key: account for key, account in accounts.items() if account['company_id'] == company_id}
+        for company_id, accounts in raw['accounts'].items()
+    }
+    repo.firebase_db.get_ref("test_data").set(raw, repo.firebase_db._get_token())
+
+    with redirect_stdout(io.StringIO()):
+        assert repo.migrate_test_data_layout()['migrated'] is True
+        assert repo.migrate_test_data_layout()['migrated'] is False
+
+    partition = repo.firebase_db.get_raw("test_data/accounts/company_2")
+    assert partition['account_1'] == test_data['accounts']['account_1']
+    assert 'account_1' in repo.get_value_accounts('company_2')
+    assert 'account_1' not in repo.get_accounts('company_2')
@@ -0,0 +1,91 @@
+"""
+Tester för SingleFlight (sammanslagning av samtidiga hämtningar)
+
+Användning:
+    python -m pytest -q tests
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from utils_singleflight import SingleFlight
+
+WAITERS = 4
+
+def wait_until(condition, timeout=5.0):
+    """Vänta tills condition() är sant (eller timeout)"""
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timeout i väntan på villkor"
+        time.sleep(0.01)
+
+def run_concurrently(flight, key, fn):
+    """Starta ledaren, låt WAITERS anrop ansluta och returnera (trådar, resultat)"""
+    results = [None] * (WAITERS + 1)
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(WAITERS + 1)]
+    threads[0].start()
+    wait_until(lambda: flight.stats()['in_flight'] == 1)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flight.stats()['coalesced'] == WAITERS)
+    return threads, results
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return b'data'
+
+    threads, results = run_concurrently(flight, 'node', fetch)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [b'data'] * (WAITERS + 1)
+    assert flight.stats() == {'leaders': 1, 'coalesced': WAITERS, 'errors': 0, 'in_flight': 0}
+
+def test_errors_propagate_to_waiters():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ConnectionError("nätverksfel")
+
+    threads, results = run_concurrently(flight, 'node', fetch)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert flight.stats() == {'leaders': 1, 'coalesced': WAITERS, 'errors': 1, 'in_flight': 0}
+
+    # Felet cachas inte - nästa anrop gör en ny hämtning
+    assert flight.do('node', lambda: b'ok') == b'ok'
+    assert flight.stats()['leaders'] == 2
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do('c', lambda: int('x'))
+    assert flight.stats() == {'leaders': 3, 'coalesced': 0, 'errors': 1, 'in_flight': 0}
@@ -0,0 +1,137 @@
+"""
+Tester för write-behind-kön (journal, sammanslagning, backoff och omförsök)
+
+Användning:
+    python -m pytest -q tests
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import utils_write_behind
+from utils_write_behind import (WriteJournal, WriteBehindQueue, PENDING, SYNCING, SYNCED, FAILED,
+                                MAX_ATTEMPTS, MAX_BACKOFF)
+
+OWNER = 'user_1'
+KIND = 'test_cell'
+
+@pytest.fixture
+def journal():
+    return WriteJournal(":memory:")
+
+@pytest.fixture
+def handler(monkeypatch):
+    """Registrerad handler som sparar batcharna och kan fås att misslyckas"""
+    class Handler:
+        def __init__(self):
+            self.batches = []
+            self.error = None
+
+        def __call__(self, payloads):
+            if self.error:
+                raise self.error
+            self.batches.append(payloads)
+
+    handler = Handler()
+    monkeypatch.setitem(utils_write_behind._handlers, KIND, handler)
+    return handler
+
+def retry_delay(journal, key):
+    """Sekunder kvar till nästa försök"""
+    retry_at = journal._conn.execute("SELECT retry_at FROM journal WHERE key = ?", (key,)).fetchone()[0]
+    return retry_at - time.time()
+
+def expire_backoff(journal):
+    """Låtsas att backoff-tiden har passerat"""
+    with journal._conn:
+        journal._conn.execute("UPDATE journal SET retry_at = 0")
+
+def test_repeated_edits_are_coalesced(journal):
+    assert journal.put(OWNER, KIND, 'a_1', {'amount': 1}) == 'queued'
+    assert journal.put(OWNER, KIND, 'a_1', {'amount': 2}) == 'coalesced'
+    assert journal.put(OWNER, KIND, 'a_1', {'amount': 2}) is None
+    assert journal.put(OWNER, KIND, 'a_2', {'amount': 5}) == 'queued'
+
+    batch = journal.take_batch(OWNER, [KIND])
+    assert sorted((key, payload['amount']) for _, key, payload, _ in batch) == [('a_1', 2), ('a_2', 5)]
+    assert journal.counts(OWNER)[SYNCING] == 2
+
+def test_edit_during_sync_is_not_marked_synced(journal):
+    journal.put(OWNER, KIND, 'a_1', {'amount': 1})
+    batch = journal.take_batch(OWNER, [KIND])
+    # Ny ändring medan den gamla skickas
+    assert journal.put(OWNER, KIND, 'a_1', {'amount': 3}) == 'coalesced'
+    journal.mark_synced(OWNER, batch)
+
+    status = journal.statuses(OWNER, KIND)['a_1']
+    assert (status['status'], status['payload']) == (PENDING, {'amount': 3})
+
+def test_flush_sends_one_batch_per_kind(journal, handler):
+    queue = WriteBehindQueue(OWNER, journal)
+    for month in range(1, 4):
+        journal.put(OWNER, KIND, f'a_{month}', {'month': month})
+    journal.put(OWNER, 'unregistered', 'x', {'month': 1})
+
+    assert queue.flush() == 3
+    assert len(handler.batches) == 1 and len(handler.batches[0]) == 3
+    assert {s['status'] for s in queue.statuses(KIND).values()} == {SYNCED}
+    # Typer utan handler ligger kvar som pending
+    assert journal.statuses(OWNER, 'unregistered')['x']['status'] == PENDING
+
+def test_failed_batches_back_off_then_fail(journal, handler):
+    queue = WriteBehindQueue(OWNER, journal)
+    journal.put(OWNER, KIND, 'a_1', {'amount': 1})
+    handler.error = ConnectionError("nätverksfel")
+
+    delays = []
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        assert queue.flush() == 1
+        status = queue.statuses(KIND)['a_1']
+        assert status['attempts'] == attempt
+        assert status['error'] == "nätverksfel"
+        if attempt < MAX_ATTEMPTS:
+            assert status['status'] == PENDING
+            delays.append(retry_delay(journal, 'a_1'))
+            # Inte redo förrän backoff-tiden passerat
+            assert queue.flush() == 0
+            expire_backoff(journal)
+
+    assert queue.statuses(KIND)['a_1']['status'] == FAILED
+    assert delays == sorted(delays) and delays[0] > 1 and delays[-1] <= MAX_BACKOFF
+    assert queue.flush() == 0
+    assert queue.stats()['retries'] == MAX_ATTEMPTS
+
+def test_failed_entries_can_be_retried(journal, handler):
+    queue = WriteBehindQueue(OWNER, journal)
+    journal.put(OWNER, KIND, 'a_1', {'amount': 1})
+    handler.error = ConnectionError("nätverksfel")
+    for _ in range(MAX_ATTEMPTS):
+        queue.flush()
+        expire_backoff(journal)
+    assert journal.counts(OWNER)[FAILED] == 1
+
+    assert journal.retry_failed(OWNER) == 1
+    status = journal.statuses(OWNER, KIND)['a_1']
+    assert (status['status'], status['attempts']) == (PENDING, 0)
+
+    handler.error = None
+    assert queue.flush() == 1
+    assert handler.batches == [[{'amount': 1}]]
+    assert journal.counts(OWNER)[SYNCED] == 1
+
+def test_unsent_entries_survive_restart(tmp_path, handler):
+    path = tmp_path / "journal.db"
+    journal = WriteJournal(path)
+    journal.put(OWNER, KIND, 'a_1', {'amount': 1})
+    journal.take_batch(OWNER, [KIND])
+    journal._conn.close()
+
+    # Ny process: poster som var på väg skickas igen
+    queue = WriteBehindQueue(OWNER, WriteJournal(path))
+    assert queue.flush() == 1
+    assert handler.batches == [[{'amount': 1}]]
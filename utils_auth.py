@@ -9,12 +9,20 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Ladda miljövariabler från .env fil (lokalt) eller Streamlit secrets (cloud)
+# Miljövariabler från .env fil (lokalt) eller Streamlit secrets (cloud) - .env laddas vid första behov
 env_path = Path(__file__).parent / '.env'
-load_dotenv(env_path)
+_env_loaded = False
+
+def _load_env() -> None:
+    """Ladda .env-filen en gång"""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv(env_path)
+        _env_loaded = True
 
 def get_env_var(key: str) -> str:
     """Hämta miljövariabel från .env eller Streamlit secrets"""
+    _load_env()
     # Först försök vanliga miljövariabler
     value = os.getenv(key)
     if value:
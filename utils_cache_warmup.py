@@ -0,0 +1,176 @@
+"""
+Uppvärmning av cachen efter deploy/omstart
+Hämtar test_data och budgetar för alla företag, bygger företagens gemensamma DataFrames
+och förberäknar standardvyerna för Säsongsanalys och Visualisering v2. Resultaten hamnar
+i diskcachen och - när jobbet körs i appens process - i minnescachen så att första
+användaren slipper hämta från Firebase. Jobbet har eget repository och egna
+inloggningsuppgifter och rör aldrig någon användares session. Varje steg loggas med tid
+och senaste körning sparas i data/cache/warmup_status.json.
+
+Användning:
+    FINANS_WARMUP=1 streamlit run streamlit_app.py   # i appens process vid första sidladdningen
+    python utils_cache_warmup.py                     # separat körning, fyller bara diskcachen
+    python utils_cache_warmup.py --interval 1800     # schemalagd, var 30:e minut
+Mot Firebase krävs FINANS_WARMUP_EMAIL och FINANS_WARMUP_PASSWORD.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Callable
+
+from utils_instrumentation import record_event
+
+STATUS_FILE = Path(__file__).parent / "data" / "cache" / "warmup_status.json"
+
+def _step(status: Dict[str, Any], name: str, fn: Callable[[], Any]) -> Any:
+    """Kör ett steg, logga tiden och spara resultatet i status (fel avbryter inte uppvärmningen)"""
+    start = time.perf_counter()
+    try:
+        result = fn()
+        error = None
+    except Exception as e:
+        result, error = None, str(e)
+    wall_ms = (time.perf_counter() - start) * 1000
+    status['steps'].append({'step': name, 'wall_ms': round(wall_ms, 1), 'error': error})
+    record_event('warmup', name, wall_ms)
+    if error:
+        print(f"⚠️ Uppvärmning: {name} misslyckades efter {wall_ms:.0f} ms: {error}")
+    else:
+        print(f"🔥 Uppvärmning: {name} ({wall_ms:.0f} ms)")
+    return result
+
+def create_warmup_repository():
+    """
+    Eget repository för uppvärmningen: lokal backend direkt, Firebase med en token från
+    FINANS_WARMUP_EMAIL/FINANS_WARMUP_PASSWORD. None om inloggningsuppgifter saknas.
+    """
+    from utils_auth import FirebaseAuth, get_env_var
+    from models_repository import FirebaseRepository, create_repository
+    from models_firebase_database import FirebaseDB
+
+    backend = (get_env_var("FINANS_STORAGE_BACKEND") or "firebase").lower()
+    if backend in ("local", "sqlite"):
+        return create_repository(backend)
+    email, password = get_env_var("FINANS_WARMUP_EMAIL"), get_env_var("FINANS_WARMUP_PASSWORD")
+    if not email or not password:
+        print("❌ Uppvärmning kräver FINANS_WARMUP_EMAIL och FINANS_WARMUP_PASSWORD för Firebase")
+        return None
+    result = FirebaseAuth().sign_in(email, password)
+    if not result.get('success'):
+        print(f"❌ Uppvärmning: inloggning misslyckades: {result.get('error')}")
+        return None
+    return FirebaseRepository(FirebaseDB(token=result['user']['idToken']))
+
+def run_warmup(repo, status_path: Optional[Path] = STATUS_FILE) -> Dict[str, Any]:
+    """Värm upp cachen för alla företag med givet repository. Returnerar status med tid per steg."""
+    from models_repository import use_repository
+
+    # Sidornas laddare hämtar repository via get_repository() - peka om dem till jobbets
+    with use_repository(repo):
+        return _run_warmup(repo, status_path)
+
+def _run_warmup(repo, status_path: Optional[Path]) -> Dict[str, Any]:
+    from pages_seasonal_analysis import get_company_slice, get_accounts_list
+    from pages_visualization2 import get_visualization_data
+
+    status = {'started_at': datetime.now().isoformat(), 'steps': [], 'companies': 0}
+    start = time.perf_counter()
+
+    # 1. Import-bloben och meta-index
+    _step(status, "test_data", repo.get_test_data)
+    index = _step(status, "index", repo.get_index) or {}
+    status['companies'] = len(index)
+
+    for company_id, entry in index.items():
+        name = entry.get('name', company_id)
+        years: List[int] = sorted(int(y) for y in entry.get('years', []))
+
+        # 2. Budgetar per år
+        for year in years:
+            _step(status, f"{name} budget {year}", lambda: repo.get_simple_budgets(name, year))
+
+        # 3. Gemensamma frames och standardvyer (senaste året är förvalt på sidorna)
+        _step(status, f"{name} säsongsdata", lambda: get_company_slice(company_id))
+        _step(status, f"{name} kontolista", lambda: get_accounts_list(company_id))
+        if years:
+            _step(status, f"{name} visualisering {years[-1]}", lambda: get_visualization_data(company_id, years[-1]))
+
+    status['wall_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    status['errors'] = sum(1 for s in status['steps'] if s['error'])
+    status['finished_at'] = datetime.now().isoformat()
+    print(f"✅ Uppvärmning klar: {status['companies']} företag, {len(status['steps'])} steg, "
+          f"{status['wall_ms']:.0f} ms, {status['errors']} fel")
+
+    if status_path:
+        try:
+            status_path = Path(status_path)
+            status_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(status_path, 'w', encoding='utf-8') as f:
+                json.dump(status, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"⚠️ Kunde inte spara uppvärmningsstatus: {e}")
+    return status
+
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_warmup() -> bool:
+    """
+    Starta uppvärmningen EN gång per serverprocess i en bakgrundstråd (FINANS_WARMUP=1).
+    Körs i appens process så att resultaten hamnar i minnescachen som sessionerna delar.
+    Tråden har eget repository och ingen sessionskontext.
+    """
+    global _background_started
+    if os.getenv("FINANS_WARMUP", "0").lower() not in ("1", "true", "yes"):
+        return False
+    with _background_lock:
+        if _background_started:
+            return False
+        _background_started = True
+
+    def run() -> None:
+        try:
+            repo = create_warmup_repository()
+            if repo is not None:
+                run_warmup(repo)
+        except Exception as e:
+            print(f"❌ Uppvärmning i bakgrunden misslyckades: {e}")
+
+    threading.Thread(target=run, name="finans-warmup", daemon=True).start()
+    print("🔥 Värmer upp cachen i bakgrunden...")
+    return True
+
+def load_warmup_status(status_path: Path = STATUS_FILE) -> Dict[str, Any]:
+    """Senaste uppvärmningens status (tom dict om den aldrig körts)"""
+    try:
+        with open(status_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Värm upp cachen (test_data, budgetar, standardvyer)")
+    parser.add_argument("--interval", type=float, default=0, help="Kör om var N:e sekund (0 = en gång)")
+    args = parser.parse_args(argv)
+
+    while True:
+        # Token gäller en timme - nytt repository (och inloggning) inför varje körning
+        try:
+            repo = create_warmup_repository()
+        except Exception as e:
+            print(f"❌ Uppvärmning: kunde inte läsa konfiguration: {e}")
+            return 1
+        if repo is None:
+            return 1
+        status = run_warmup(repo)
+        if args.interval <= 0:
+            return 1 if status['errors'] else 0
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Beständig diskcache (SQLite) bakom resultatcachen i minnet
+Överlever omstarter, deploy och sleep/wake - första användaren efter en omstart får
+cachad latens. Poster har TTL, filen har ett storlekstak (LRU-vräkning) och varje post
+sparas med dataversioner som räknas upp vid import/sparning så att inaktuella poster
+ignoreras. Avstängd med FINANS_DISK_CACHE=0.
+"""
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "data" / "cache" / "result_cache.db"
+DEFAULT_MAX_MB = 512
+DEFAULT_TTL = 3600
+
+# Datakällor som cachade resultat kan bero på (versioneras var för sig)
+TAG_TEST_DATA = "test_data"
+TAG_SIMPLE_BUDGETS = "simple_budgets"
+ALL_TAGS = (TAG_TEST_DATA, TAG_SIMPLE_BUDGETS)
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def disk_cache_ttl() -> float:
+    """TTL för diskposter i sekunder (FINANS_DISK_CACHE_TTL)"""
+    return _env_float("FINANS_DISK_CACHE_TTL", DEFAULT_TTL)
+
+class DiskCache:
+    """SQLite-fil med picklade värden, TTL, storlekstak och versioner per datakälla"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY, version TEXT NOT NULL, value BLOB NOT NULL,
+        size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed);
+    CREATE TABLE IF NOT EXISTS versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL);
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = str(path or DEFAULT_CACHE_PATH)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(_env_float("FINANS_DISK_CACHE_MAX_MB", DEFAULT_MAX_MB) * 1024 * 1024)
+        # En delad anslutning skyddad av lås (som LocalRepository)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Nollställ räknare"""
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'errors': 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Kopia av räknarna samt filens innehåll"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {**self._stats, 'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+
+    def versions(self, tags: Iterable[str] = ALL_TAGS) -> Dict[str, int]:
+        """Aktuell version per datakälla {tag: version} (0 om aldrig uppräknad)"""
+        tags = sorted(tags)
+        with self._lock:
+            rows = dict(self._conn.execute(
+                f"SELECT tag, version FROM versions WHERE tag IN ({','.join('?' * len(tags))})", tags
+            ).fetchall()) if tags else {}
+        return {tag: rows.get(tag, 0) for tag in tags}
+
+    def version(self, tags: Iterable[str] = ALL_TAGS) -> str:
+        """Aktuell version för datakällorna, t.ex. 'simple_budgets=3,test_data=7'"""
+        return format_version(self.versions(tags))
+
+    def bump(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Räkna upp versionen - poster som byggts på äldre data blir inaktuella. Returnerar nya versioner."""
+        with self._lock, self._conn:
+            for tag in tags:
+                self._conn.execute(
+                    "INSERT INTO versions (tag, version) VALUES (?, 1) "
+                    "ON CONFLICT(tag) DO UPDATE SET version = version + 1", (tag,)
+                )
+            # Poster som inte matchar nya versionen kan aldrig träffas igen
+            current = {tag: v for tag, v in self._conn.execute("SELECT tag, version FROM versions")}
+            for key, version in self._conn.execute("SELECT key, version FROM entries").fetchall():
+                parts = dict(part.split("=", 1) for part in version.split(",") if "=" in part)
+                if any(int(parts[tag]) != current.get(tag, 0) for tag in parts if tag in tags):
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return {tag: current.get(tag, 0) for tag in tags}
+
+    def get(self, key: str, version: str) -> Tuple[bool, Any]:
+        """(True, värde) om posten finns, inte gått ut och har rätt version"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT version, value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return False, None
+            if row[0] != version or row[2] < now:
+                with self._conn:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            with self._conn:
+                self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        try:
+            value = pickle.loads(row[1])
+        except Exception as e:
+            print(f"⚠️ Trasig post i diskcache ({e}) - ignoreras")
+            with self._lock:
+                self._stats['errors'] += 1
+            return False, None
+        with self._lock:
+            self._stats['hits'] += 1
+        return True, value
+
+    def put(self, key: str, value: Any, ttl: float, version: str) -> None:
+        """Spara och vräk äldst använda poster tills filen är under taket"""
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"⚠️ Kunde inte spara i diskcache: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, version, value, size, expires, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, version, sqlite3.Binary(blob), len(blob), now + ttl, now)
+            )
+            total = self._conn.execute("SELECT SUM(size) FROM entries").fetchone()[0] or 0
+            if total <= self.max_bytes:
+                return
+            for old_key, size in self._conn.execute(
+                "SELECT key, size FROM entries WHERE key != ? ORDER BY accessed", (key,)
+            ).fetchall():
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                self._stats['evictions'] += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self) -> None:
+        """Töm alla poster (versionerna behålls)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+
+_disk_cache: Optional[DiskCache] = None
+_disk_cache_lock = threading.Lock()
+_disk_cache_failed = False
+# Versioner i processen - läses utan disk-I/O vid varje cacheuppslag. Med diskcache
+# synkas de mot filen när disknivån ändå används (och vid uppräkning).
+_local_versions: Dict[str, int] = {}
+
+def get_disk_cache() -> Optional[DiskCache]:
+    """Processens diskcache (skapas vid första användning), None om avstängd eller otillgänglig"""
+    global _disk_cache, _disk_cache_failed
+    if os.getenv("FINANS_DISK_CACHE", "1").lower() in ("0", "false", "no") or _disk_cache_failed:
+        return None
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                try:
+                    _disk_cache = DiskCache(os.getenv("FINANS_DISK_CACHE_PATH"))
+                except Exception as e:
+                    print(f"⚠️ Diskcache otillgänglig: {e}")
+                    _disk_cache_failed = True
+                    return None
+    return _disk_cache
+
+def cache_scope() -> str:
+    """Vilken databas cachade resultat kommer från (backend + URL/fil)"""
+    from models_firebase_database import get_env_var
+    backend = (get_env_var("FINANS_STORAGE_BACKEND") or "firebase").lower()
+    if backend in ("local", "sqlite"):
+        return f"local:{get_env_var('FINANS_LOCAL_DB') or ''}"
+    return f"firebase:{get_env_var('FIREBASE_DATABASE_URL') or ''}"
+
+def disk_key(namespace: str, scope: str, args: Any) -> str:
+    """Stabil nyckel för diskposten"""
+    return hashlib.sha256(repr((namespace, scope, args)).encode('utf-8')).hexdigest()
+
+def format_version(versions: Dict[str, int]) -> str:
+    """Versionssträng för datakällorna, t.ex. 'simple_budgets=3,test_data=7'"""
+    return ",".join(f"{tag}={versions[tag]}" for tag in sorted(versions))
+
+def data_version(tags: Iterable[str] = ALL_TAGS) -> str:
+    """Processens aktuella version för datakällorna (ren minnesläsning - används vid varje uppslag)"""
+    return format_version({tag: _local_versions.get(tag, 0) for tag in tags})
+
+def sync_data_version(cache: DiskCache, tags: Iterable[str] = ALL_TAGS) -> str:
+    """
+    Version från diskcachen - anropas bara när disknivån används. Har en annan process
+    (uppvärmning, andra servrar) räknat upp en datakälla tas versionen in i processen och
+    minnesposter som bygger på den tas bort.
+    """
+    tags = tuple(tags)
+    try:
+        versions = cache.versions(tags)
+    except Exception as e:
+        print(f"⚠️ Kunde inte läsa cacheversion: {e}")
+        return data_version(tags)
+    with _disk_cache_lock:
+        changed = [tag for tag in tags if _local_versions.get(tag, 0) != versions[tag]]
+        _local_versions.update(versions)
+    if changed:
+        from utils_result_cache import invalidate_result_cache
+        invalidate_result_cache(changed)
+    return format_version(versions)
+
+def bump_data_version(*tags: str) -> None:
+    """
+    Anropas efter import eller sparning - gör poster för datakällorna inaktuella på disk
+    och i minnet (poster för andra datakällor behålls)
+    """
+    tags = tags or ALL_TAGS
+    with _disk_cache_lock:
+        for tag in tags:
+            _local_versions[tag] = _local_versions.get(tag, 0) + 1
+    cache = get_disk_cache()
+    if cache is not None:
+        try:
+            # Filens versioner gäller (delas med andra processer)
+            versions = cache.bump(tags)
+            with _disk_cache_lock:
+                _local_versions.update(versions)
+        except Exception as e:
+            print(f"⚠️ Kunde inte uppdatera cacheversion: {e}")
+    from utils_result_cache import invalidate_result_cache
+    invalidate_result_cache(tags)
+
+def get_disk_cache_stats() -> Dict[str, int]:
+    """Räknare för diskcachen (tom dict om avstängd)"""
+    cache = get_disk_cache()
+    return cache.stats() if cache is not None else {}
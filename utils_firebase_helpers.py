@@ -9,6 +9,9 @@ import plotly.graph_objects as go
 import streamlit as st
 
 from models_firebase_database import get_firebase_db
+from utils_instrumentation import instrument
+from utils_result_cache import bounded_cache
+from models_dimension_index import get_firebase_dimension_index
 
 def get_companies() -> List[Dict]:
     """Hämta alla företag"""
@@ -33,187 +36,143 @@ def get_years_for_company(company_id: str) -> List[int]:
     
     return sorted(list(years))
 
-def get_financial_data(company_id: str, year: int, value_type: str = "faktiskt") -> pd.DataFrame:
-    """
-    Hämta finansiell data för ett företag och år
-    Returnerar DataFrame med kolumner: account_name, category, month, amount
-    """
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+
+FRAME_COLUMNS = ['account_id', 'account_name', 'category', 'month', 'amount', 'value_type']
+
+@bounded_cache(ttl=300)
+def _load_financial_frame(company_id: str, year: int) -> pd.DataFrame:
+    """Läs dataset, värden, konton och kategorier EN gång och joina till en typad DataFrame"""
     firebase_db = get_firebase_db()
     
     # Hämta datasets för företaget och året
     datasets = firebase_db.get_datasets(company_id)
-    target_dataset_id = None
-    for dataset_id, dataset_data in datasets.items():
-        if dataset_data.get('year') == year:
-            target_dataset_id = dataset_id
-            break
-    
+    target_dataset_id = next(
+        (dataset_id for dataset_id, dataset_data in datasets.items() if dataset_data.get('year') == year),
+        None
+    )
     if not target_dataset_id:
-        return pd.DataFrame(columns=['account_name', 'category', 'month', 'amount'])
+        return pd.DataFrame(columns=FRAME_COLUMNS).astype(FinancialFrame.DTYPES)
     
-    # Hämta värden för dataset
     values = firebase_db.get_values(dataset_id=target_dataset_id)
-    
-    # Hämta referensdata
     accounts = firebase_db.get_accounts()
     categories = firebase_db.get_account_categories()
     
-    # Bygg DataFrame
-    data = []
-    for value_id, value_data in values.items():
-        if value_data.get('value_type') != value_type:
-            continue
-            
-        account_id = value_data.get('account_id')
-        account_data = accounts.get(account_id, {})
-        
-        category_id = account_data.get('category_id')
-        category_data = categories.get(category_id, {})
-        
-        data.append({
-            'account_name': account_data.get('name', 'Okänt konto'),
-            'category': category_data.get('name', 'Okänd kategori'),
-            'month': value_data.get('month'),
-            'amount': value_data.get('amount', 0)
-        })
-    
-    df = pd.DataFrame(data)
+    df = pd.DataFrame.from_records(
+        [(v.get('account_id'), v.get('month'), v.get('amount', 0), v.get('value_type')) for v in values.values()],
+        columns=['account_id', 'month', 'amount', 'value_type']
+    )
     
-    if not df.empty:
-        df = df.sort_values(['category', 'account_name', 'month'])
+    # Join mot konton och kategorier med uppslagstabeller istället för per rad
+    account_names = {account_id: a.get('name', 'Okänt konto') for account_id, a in accounts.items()}
+    account_categories = {account_id: a.get('category_id') for account_id, a in accounts.items()}
+    category_names = {category_id: c.get('name', 'Okänd kategori') for category_id, c in categories.items()}
     
-    return df
+    df['account_name'] = df['account_id'].map(account_names).fillna('Okänt konto')
+    df['category'] = df['account_id'].map(account_categories).map(category_names).fillna('Okänd kategori')
+    df['month'] = pd.to_numeric(df['month'], errors='coerce').fillna(0)
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0)
+    return df[FRAME_COLUMNS].astype(FinancialFrame.DTYPES)
 
-def calculate_monthly_summary(company_id: str, year: int) -> Dict:
+class FinancialFrame:
     """
-    Beräkna månatlig sammanfattning (intäkter, kostnader, resultat)
+    Alla värden för ett företag och år, joinade mot konton och kategorier en gång.
+    Hjälpfunktionerna nedan är billiga vyer över samma DataFrame.
     """
-    firebase_db = get_firebase_db()
-    
-    # Hämta datasets för företaget och året
-    datasets = firebase_db.get_datasets(company_id)
-    target_dataset_id = None
-    for dataset_id, dataset_data in datasets.items():
-        if dataset_data.get('year') == year:
-            target_dataset_id = dataset_id
-            break
     
-    if not target_dataset_id:
-        # Returnera tom data
-        month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun',
-                       'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+    # Numeriska kolumner typas, textkolumner behåller pandas standardtyp
+    DTYPES = {'month': 'int64', 'amount': 'float64'}
+    
+    def __init__(self, company_id: str, year: int, df: pd.DataFrame):
+        self.company_id = company_id
+        self.year = year
+        self.df = df
+    
+    @classmethod
+    def load(cls, company_id: str, year: int) -> "FinancialFrame":
+        """Hämta (cachad) frame för företag och år"""
+        return cls(company_id, year, _load_financial_frame(company_id, year))
+    
+    @property
+    def empty(self) -> bool:
+        return self.df.empty
+    
+    def actuals(self, value_type: str = "faktiskt") -> pd.DataFrame:
+        """Rader för en värdetyp"""
+        return self.df[self.df['value_type'] == value_type]
+    
+    def financial_data(self, value_type: str = "faktiskt") -> pd.DataFrame:
+        """account_name, category, month, amount sorterat per kategori, konto och månad"""
+        df = self.actuals(value_type)[['account_name', 'category', 'month', 'amount']]
+        return df.sort_values(['category', 'account_name', 'month']).reset_index(drop=True)
+    
+    def monthly_totals(self, category: str, value_type: str = "faktiskt") -> List[float]:
+        """Summa per månad (Jan-Dec) för en kategori"""
+        df = self.actuals(value_type)
+        sums = df[df['category'] == category].groupby('month')['amount'].sum()
+        return sums.reindex(range(1, 13), fill_value=0.0).tolist()
+    
+    def monthly_summary(self) -> Dict:
+        """Intäkter, kostnader och resultat per månad"""
+        revenues = self.monthly_totals('Intäkter')
+        expenses = self.monthly_totals('Kostnader')
+        results = [rev - exp for rev, exp in zip(revenues, expenses)]
         return {
-            'months': month_names,
-            'revenues': [0] * 12,
-            'expenses': [0] * 12,
-            'results': [0] * 12,
-            'total_revenue': 0,
-            'total_expense': 0,
-            'total_result': 0
+            'months': MONTH_NAMES,
+            'revenues': revenues,
+            'expenses': expenses,
+            'results': results,
+            'total_revenue': sum(revenues),
+            'total_expense': sum(expenses),
+            'total_result': sum(results)
         }
     
-    # Hämta alla värden för dataset
-    values = firebase_db.get_values(dataset_id=target_dataset_id)
-    
-    # Hämta referensdata
-    accounts = firebase_db.get_accounts()
-    categories = firebase_db.get_account_categories()
-    
-    # Hitta kategori-IDs
-    revenue_category_id = None
-    expense_category_id = None
-    for cat_id, cat_data in categories.items():
-        if cat_data.get('name') == 'Intäkter':
-            revenue_category_id = cat_id
-        elif cat_data.get('name') == 'Kostnader':
-            expense_category_id = cat_id
-    
-    # Organisera data per månad
-    monthly_revenues = {i: 0 for i in range(1, 13)}
-    monthly_expenses = {i: 0 for i in range(1, 13)}
-    
-    for value_data in values.values():
-        if value_data.get('value_type') != 'faktiskt':
-            continue
-            
-        account_id = value_data.get('account_id')
-        account_data = accounts.get(account_id, {})
-        category_id = account_data.get('category_id')
-        
-        month = value_data.get('month')
-        amount = value_data.get('amount', 0)
-        
-        if category_id == revenue_category_id:
-            monthly_revenues[month] += amount
-        elif category_id == expense_category_id:
-            monthly_expenses[month] += amount
-    
-    # Skapa listor för visualisering
-    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun',
-                   'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
-    
-    revenues = [monthly_revenues[i] for i in range(1, 13)]
-    expenses = [monthly_expenses[i] for i in range(1, 13)]
-    results = [rev - exp for rev, exp in zip(revenues, expenses)]
-    
-    return {
-        'months': month_names,
-        'revenues': revenues,
-        'expenses': expenses,
-        'results': results,
-        'total_revenue': sum(revenues),
-        'total_expense': sum(expenses),
-        'total_result': sum(results)
-    }
+    def budget_comparison(self) -> pd.DataFrame:
+        """Alla värdetyper sida vid sida (faktiskt och budget)"""
+        df = self.df[['account_name', 'category', 'month', 'amount', 'value_type']]
+        return df.sort_values(['category', 'account_name', 'month', 'value_type']).reset_index(drop=True)
+    
+    def pivot(self, value_type: str = "faktiskt") -> pd.DataFrame:
+        """Konton som rader och månader (1-12) som kolumner"""
+        return self.actuals(value_type).pivot_table(
+            index=['category', 'account_name'], columns='month', values='amount', aggfunc='sum', fill_value=0.0
+        ).reindex(columns=range(1, 13), fill_value=0.0)
+    
+    def top_accounts(self, category: str, limit: int = 10) -> pd.DataFrame:
+        """Största konton (efter absolutbelopp) i en kategori"""
+        df = self.actuals()
+        totals = (df[df['category'] == category]
+                  .groupby('account_name', sort=False)['amount'].sum()
+                  .rename('total_amount').reset_index())
+        if totals.empty:
+            return pd.DataFrame(columns=['account_name', 'total_amount'])
+        return totals.loc[totals['total_amount'].abs().nlargest(limit).index].reset_index(drop=True)
+
+def get_financial_frame(company_id: str, year: int) -> FinancialFrame:
+    """En FinancialFrame per (företag, år) - delas av hjälpfunktionerna"""
+    return FinancialFrame.load(company_id, year)
+
+def get_financial_data(company_id: str, year: int, value_type: str = "faktiskt") -> pd.DataFrame:
+    """
+    Hämta finansiell data för ett företag och år
+    Returnerar DataFrame med kolumner: account_name, category, month, amount
+    """
+    return get_financial_frame(company_id, year).financial_data(value_type)
+
+def calculate_monthly_summary(company_id: str, year: int) -> Dict:
+    """
+    Beräkna månatlig sammanfattning (intäkter, kostnader, resultat)
+    """
+    return get_financial_frame(company_id, year).monthly_summary()
 
 def get_budget_comparison(company_id: str, year: int) -> pd.DataFrame:
     """
     Jämför faktiska värden med budget
     """
-    firebase_db = get_firebase_db()
-    
-    # Hämta datasets för företaget och året
-    datasets = firebase_db.get_datasets(company_id)
-    target_dataset_id = None
-    for dataset_id, dataset_data in datasets.items():
-        if dataset_data.get('year') == year:
-            target_dataset_id = dataset_id
-            break
-    
-    if not target_dataset_id:
-        return pd.DataFrame(columns=['account_name', 'category', 'month', 'amount', 'value_type'])
-    
-    # Hämta alla värden för dataset
-    values = firebase_db.get_values(dataset_id=target_dataset_id)
-    
-    # Hämta referensdata
-    accounts = firebase_db.get_accounts()
-    categories = firebase_db.get_account_categories()
-    
-    # Bygg DataFrame
-    data = []
-    for value_data in values.values():
-        account_id = value_data.get('account_id')
-        account_data = accounts.get(account_id, {})
-        
-        category_id = account_data.get('category_id')
-        category_data = categories.get(category_id, {})
-        
-        data.append({
-            'account_name': account_data.get('name', 'Okänt konto'),
-            'category': category_data.get('name', 'Okänd kategori'),
-            'month': value_data.get('month'),
-            'amount': value_data.get('amount', 0),
-            'value_type': value_data.get('value_type')
-        })
-    
-    df = pd.DataFrame(data)
-    
-    if not df.empty:
-        df = df.sort_values(['category', 'account_name', 'month', 'value_type'])
-    
-    return df
+    return get_financial_frame(company_id, year).budget_comparison()
 
+@instrument("chart")
 def create_revenue_expense_chart(summary_data: Dict) -> go.Figure:
     """
     Skapa diagram för intäkter vs kostnader
@@ -254,6 +213,7 @@ def create_revenue_expense_chart(summary_data: Dict) -> go.Figure:
     
     return fig
 
+@instrument("chart")
 def create_ytd_comparison_chart(summary_data: Dict) -> go.Figure:
     """
     Skapa YTD-jämförelsediagram
@@ -317,66 +277,7 @@ def get_top_accounts(company_id: str, year: int, category: str, limit: int = 10)
     """
     Hämta top N konton för en kategori
     """
-    firebase_db = get_firebase_db()
-    
-    # Hämta datasets för företaget och året
-    datasets = firebase_db.get_datasets(company_id)
-    target_dataset_id = None
-    for dataset_id, dataset_data in datasets.items():
-        if dataset_data.get('year') == year:
-            target_dataset_id = dataset_id
-            break
-    
-    if not target_dataset_id:
-        return pd.DataFrame(columns=['account_name', 'total_amount'])
-    
-    # Hämta alla värden för dataset
-    values = firebase_db.get_values(dataset_id=target_dataset_id)
-    
-    # Hämta referensdata
-    accounts = firebase_db.get_accounts()
-    categories = firebase_db.get_account_categories()
-    
-    # Hitta rätt kategori-ID
-    target_category_id = None
-    for cat_id, cat_data in categories.items():
-        if cat_data.get('name') == category:
-            target_category_id = cat_id
-            break
-    
-    if not target_category_id:
-        return pd.DataFrame(columns=['account_name', 'total_amount'])
-    
-    # Samla data per konto
-    account_totals = {}
-    for value_data in values.values():
-        if value_data.get('value_type') != 'faktiskt':
-            continue
-            
-        account_id = value_data.get('account_id')
-        account_data = accounts.get(account_id, {})
-        
-        if account_data.get('category_id') != target_category_id:
-            continue
-        
-        account_name = account_data.get('name', 'Okänt konto')
-        amount = value_data.get('amount', 0)
-        
-        if account_name not in account_totals:
-            account_totals[account_name] = 0
-        account_totals[account_name] += amount
-    
-    # Skapa DataFrame och sortera
-    data = [{'account_name': name, 'total_amount': total} 
-            for name, total in account_totals.items()]
-    
-    df = pd.DataFrame(data)
-    
-    if not df.empty:
-        df = df.reindex(df['total_amount'].abs().sort_values(ascending=False).index)
-        df = df.head(limit)
-    
-    return df
+    return get_financial_frame(company_id, year).top_accounts(category, limit)
 
 def format_currency(amount: float) -> str:
     """Formatera belopp som valuta"""
@@ -410,13 +311,8 @@ def get_accounts_for_category(category_name: str) -> List[Dict]:
     """Hämta alla konton för en specifik kategori"""
     firebase_db = get_firebase_db()
     
-    # Hitta kategori-ID
-    categories = firebase_db.get_account_categories()
-    target_category_id = None
-    for cat_id, cat_data in categories.items():
-        if cat_data.get('name') == category_name:
-            target_category_id = cat_id
-            break
+    # Hitta kategori-ID (cachat index)
+    target_category_id = get_firebase_dimension_index().category_id(category_name)
     
     if not target_category_id:
         return []
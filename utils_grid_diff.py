@@ -0,0 +1,95 @@
+"""
+Gemensam diffmotor för budgetredigerarna (data_editor-grid, number_inputs, session_state)
+Två grid justeras på account_id (12, 12.0 och '12' räknas som samma konto), månadsmatriserna jämförs med NumPy (tolerans) och
+resultatet är en kompakt lista med ändrade celler som sparvägarna utgår från.
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+MONTH_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun', 'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
+TOLERANCE = 1e-6
+
+class CellChange(NamedTuple):
+    """En ändrad cell (month är 1-12)"""
+    account_id: Any
+    month: int
+    old: float
+    new: float
+
+def _account_id_text(value) -> str:
+    """Jämförbar text för ett account_id (12, 12.0 och '12' blir '12')"""
+    try:
+        number = float(value)
+        if number.is_integer():
+            return str(int(number))
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+def match_account_ids(ids, reference):
+    """account_id i ids (Series/Index) uttryckta som motsvarande värde i reference (samma typ, så att merge matchar)"""
+    lookup = {}
+    for value in pd.unique(pd.Series(list(reference), dtype=object)):
+        lookup.setdefault(_account_id_text(value), value)
+    return ids.map(lambda value: lookup.get(_account_id_text(value), value))
+
+def month_matrix(grid: Optional[pd.DataFrame], key: str = 'account_id',
+                 columns: Sequence[str] = MONTH_LABELS) -> pd.DataFrame:
+    """Månadskolumnerna som float-matris indexerad på key (tomma/ogiltiga celler = 0)"""
+    columns = list(columns)
+    if grid is None or grid.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name=key), dtype='float64')
+    matrix = grid.set_index(key)[columns].apply(pd.to_numeric, errors='coerce').fillna(0.0).astype('float64')
+    return matrix[~matrix.index.duplicated()]
+
+def diff_grids(original: Optional[pd.DataFrame], edited: Optional[pd.DataFrame], key: str = 'account_id',
+               columns: Sequence[str] = MONTH_LABELS, atol: float = TOLERANCE) -> List[CellChange]:
+    """
+    Ändrade celler mellan två grid. Raderna matchas på key (inte position), konton som
+    saknas i original räknas som 0. Nycklar av olika typ (12 / '12') matchas och
+    rapporteras som i edited. columns ska vara de 12 månaderna i ordning.
+    """
+    new = month_matrix(edited, key, columns)
+    old = month_matrix(original, key, columns)
+    old.index = match_account_ids(old.index, new.index)
+    old = old[~old.index.duplicated()].reindex(new.index, fill_value=0.0)
+    old_values, new_values = old.to_numpy(), new.to_numpy()
+
+    rows, cols = np.nonzero(~np.isclose(old_values, new_values, rtol=0.0, atol=atol))
+    return [CellChange(new.index[r], int(c) + 1, float(old_values[r, c]), float(new_values[r, c]))
+            for r, c in zip(rows, cols)]
+
+def diff_month_values(account_id: Any, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]],
+                      columns: Sequence[str] = MONTH_LABELS, atol: float = TOLERANCE) -> List[CellChange]:
+    """Ändringar för ett konto där månaderna ligger i dicts {månadsnamn: belopp}"""
+    def frame(values: Optional[Dict[str, Any]]) -> pd.DataFrame:
+        values = values or {}
+        return pd.DataFrame([{'account_id': account_id, **{c: values.get(c, 0) for c in columns}}])
+    return diff_grids(frame(old), frame(new), columns=columns, atol=atol)
+
+def long_to_grid(values: Optional[pd.DataFrame], key: str = 'account_id',
+                 columns: Sequence[str] = MONTH_LABELS) -> pd.DataFrame:
+    """Rader (key, month, amount) -> en rad per key med månadskolumner (första värdet per cell)"""
+    columns = list(columns)
+    if values is None or values.empty:
+        return pd.DataFrame({key: pd.Series(dtype=object), **{c: pd.Series(dtype='float64') for c in columns}})
+    grid = values.pivot_table(index=key, columns='month', values='amount', aggfunc='first')
+    grid = grid.reindex(columns=range(1, len(columns) + 1)).fillna(0.0)
+    grid.columns = columns
+    return grid.reset_index()
+
+def grid_to_updates(grid: Optional[pd.DataFrame], key: str = 'account_id',
+                    columns: Sequence[str] = MONTH_LABELS) -> Dict[Any, Dict[int, float]]:
+    """Grid -> {account_id: {månad: belopp}} (formatet som save_budget_values tar)"""
+    matrix = month_matrix(grid, key, columns)
+    return {account_id: {m: float(v) for m, v in enumerate(row, 1)}
+            for account_id, row in zip(matrix.index, matrix.to_numpy())}
+
+def apply_changes(updates: Dict[Any, Dict[int, float]], changes: Iterable[CellChange]) -> Dict[Any, Dict[int, float]]:
+    """Kopia av updates med de ändrade cellerna inlagda"""
+    merged = {account_id: dict(months) for account_id, months in updates.items()}
+    for change in changes:
+        merged.setdefault(change.account_id, {})[change.month] = change.new
+    return merged
@@ -0,0 +1,262 @@
+"""
+Prestandainstrumentering per Streamlit-rerun
+Mäter anrop, överförda bytes, väggtid och cache-träffar för Firebase-anrop (HTTP),
+repository/SQL-metoder, dataladdare och diagram. Visas i en valfri sidopanel och kan
+exporteras som JSONL-trace (FINANS_PERF_TRACE=<fil> eller kryssruta i panelen).
+"""
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Deque
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+DEFAULT_TRACE_FILE = Path(__file__).parent / "data" / "perf_trace.jsonl"
+
+# Öppna mätningar per tråd (för nästlade anrop)
+_local = threading.local()
+# Trace utanför Streamlit-session (skript, benchmarks, bakgrundstrådar) - bara de senaste
+# händelserna, eftersom start_rerun aldrig anropas i t.ex. uppvärmningsloopen eller skrivkön
+FALLBACK_TRACE_MAX = 10000
+_fallback_trace: Deque[Dict[str, Any]] = deque(maxlen=FALLBACK_TRACE_MAX)
+
+def _span_stack() -> List[Dict[str, Any]]:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def _session():
+    """Sessionens state om vi kör i Streamlit, annars None"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return None
+        return st.session_state
+    except Exception:
+        return None
+
+def get_trace():
+    """Händelser för aktuell rerun (lista, eller begränsad deque utanför Streamlit)"""
+    session = _session()
+    if session is None:
+        return _fallback_trace
+    if 'perf_trace' not in session:
+        session['perf_trace'] = []
+    return session['perf_trace']
+
+def record_event(category: str, name: str, wall_ms: float, bytes_transferred: int = 0,
+                 requests: int = 0, cache_hit: bool = False) -> Dict[str, Any]:
+    """Registrera en händelse och räkna upp alla öppna mätningar"""
+    event = {
+        'ts': datetime.now().isoformat(),
+        'category': category,
+        'name': name,
+        'wall_ms': round(wall_ms, 2),
+        'bytes': int(bytes_transferred),
+        'requests': int(requests),
+        'cache_hit': bool(cache_hit)
+    }
+    for span in _span_stack():
+        span['children'] += 1
+        if category == 'http':
+            span['bytes'] += event['bytes']
+            span['requests'] += event['requests']
+    get_trace().append(event)
+    return event
+
+@contextmanager
+def measure(category: str, name: str, cached: bool = False):
+    """
+    Mät ett kodblock. Med cached=True räknas blocket som cache-träff om inga
+    nästlade händelser (HTTP, repository, snapshot) inträffade under tiden.
+    """
+    span = {'children': 0, 'bytes': 0, 'requests': 0}
+    stack = _span_stack()
+    stack.append(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        wall_ms = (time.perf_counter() - start) * 1000
+        stack.pop()
+        record_event(category, name, wall_ms, span['bytes'], span['requests'],
+                     cache_hit=cached and span['children'] == 0)
+
+def instrument(category: str, name: Optional[str] = None, cached: bool = False):
+    """Dekorator för funktioner. Placeras ovanför @st.cache_data med cached=True."""
+    def decorator(fn):
+        event_name = name or getattr(fn, '__name__', 'okänd')
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with measure(category, event_name, cached=cached):
+                return fn(*args, **kwargs)
+
+        # Behåll st.cache_data-funktionens clear()
+        if hasattr(fn, 'clear'):
+            wrapper.clear = fn.clear
+        return wrapper
+    return decorator
+
+def instrument_class(category: str, exclude: tuple = ()):
+    """Klassdekorator - instrumentera alla publika metoder definierade i klassen"""
+    def decorator(cls):
+        for attr_name, attr in list(vars(cls).items()):
+            if attr_name.startswith('_') or attr_name in exclude or not callable(attr):
+                continue
+            setattr(cls, attr_name, instrument(category, f"{cls.__name__}.{attr_name}")(attr))
+        return cls
+    return decorator
+
+def install_http_hook(session) -> None:
+    """Registrera varje HTTP-svar (Pyrebase använder en requests.Session)"""
+    if getattr(session, '_finans_instrumented', False):
+        return
+
+    def on_response(response, *args, **kwargs):
+        # Logga endast path - query innehåller auth-token
+        path = urlsplit(response.url).path
+        record_event('http', f"{response.request.method} {path}",
+                     response.elapsed.total_seconds() * 1000,
+                     bytes_transferred=len(response.content or b''), requests=1)
+        return response
+
+    session.hooks['response'].append(on_response)
+    session._finans_instrumented = True
+
+def summarize(trace: Optional[List[Dict[str, Any]]] = None) -> "pd.DataFrame":
+    """Sammanställ trace per kategori och namn"""
+    # pandas importeras först här - modulen laddas redan på inloggningssidan
+    import pandas as pd
+    trace = get_trace() if trace is None else trace
+    if not trace:
+        return pd.DataFrame(columns=['category', 'name', 'calls', 'wall_ms', 'bytes', 'requests', 'cache_hits'])
+    df = pd.DataFrame(trace)
+    return (df.groupby(['category', 'name'], as_index=False)
+              .agg(calls=('name', 'size'), wall_ms=('wall_ms', 'sum'), bytes=('bytes', 'sum'),
+                   requests=('requests', 'sum'), cache_hits=('cache_hit', 'sum'))
+              .sort_values('wall_ms', ascending=False)
+              .reset_index(drop=True))
+
+def last_event(name: str) -> Dict[str, Any]:
+    """Senaste händelsen med givet namn i aktuell rerun (tom dict om ingen)"""
+    for event in reversed(get_trace()):
+        if event['name'] == name:
+            return event
+    return {}
+
+def _trace_file() -> Optional[Path]:
+    env_path = os.getenv("FINANS_PERF_TRACE")
+    if env_path:
+        return Path(env_path)
+    session = _session()
+    if session is not None and session.get('perf_trace_export'):
+        return DEFAULT_TRACE_FILE
+    return None
+
+def _export(rerun: Dict[str, Any], trace: List[Dict[str, Any]]) -> None:
+    """Lägg till rerunens händelser i JSONL-filen"""
+    path = _trace_file()
+    if not path or not trace:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for event in trace:
+                f.write(json.dumps({'rerun': rerun.get('id'), 'page': rerun.get('page'), **event},
+                                   ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"⚠️ Kunde inte skriva perf-trace: {e}")
+
+def start_rerun() -> None:
+    """Anropas först i varje rerun - ny trace (föregående exporteras om den inte avslutats)"""
+    session = _session()
+    if session is None:
+        _fallback_trace.clear()
+        return
+    previous = session.get('perf_rerun')
+    if previous and not previous.get('finished'):
+        _export(previous, session.get('perf_trace', []))
+    session['perf_rerun'] = {
+        'id': (previous or {}).get('id', 0) + 1,
+        'started': time.perf_counter(),
+        'page': None,
+        'finished': False
+    }
+    session['perf_trace'] = []
+
+def finish_rerun(page: Optional[str] = None) -> Dict[str, Any]:
+    """Anropas sist i varje rerun - exporterar trace och returnerar rerun-info"""
+    session = _session()
+    if session is None or 'perf_rerun' not in session:
+        return {}
+    rerun = session['perf_rerun']
+    if not rerun.get('finished'):
+        rerun['page'] = page
+        rerun['wall_ms'] = (time.perf_counter() - rerun['started']) * 1000
+        rerun['finished'] = True
+        _export(rerun, get_trace())
+    return rerun
+
+def show_instrumentation_panel(page: Optional[str] = None) -> None:
+    """Valfri sidopanel med prestanda för aktuell rerun"""
+    st.sidebar.checkbox("⏱️ Visa prestandapanel", key="show_perf_panel")
+    rerun = finish_rerun(page)
+
+    if not st.session_state.get('show_perf_panel'):
+        return
+
+    trace = get_trace()
+    http_events = [e for e in trace if e['category'] == 'http']
+
+    with st.sidebar.expander("⏱️ Prestanda (denna rerun)", expanded=True):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Firebase-anrop", len(http_events))
+            st.metric("Rerun-tid", f"{rerun.get('wall_ms', 0):.0f} ms")
+        with col2:
+            st.metric("Överfört", f"{sum(e['bytes'] for e in http_events) / 1024:.0f} kB")
+            st.metric("Cache-träffar", sum(1 for e in trace if e['cache_hit']))
+
+        # Processövergripande: identiska samtidiga hämtningar som slagits ihop
+        from utils_singleflight import get_singleflight_stats
+        flight = get_singleflight_stats()
+        st.caption(f"🔀 Single-flight (processen): {flight['leaders']} hämtningar, "
+                   f"{flight['coalesced']} sammanslagna anrop")
+        from utils_result_cache import get_cache_stats
+        cache = get_cache_stats()
+        st.caption(f"🗄️ Resultatcache (processen): {cache['entries']} poster, "
+                   f"{cache['bytes'] / 1024 / 1024:.1f}/{cache['max_bytes'] / 1024 / 1024:.0f} MB, "
+                   f"{cache['hits']} träffar, {cache['misses']} missar, {cache['evictions']} vräkta")
+        from utils_disk_cache import get_disk_cache_stats
+        disk = get_disk_cache_stats()
+        if disk:
+            st.caption(f"💽 Diskcache: {disk['entries']} poster, {disk['bytes'] / 1024 / 1024:.1f} MB, "
+                       f"{disk['hits']} träffar, {disk['misses']} missar, {disk['evictions']} vräkta")
+        from utils_prefetch import get_prefetch_stats
+        prefetch = get_prefetch_stats()
+        if prefetch:
+            st.caption(f"⏩ Förhämtning: {prefetch['submitted']} jobb, {prefetch['running']} pågår, "
+                       f"{prefetch['skipped']} överhoppade, {prefetch['errors']} fel")
+        from utils_write_behind import get_write_behind_stats
+        writes = get_write_behind_stats()
+        if writes:
+            st.caption(f"📝 Skrivkö: {writes['pending'] + writes['syncing']} väntar, {writes['synced']} synkade, "
+                       f"{writes['failed']} misslyckade, {writes['coalesced']} sammanslagna, {writes['batches']} batchar")
+
+        summary = summarize(trace)
+        if not summary.empty:
+            summary['kB'] = (summary['bytes'] / 1024).round(1)
+            summary['wall_ms'] = summary['wall_ms'].round(1)
+            st.dataframe(summary[['category', 'name', 'calls', 'wall_ms', 'kB', 'cache_hits']],
+                         use_container_width=True, hide_index=True)
+
+        st.checkbox("📝 Logga trace till JSONL", key="perf_trace_export",
+                    help=f"Skriver varje rerun till {DEFAULT_TRACE_FILE.name} (eller FINANS_PERF_TRACE)")
@@ -0,0 +1,428 @@
+"""
+Lokal ersättare för Firebase Realtime Database (REST) - för benchmarks och tester
+Implementerar den del av REST-API:t som Pyrebase använder: GET, PUT, PATCH, POST, DELETE,
+shallow, orderBy/equalTo/startAt/endAt/limitTo*, auth-parametern, ETag (X-Firebase-ETag och
+If-None-Match -> 304) samt konfigurerbar latens.
+
+Användning:
+    with LocalFirebaseServer(data=test_blob, latency_ms=60) as server:
+        firebase_db = connect_firebase_db(server)
+        firebase_db.get_ref("test_data/companies").get()
+
+Eller som fristående server för appen:
+    python utils_local_firebase.py --port 9000 --latency-ms 60 --seed data.json
+    FIREBASE_DATABASE_URL=http://127.0.0.1:9000/ streamlit run streamlit_app.py
+"""
+import os
+import json
+import time
+import hashlib
+import random
+import threading
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, List, Any
+from urllib.parse import urlsplit, parse_qs, unquote
+
+QUERY_PARAMS = ('orderBy', 'equalTo', 'startAt', 'endAt', 'limitToFirst', 'limitToLast')
+
+def _split_path(path: str) -> List[str]:
+    """Dela upp en databas-path i segment"""
+    return [unquote(p) for p in path.strip('/').split('/') if p]
+
+def _normalize(value: Any) -> Any:
+    """Lagra som Firebase: listor blir objekt med index-nycklar, null och tomma objekt tas bort"""
+    if isinstance(value, list):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        result = {}
+        for key, child in value.items():
+            child = _normalize(child)
+            if child is not None:
+                result[str(key)] = child
+        return result or None
+    return value
+
+def _render(value: Any) -> Any:
+    """Returnera som Firebase: objekt med (mestadels) sekventiella heltalsnycklar blir listor"""
+    if not isinstance(value, dict):
+        return value
+    rendered = {key: _render(child) for key, child in value.items()}
+    if rendered and all(key.isdigit() for key in rendered):
+        max_index = max(int(key) for key in rendered)
+        if len(rendered) * 2 > max_index:
+            return [rendered.get(str(i)) for i in range(max_index + 1)]
+    return rendered
+
+def _value_rank(value: Any):
+    """Firebase sorteringsordning: null < false < true < tal < strängar < objekt"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, 0)
+
+def _key_rank(key: str):
+    """Nycklar sorteras med heltal först (numeriskt), sedan strängar"""
+    return (0, int(key), '') if key.lstrip('-').isdigit() else (1, 0, key)
+
+class LocalFirebaseServer:
+    """In-process HTTP-server som beter sig som Firebase Realtime Database REST API"""
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, bandwidth_mbps: Optional[float] = None,
+                 auth_tokens: Optional[List[str]] = None):
+        """
+        Args:
+            data: Initialt databasinnehåll
+            port: 0 = välj ledig port automatiskt
+            latency_ms: Fast fördröjning per anrop (simulerad round-trip)
+            jitter_ms: Slumpmässig extra fördröjning 0..jitter_ms
+            bandwidth_mbps: Simulerad bandbredd - lägger till överföringstid efter svarsstorlek
+            auth_tokens: Giltiga auth-tokens; None = ingen autentisering krävs
+        """
+        self._data = _normalize(deepcopy(data)) or {}
+        self._lock = threading.Lock()
+        self._push_counter = 0
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.auth_tokens = set(auth_tokens) if auth_tokens is not None else None
+        self._httpd = None
+        self._thread = None
+        self.reset_stats()
+
+    # -------- Livscykel --------
+    def start(self) -> "LocalFirebaseServer":
+        """Starta servern i en bakgrundstråd"""
+        handler = type("LocalFirebaseHandler", (_LocalFirebaseHandler,), {"backend": self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="local-firebase", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stoppa servern"""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        """Databas-URL att använda som databaseURL"""
+        return f"http://{self.host}:{self.port}/"
+
+    # -------- Statistik --------
+    def reset_stats(self) -> None:
+        """Nollställ anropsstatistik"""
+        self.stats = {'requests': 0, 'GET': 0, 'PUT': 0, 'PATCH': 0, 'POST': 0, 'DELETE': 0,
+                      'bytes_in': 0, 'bytes_out': 0, 'not_modified': 0}
+
+    def _record(self, method: str, bytes_in: int, bytes_out: int) -> None:
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[method] += 1
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+
+    def _delay(self, payload_size: int) -> float:
+        """Simulerad fördröjning i sekunder för ett svar av given storlek"""
+        delay_ms = self.latency_ms
+        if self.jitter_ms:
+            delay_ms += random.uniform(0, self.jitter_ms)
+        if self.bandwidth_mbps:
+            delay_ms += payload_size * 8 / (self.bandwidth_mbps * 1000)
+        return delay_ms / 1000.0
+
+    # -------- Direktåtkomst (seedning och kontroller i tester) --------
+    def get_data(self, path: str = "") -> Any:
+        """Läs data direkt utan HTTP"""
+        with self._lock:
+            return _render(deepcopy(self._get_node(_split_path(path))))
+
+    def set_data(self, path: str, value: Any) -> None:
+        """Skriv data direkt utan HTTP"""
+        with self._lock:
+            self._set_node(_split_path(path), value)
+
+    # -------- Trädoperationer (anropas med låset taget) --------
+    def _get_node(self, parts: List[str]) -> Any:
+        node = self._data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _set_node(self, parts: List[str], value: Any) -> None:
+        value = _normalize(deepcopy(value))
+        if not parts:
+            self._data = value if value is not None else {}
+            return
+        if not isinstance(self._data, dict):
+            self._data = {}
+
+        node = self._data
+        parents = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return  # Inget att ta bort
+                child = {}
+                node[part] = child
+            parents.append((node, part))
+            node = child
+
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+        # Firebase lagrar aldrig tomma objekt - rensa uppåt
+        while parents and not node:
+            parent, key = parents.pop()
+            parent.pop(key, None)
+            node = parent
+
+    def _next_push_id(self) -> str:
+        """Kronologiskt sorterbart push-ID (liknar Firebase push keys)"""
+        self._push_counter += 1
+        return f"-L{int(time.time() * 1000):013d}{self._push_counter:07d}"
+
+    # -------- Förfrågningar --------
+    def handle_get(self, parts: List[str], query: Dict[str, Any]) -> Any:
+        with self._lock:
+            node = deepcopy(self._get_node(parts))
+
+        if query.get('shallow'):
+            if isinstance(node, dict):
+                return {key: True if isinstance(child, dict) else child for key, child in node.items()}
+            return node
+
+        if 'orderBy' in query and isinstance(node, dict):
+            node = self._apply_query(node, query)
+
+        return _render(node)
+
+    def _apply_query(self, node: Dict[str, Any], query: Dict[str, Any]) -> Dict[str, Any]:
+        """orderBy + equalTo/startAt/endAt/limitToFirst/limitToLast"""
+        order_by = query['orderBy']
+
+        if order_by == '$key':
+            rank = lambda key, child: _key_rank(key)
+            param_rank = lambda param: _key_rank(str(param))
+        elif order_by == '$value':
+            rank = lambda key, child: (_value_rank(child), _key_rank(key))
+            param_rank = lambda param: (_value_rank(param),)
+        else:
+            child_parts = _split_path(order_by)
+
+            def child_value(child):
+                for part in child_parts:
+                    if not isinstance(child, dict):
+                        return None
+                    child = child.get(part)
+                return None if isinstance(child, dict) else child
+
+            rank = lambda key, child: (_value_rank(child_value(child)), _key_rank(key))
+            param_rank = lambda param: (_value_rank(param),)
+
+        items = sorted(node.items(), key=lambda item: rank(*item))
+
+        def prefix(item):
+            return rank(*item)[:len(param_rank(None))]
+
+        if 'equalTo' in query:
+            target = param_rank(query['equalTo'])
+            items = [item for item in items if prefix(item) == target]
+        if 'startAt' in query:
+            start = param_rank(query['startAt'])
+            items = [item for item in items if prefix(item) >= start]
+        if 'endAt' in query:
+            end = param_rank(query['endAt'])
+            items = [item for item in items if prefix(item) <= end]
+        if 'limitToFirst' in query:
+            items = items[:int(query['limitToFirst'])]
+        if 'limitToLast' in query:
+            items = items[-int(query['limitToLast']):] if int(query['limitToLast']) else []
+
+        return dict(items)
+
+    def handle_put(self, parts: List[str], value: Any) -> Any:
+        with self._lock:
+            self._set_node(parts, value)
+        return value
+
+    def handle_patch(self, parts: List[str], value: Any) -> Any:
+        if not isinstance(value, dict):
+            raise ValueError("PATCH kräver ett JSON-objekt")
+        with self._lock:
+            # Multi-path update: nycklar kan innehålla '/', null tar bort
+            for key, child in value.items():
+                self._set_node(parts + _split_path(key), child)
+        return value
+
+    def handle_post(self, parts: List[str], value: Any) -> Any:
+        with self._lock:
+            push_id = self._next_push_id()
+            self._set_node(parts + [push_id], value)
+        return {'name': push_id}
+
+    def handle_delete(self, parts: List[str]) -> Any:
+        with self._lock:
+            self._set_node(parts, None)
+        return None
+
+class _LocalFirebaseHandler(BaseHTTPRequestHandler):
+    """HTTP-hanterare - översätter REST-anrop till LocalFirebaseServer"""
+
+    backend: LocalFirebaseServer = None
+    protocol_version = "HTTP/1.1"
+    # Headers och body skrivs separat - utan TCP_NODELAY ger Nagle ~40 ms extra per anrop
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # Tyst - benchmarks ska inte spamma konsolen
+
+    def _send(self, status: int, payload: Any, method: str, bytes_in: int) -> None:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        headers = {}
+        # ETag som Firebase: skickas bara när klienten ber om det med X-Firebase-ETag: true
+        if method == 'GET' and status == 200 and self.headers.get('X-Firebase-ETag', '').lower() == 'true':
+            etag = hashlib.sha1(body).hexdigest()
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+                with self.backend._lock:
+                    self.backend.stats['not_modified'] += 1
+        delay = self.backend._delay(len(body))
+        if delay > 0:
+            time.sleep(delay)
+        # Registrera innan svaret skickas - klienten kan annars läsa stats före uppräkningen
+        self.backend._record(method, bytes_in, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+
+        url = urlsplit(self.path)
+        if not url.path.endswith('.json'):
+            self._send(404, {'error': 'Endast .json-paths stöds'}, method, len(raw_body))
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        backend = self.backend
+        if backend.auth_tokens is not None and params.get('auth') not in backend.auth_tokens:
+            self._send(401, {'error': 'Permission denied'}, method, len(raw_body))
+            return
+
+        try:
+            parts = _split_path(url.path[:-len('.json')])
+            query = {key: json.loads(params[key]) for key in QUERY_PARAMS if key in params}
+            if params.get('shallow') == 'true':
+                query['shallow'] = True
+            if ('equalTo' in query or 'startAt' in query or 'endAt' in query) and 'orderBy' not in query:
+                raise ValueError("orderBy måste anges tillsammans med equalTo/startAt/endAt")
+
+            if method == 'GET':
+                result = backend.handle_get(parts, query)
+            elif method == 'DELETE':
+                result = backend.handle_delete(parts)
+            else:
+                value = json.loads(raw_body.decode('utf-8')) if raw_body else None
+                if method == 'PUT':
+                    result = backend.handle_put(parts, value)
+                elif method == 'PATCH':
+                    result = backend.handle_patch(parts, value)
+                else:
+                    result = backend.handle_post(parts, value)
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send(400, {'error': str(e)}, method, len(raw_body))
+            return
+
+        self._send(200, result, method, len(raw_body))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+def local_firebase_env(server: LocalFirebaseServer) -> Dict[str, str]:
+    """Miljövariabler som pekar FirebaseDB mot den lokala servern"""
+    return {
+        "FIREBASE_API_KEY": "local-api-key",
+        "FIREBASE_AUTH_DOMAIN": "localhost",
+        "FIREBASE_DATABASE_URL": server.url,
+        "FIREBASE_STORAGE_BUCKET": "local-bucket",
+        "FIREBASE_MESSAGING_SENDER_ID": "0",
+        "FIREBASE_APP_ID": "local-app"
+    }
+
+def connect_firebase_db(server: LocalFirebaseServer):
+    """Skapa en FirebaseDB som använder den lokala servern"""
+    from models_firebase_database import FirebaseDB
+
+    os.environ.update(local_firebase_env(server))
+    return FirebaseDB()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lokal Firebase Realtime Database (REST)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=None)
+    parser.add_argument("--seed", help="JSON-fil med initialt databasinnehåll")
+    args = parser.parse_args()
+
+    seed_data = None
+    if args.seed:
+        with open(args.seed, 'r', encoding='utf-8') as f:
+            seed_data = json.load(f)
+
+    server = LocalFirebaseServer(data=seed_data, host=args.host, port=args.port,
+                                 latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                 bandwidth_mbps=args.bandwidth_mbps).start()
+    print(f"🔥 Lokal Firebase kör på {server.url} (latens {args.latency_ms} ms)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        print("🛑 Lokal Firebase stoppad")
@@ -0,0 +1,34 @@
+"""
+Sidregister för streamlit_app - sidmoduler importeras först när sidan väljs
+Håller kallstarten (inloggningssidan) fri från plotly, numpy, pandas och Firebase-modeller.
+"""
+import importlib
+from typing import Callable, Dict, List, Tuple
+
+# Sidnamn -> (modul, funktion som visar sidan)
+PAGES: Dict[str, Tuple[str, str]] = {
+    "📊 Test Excel-import": ("test_excel_import", "show_excel_import_test"),
+    "💰 Budget-redigering": ("simple_budget_page", "show_simple_budget_page"),
+    "📈 Visualisering v2": ("pages_visualization2", "show"),
+    "📅 Säsongsanalys": ("pages_seasonal_analysis", "show"),
+    "📅 Säsongsanalys (Förenklad)": ("pages_seasonal_analysis_simple", "show"),
+}
+
+# Tunga moduler som inte får laddas vid kallstart (plotly.graph_objects laddas av streamlit själv)
+LAZY_ONLY_MODULES: List[str] = [
+    "plotly.subplots",
+    "plotly.express",
+    "numpy",
+    "pandas",
+    "models_firebase_database",
+] + [module for module, _ in PAGES.values()]
+
+def page_names() -> List[str]:
+    """Sidnamn i menyordning"""
+    return list(PAGES.keys())
+
+def load_page(name: str) -> Callable[[], None]:
+    """Importera sidans modul (cachas av Python efter första gången) och returnera visningsfunktionen"""
+    module_name, func_name = PAGES[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)
@@ -0,0 +1,219 @@
+"""
+Läsoptimerad Parquet-snapshot av finansiell data
+Skriver den normaliserade faktatabellen (en fil per företag och år) och läser
+tillbaka den med pyarrow memory-map istället för att bygga om från JSON.
+"""
+import os
+import json
+import shutil
+from pathlib import Path
+from datetime import datetime
+from typing import Optional, Dict, List, Any
+
+import pandas as pd
+import streamlit as st
+
+from utils_instrumentation import instrument
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+# Standardkatalog för snapshot (kan överstyras med FINANS_SNAPSHOT_DIR)
+SNAPSHOT_DIR = Path(os.getenv("FINANS_SNAPSHOT_DIR", Path(__file__).parent / "data" / "snapshot"))
+MANIFEST_FILE = "manifest.json"
+
+# Faktatabellens kolumner (company_id/account_id behålls för uppslag mot live-data)
+FACT_COLUMNS = ['company_id', 'company', 'year', 'month', 'account_id', 'account', 'category', 'type', 'amount']
+
+def pyarrow_available() -> bool:
+    """Kontrollera om pyarrow finns installerat"""
+    return pa is not None and pq is not None
+
+def _fact_schema():
+    """Arrow-schema för faktatabellen"""
+    return pa.schema([
+        ('company_id', pa.string()),
+        ('company', pa.string()),
+        ('year', pa.int32()),
+        ('month', pa.int8()),
+        ('account_id', pa.string()),
+        ('account', pa.string()),
+        ('category', pa.string()),
+        ('type', pa.string()),
+        ('amount', pa.float64()),
+    ])
+
+def build_fact_table(test_data: Dict[str, Any]) -> pd.DataFrame:
+    """Bygg normaliserad faktatabell från en test_data-blob"""
+    companies = test_data.get('companies') or {}
+    accounts = test_data.get('accounts') or {}
+    categories = test_data.get('categories') or {}
+    values = test_data.get('values') or {}
+
+    rows = []
+    for value_data in values.values():
+        if not isinstance(value_data, dict):
+            continue
+        company_id = value_data.get('company_id')
+        account_id = value_data.get('account_id')
+        account_info = accounts.get(account_id, {})
+        category_info = categories.get(account_info.get('category_id'), {})
+
+        rows.append({
+            'company_id': company_id,
+            'company': companies.get(company_id, {}).get('name', ''),
+            'year': int(value_data.get('year', 0)),
+            'month': int(value_data.get('month', 0)),
+            'account_id': account_id,
+            'account': account_info.get('name', 'Okänt konto'),
+            'category': category_info.get('name', 'Okänd kategori'),
+            'type': value_data.get('type', 'actual'),
+            'amount': float(value_data.get('amount', 0) or 0)
+        })
+
+    return pd.DataFrame(rows, columns=FACT_COLUMNS)
+
+def _build_manifest(test_data: Dict[str, Any], fact_df: pd.DataFrame) -> Dict[str, Any]:
+    """Dimensioner (företag, konton, kategorier) och år per företag - liten JSON bredvid Parquet-filerna"""
+    years_per_company = {}
+    if not fact_df.empty:
+        for company_id, years in fact_df.groupby('company_id')['year'].unique().items():
+            years_per_company[company_id] = sorted(int(y) for y in years)
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'companies': test_data.get('companies') or {},
+        'accounts': test_data.get('accounts') or {},
+        'categories': test_data.get('categories') or {},
+        'years': years_per_company
+    }
+
+@instrument("snapshot")
+def export_snapshot(test_data: Dict[str, Any], base_dir: Optional[Path] = None) -> int:
+    """
+    Exportera test_data till Parquet - en fil per företag och år
+
+    Args:
+        test_data: Hela test_data-noden (companies, accounts, categories, values)
+        base_dir: Målkatalog (default SNAPSHOT_DIR)
+
+    Returns:
+        int: Antal skrivna Parquet-filer
+    """
+    if not pyarrow_available():
+        raise ImportError("pyarrow krävs för Parquet-snapshot (pip install pyarrow)")
+
+    base_dir = Path(base_dir or SNAPSHOT_DIR)
+    fact_df = build_fact_table(test_data)
+
+    # Skriv till temporär katalog och byt sedan ut hela snapshoten
+    tmp_dir = base_dir.with_name(base_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    schema = _fact_schema()
+    files_written = 0
+    for (company_id, year), part in fact_df.groupby(['company_id', 'year']):
+        company_dir = tmp_dir / str(company_id)
+        company_dir.mkdir(exist_ok=True)
+        part = part.sort_values(['account_id', 'month']).reset_index(drop=True)
+        table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+        pq.write_table(table, company_dir / f"{int(year)}.parquet")
+        files_written += 1
+
+    with open(tmp_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(_build_manifest(test_data, fact_df), f, ensure_ascii=False)
+
+    if base_dir.exists():
+        shutil.rmtree(base_dir)
+    tmp_dir.rename(base_dir)
+
+    print(f"📦 Parquet-snapshot exporterad: {files_written} filer till {base_dir}")
+    return files_written
+
+def load_manifest(base_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """Läs snapshotens manifest (dimensioner och år), tom dict om snapshot saknas"""
+    manifest_path = Path(base_dir or SNAPSHOT_DIR) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def snapshot_available(company_id: Optional[str] = None, base_dir: Optional[Path] = None) -> bool:
+    """Finns en snapshot (eventuellt för ett visst företag)?"""
+    if not pyarrow_available():
+        return False
+    manifest = load_manifest(base_dir)
+    if not manifest:
+        return False
+    if company_id is None:
+        return True
+    return bool(manifest.get('years', {}).get(company_id))
+
+def snapshot_years(company_id: str, base_dir: Optional[Path] = None) -> List[int]:
+    """År som finns i snapshoten för ett företag"""
+    return load_manifest(base_dir).get('years', {}).get(company_id, [])
+
+@instrument("snapshot")
+def load_snapshot(company_id: str, years: Optional[List[int]] = None,
+                  account_ids: Optional[List[str]] = None,
+                  base_dir: Optional[Path] = None) -> pd.DataFrame:
+    """
+    Läs faktatabellen för ett företag via memory-mappade Parquet-filer
+
+    Returns:
+        pd.DataFrame med kolumnerna i FACT_COLUMNS
+    """
+    if not pyarrow_available():
+        raise ImportError("pyarrow krävs för Parquet-snapshot (pip install pyarrow)")
+
+    company_dir = Path(base_dir or SNAPSHOT_DIR) / str(company_id)
+    if years is None:
+        years = snapshot_years(company_id, base_dir)
+
+    tables = []
+    for year in years:
+        path = company_dir / f"{int(year)}.parquet"
+        if path.exists():
+            tables.append(pq.read_table(path, memory_map=True))
+
+    if not tables:
+        return pd.DataFrame(columns=FACT_COLUMNS)
+
+    table = pa.concat_tables(tables)
+    if account_ids is not None:
+        mask = pc.is_in(table['account_id'], value_set=pa.array(list(account_ids), pa.string()))
+        table = table.filter(mask)
+
+    return table.to_pandas()
+
+def load_snapshot_actuals(company_id: str, years: List[int],
+                          account_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """Faktiska värden från snapshot i samma format som sidornas DataFrames (type='Faktiskt')"""
+    df = load_snapshot(company_id, years, account_ids)
+    df = df[df['type'] == 'actual']
+    return pd.DataFrame({
+        'account_id': df['account_id'].values,
+        'account_name': df['account'].values,
+        'category': df['category'].values,
+        'month': df['month'].astype(int).values,
+        'amount': df['amount'].values,
+        'year': df['year'].astype(int).values,
+        'type': 'Faktiskt'
+    })
+
+def use_snapshot() -> bool:
+    """Ska sidorna läsa från snapshot istället för live-databasen?"""
+    if os.getenv("FINANS_USE_SNAPSHOT", "").lower() in ("1", "true", "yes"):
+        return snapshot_available()
+    try:
+        return bool(st.session_state.get('use_parquet_snapshot')) and snapshot_available()
+    except Exception:
+        return False
@@ -0,0 +1,120 @@
+"""
+Spekulativ förhämtning i bakgrunden (trådpool, processövergripande)
+När ett företag väljs börjar konton, värden för alla år och budgetar laddas direkt så
+att nästa interaktion hittar datan i resultatcachen. Jobben körs med sessionens
+ScriptRunContext (Firebase-token finns i session_state) och samma jobb startas inte
+om medan det pågår eller nyligen körts.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils_instrumentation import measure
+
+DEFAULT_WORKERS = 2
+# Sekunder innan samma jobb får startas igen (resultatcachen har längre TTL)
+RESUBMIT_AFTER = 60
+
+class Prefetcher:
+    """Trådpool som kör förhämtningsjobb högst en gång åt gången per nyckel"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        workers = max_workers or int(os.getenv("FINANS_PREFETCH_WORKERS", DEFAULT_WORKERS))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="finans-prefetch")
+        self._lock = threading.Lock()
+        # nyckel -> (future, startad)
+        self._jobs: Dict[Hashable, Tuple[Future, float]] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Nollställ räknare"""
+        with self._lock:
+            self._stats = {'submitted': 0, 'skipped': 0, 'completed': 0, 'errors': 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Kopia av räknarna (samt antal pågående jobb)"""
+        with self._lock:
+            running = sum(1 for future, _ in self._jobs.values() if not future.done())
+            return {**self._stats, 'running': running}
+
+    def submit(self, key: Hashable, tasks: List[Tuple[str, Callable[[], Any]]]) -> Optional[Future]:
+        """Starta jobbet (lista med (namn, funktion)) om det inte pågår eller körts nyligen"""
+        with self._lock:
+            previous = self._jobs.get(key)
+            if previous and (not previous[0].done() or time.monotonic() - previous[1] < RESUBMIT_AFTER):
+                self._stats['skipped'] += 1
+                return None
+            ctx = _current_ctx()
+            future = self._executor.submit(self._run, tasks, ctx)
+            self._jobs[key] = (future, time.monotonic())
+            self._stats['submitted'] += 1
+            return future
+
+    def _run(self, tasks: List[Tuple[str, Callable[[], Any]]], ctx: Any) -> None:
+        if ctx is not None:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+            add_script_run_ctx(threading.current_thread(), ctx)
+        for name, fn in tasks:
+            try:
+                with measure("prefetch", name):
+                    fn()
+                with self._lock:
+                    self._stats['completed'] += 1
+            except Exception as e:
+                print(f"⚠️ Förhämtning {name} misslyckades: {e}")
+                with self._lock:
+                    self._stats['errors'] += 1
+
+    def clear(self) -> None:
+        """Glöm avslutade jobb (nästa submit körs direkt)"""
+        with self._lock:
+            self._jobs = {k: v for k, v in self._jobs.items() if not v[0].done()}
+
+def _current_ctx() -> Any:
+    """Sessionens ScriptRunContext (None utanför Streamlit)"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher() -> Prefetcher:
+    """Processens gemensamma förhämtare (skapas vid första användning)"""
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher()
+    return _prefetcher
+
+def prefetch_company(company_id: str, company_name: Optional[str] = None,
+                     budget_years: Optional[List[int]] = None, from_snapshot: bool = False) -> Optional[Future]:
+    """
+    Förhämta ett företags konton, värden för alla år och budgetar i bakgrunden.
+    Avstängd med FINANS_PREFETCH=0.
+    """
+    if os.getenv("FINANS_PREFETCH", "1").lower() in ("0", "false", "no"):
+        return None
+    from models_repository import get_repository
+    from pages_seasonal_analysis import get_company_slice, get_accounts_list
+    from simple_budget_page import load_accounts_for_company
+
+    repo = get_repository()
+    tasks = [
+        ("konton", lambda: get_accounts_list(company_id, from_snapshot)),
+        ("budgetkonton", lambda: load_accounts_for_company(company_id)),
+        ("säsongsdata", lambda: get_company_slice(company_id, from_snapshot)),
+    ]
+    for year in budget_years or []:
+        tasks.append((f"budget {year}", lambda year=year: repo.get_simple_budgets(company_name, year)))
+    key = (company_id, company_name, tuple(budget_years or []), from_snapshot)
+    return get_prefetcher().submit(key, tasks)
+
+def get_prefetch_stats() -> Dict[str, int]:
+    """Räknare för förhämtningen (tom dict om den inte använts)"""
+    return _prefetcher.stats() if _prefetcher is not None else {}
@@ -0,0 +1,222 @@
+"""
+Begränsad resultatcache (processövergripande) istället för obegränsad st.cache_data
+LRU-vräkning efter uppskattad storlek i bytes med ett minnestak (FINANS_CACHE_MAX_MB),
+TTL per post samt räknare för träffar, missar och vräkningar. Med persist=True ligger
+diskcachen (utils_disk_cache) bakom minnet och överlever omstarter. Varje post sparar
+vilka datakällor den bygger på och deras version - en post från äldre data träffas aldrig.
+Versionerna hålls i processens minne; en uppräkning i en annan process syns när disknivån
+används nästa gång (eller när posten gått ut).
+"""
+import os
+import sys
+import time
+import inspect
+import threading
+import functools
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+DEFAULT_MAX_MB = 256
+
+def _env_max_bytes() -> int:
+    try:
+        return int(float(os.getenv("FINANS_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+    except ValueError:
+        return DEFAULT_MAX_MB * 1024 * 1024
+
+def estimate_size(value: Any) -> int:
+    """Ungefärlig storlek i bytes (DataFrames via memory_usage, övrigt rekursivt)"""
+    if hasattr(value, 'memory_usage') and hasattr(value, 'columns'):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+def _freeze(value: Any) -> Hashable:
+    """Gör argument hashbara (listor -> tupler, dicts -> sorterade tupler)"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    return value
+
+def _copy(value: Any) -> Any:
+    """DataFrames och listor kopieras vid träff så att anroparen inte kan ändra cachen"""
+    if hasattr(value, 'copy') and hasattr(value, 'columns'):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+def _is_empty(value: Any) -> bool:
+    if hasattr(value, 'empty') and hasattr(value, 'columns'):
+        return bool(value.empty)
+    return value is None or (isinstance(value, (dict, list, tuple)) and not value)
+
+class ResultCache:
+    """LRU-cache med minnestak i bytes och TTL"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else _env_max_bytes()
+        self._lock = threading.Lock()
+        # nyckel -> (värde, storlek, går ut, datakällor, version)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float, Tuple[str, ...], Optional[str]]]" = OrderedDict()
+        self._bytes = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Nollställ räknare"""
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'stale': 0, 'too_large': 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Kopia av räknarna samt aktuell storlek"""
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries),
+                    'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+    def _remove(self, key: Hashable) -> None:
+        size = self._entries.pop(key)[1]
+        self._bytes -= size
+
+    def get(self, key: Hashable, version: Optional[str] = None) -> Tuple[bool, Any]:
+        """(True, värde) vid träff, annars (False, None). Med version måste postens version stämma."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                self._stats['expired'] += 1
+                entry = None
+            elif entry is not None and version is not None and entry[4] != version:
+                self._remove(key)
+                self._stats['stale'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, entry[0]
+
+    def put(self, key: Hashable, value: Any, ttl: float, depends: Tuple[str, ...] = (),
+            version: Optional[str] = None) -> None:
+        """Lägg till och vräk äldst använda poster tills vi är under taket"""
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self._stats['too_large'] += 1
+                return
+            self._entries[key] = (value, size, time.monotonic() + ttl, tuple(depends), version)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Töm hela cachen eller bara poster för en funktion"""
+        with self._lock:
+            for key in [k for k in self._entries if namespace is None or k[0] == namespace]:
+                self._remove(key)
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        """Ta bort poster som bygger på någon av datakällorna. Returnerar antal borttagna."""
+        tags = set(tags)
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if tags.intersection(entry[3])]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+# Processens gemensamma cache (delas av alla sessioner, som st.cache_data)
+_cache = ResultCache()
+
+def cached_call(namespace: str, args: tuple, fn: Callable[[], Any], ttl: float = 300,
+                persist: bool = False, depends: Tuple[str, ...] = (), scope: Optional[str] = None) -> Any:
+    """
+    Hämta från minnescachen, därefter (persist=True) från diskcachen, annars kör fn().
+    depends anger vilka datakällor (utils_disk_cache.ALL_TAGS) resultatet bygger på
+    (inga = alla). Båda nivåerna kontrollerar datakällornas aktuella version - minnesnivån
+    mot processens versioner, disknivån mot filens (uppräkningar i andra processer).
+    """
+    from utils_disk_cache import (get_disk_cache, cache_scope, disk_key, disk_cache_ttl,
+                                  data_version, sync_data_version, ALL_TAGS)
+    key = (namespace, _freeze(args))
+    depends = tuple(depends) or ALL_TAGS
+    version = data_version(depends)
+    hit, value = _cache.get(key, version)
+    if hit:
+        return _copy(value)
+
+    disk = get_disk_cache() if persist else None
+    if disk is not None:
+        version = sync_data_version(disk, depends)
+        dkey = disk_key(namespace, scope if scope is not None else cache_scope(), key[1])
+        hit, value = disk.get(dkey, version)
+        if hit:
+            _cache.put(key, value, ttl, depends, version)
+            return _copy(value)
+
+    value = fn()
+    _cache.put(key, value, ttl, depends, version)
+    # Tomma resultat (t.ex. efter ett fångat nätverksfel) sparas inte på disk
+    if disk is not None and not _is_empty(value):
+        disk.put(dkey, value, max(ttl, disk_cache_ttl()), version)
+    return _copy(value)
+
+def bounded_cache(ttl: float = 300, name: Optional[str] = None, persist: bool = False,
+                  depends: Tuple[str, ...] = ()):
+    """
+    Dekorator som ersätter @st.cache_data(ttl=...) - resultat hamnar i den gemensamma
+    begränsade cachen (och med persist=True även på disk). Undantag cachas inte.
+    Funktionen får clear() som st.cache_data.
+    """
+    def decorator(fn: Callable) -> Callable:
+        namespace = name or f"{fn.__module__}.{fn.__qualname__}"
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            # Samma nyckel för f(x) och f(x, False) när False är standardvärdet
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return cached_call(namespace, bound.args + tuple(sorted(bound.kwargs.items())),
+                               lambda: fn(*args, **kwargs), ttl=ttl, persist=persist, depends=depends)
+
+        wrapper.clear = lambda: _cache.clear(namespace)
+        return wrapper
+    return decorator
+
+def cache_get(key: Hashable) -> Tuple[bool, Any]:
+    """Direkt uppslag i den gemensamma cachen (för egna nycklar, t.ex. ETag-kroppar)"""
+    return _cache.get(key)
+
+def cache_put(key: Hashable, value: Any, ttl: float) -> None:
+    """Lägg en egen post i den gemensamma cachen (räknas mot samma minnestak)"""
+    _cache.put(key, value, ttl)
+
+def get_cache_stats() -> Dict[str, int]:
+    """Räknare för processens resultatcache"""
+    return _cache.stats()
+
+def reset_cache_stats() -> None:
+    """Nollställ räknarna"""
+    _cache.reset_stats()
+
+def clear_result_cache() -> None:
+    """Töm hela resultatcachen (t.ex. i benchmarks)"""
+    _cache.clear()
+
+def invalidate_result_cache(tags: Iterable[str]) -> int:
+    """Ta bort poster som bygger på datakällorna (anropas av bump_data_version)"""
+    return _cache.invalidate(tags)
@@ -0,0 +1,89 @@
+"""
+Single-flight för identiska samtidiga hämtningar (processövergripande)
+När flera Streamlit-sessioner ber om samma nod samtidigt görs EN hämtning - övriga
+väntar på den och delar resultatet. Räknar ledare, sammanslagna anrop och fel.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from utils_instrumentation import record_event
+
+class _Call:
+    """En pågående hämtning som andra anropare kan vänta på"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Slå ihop samtidiga anrop med samma nyckel till en enda körning"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Nollställ räknare"""
+        with self._lock:
+            self._stats = {'leaders': 0, 'coalesced': 0, 'errors': 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Kopia av räknarna (samt antal pågående hämtningar)"""
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._calls)}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], label: str = "") -> Any:
+        """
+        Kör fn() om ingen annan hämtning med samma nyckel pågår, annars vänta på den
+        och returnera dess resultat (eller kasta dess fel). Resultatet delas mellan
+        anroparna - returnera oföränderliga värden (t.ex. bytes).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            record_event('singleflight', label or str(key), 0, cache_hit=True)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+# Processens gemensamma instans (delas av alla sessioner)
+_flight = SingleFlight()
+
+def single_flight(key: Hashable, fn: Callable[[], Any], label: str = "") -> Any:
+    """Kör fn() via processens gemensamma single-flight"""
+    return _flight.do(key, fn, label)
+
+def get_singleflight_stats() -> Dict[str, int]:
+    """Räknare för processens single-flight"""
+    return _flight.stats()
+
+def reset_singleflight_stats() -> None:
+    """Nollställ räknarna"""
+    _flight.reset_stats()
@@ -0,0 +1,332 @@
+"""
+Write-behind-kö för budgetceller
+Redigeringar hamnar direkt i en lokal journal (SQLite) och skriptet fortsätter utan att
+vänta på nätverket. Upprepade ändringar av samma cell slås ihop (senaste värdet vinner),
+en bakgrundstråd skickar väntande poster i batchar till lagret och misslyckade batchar
+försöks igen med backoff. Journalen överlever omstarter - osynkade ändringar skickas när
+användarens kö startas igen. Status per cell: pending, syncing, synced eller failed.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils_instrumentation import measure
+
+DEFAULT_JOURNAL_PATH = Path(__file__).parent / "data" / "cache" / "write_journal.db"
+# Sekunder att samla snabba redigeringar innan en batch skickas
+FLUSH_DELAY = 0.3
+POLL_INTERVAL = 1.0
+# Tråden avslutas efter så här lång tid utan väntande poster (startas igen vid nästa ändring)
+IDLE_TIMEOUT = 60
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 60
+
+PENDING = "pending"
+SYNCING = "syncing"
+SYNCED = "synced"
+FAILED = "failed"
+
+# typ -> funktion som skriver en lista payloads (kastar vid fel)
+_handlers: Dict[str, Callable[[List[Dict[str, Any]]], None]] = {}
+
+def register_handler(kind: str, handler: Callable[[List[Dict[str, Any]]], None]) -> None:
+    """
+    Registrera hur poster av en typ skrivs till lagret (hela batchen i ett anrop).
+    Registreras när sidan importeras - poster för typer utan handler ligger kvar som pending.
+    """
+    _handlers[kind] = handler
+
+def _placeholders(values: List[str]) -> str:
+    return ",".join("?" * len(values))
+
+class WriteJournal:
+    """SQLite-journal med en rad per cell (owner, kind, key) - ny ändring ersätter den gamla"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS journal (
+        owner TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL,
+        status TEXT NOT NULL, version INTEGER NOT NULL, attempts INTEGER NOT NULL,
+        retry_at REAL NOT NULL, error TEXT, updated REAL NOT NULL,
+        PRIMARY KEY (owner, kind, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (owner, status, retry_at);
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = str(path or DEFAULT_JOURNAL_PATH)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # En delad anslutning skyddad av lås (som DiskCache)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    def put(self, owner: str, kind: str, key: str, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Lägg till eller ersätt cellens ändring. Returnerar 'queued' (ny), 'coalesced'
+        (ersatte en osynkad ändring) eller None om samma värde redan ligger i journalen.
+        """
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT payload, status FROM journal WHERE owner = ? AND kind = ? AND key = ?", (owner, kind, key)
+            ).fetchone()
+            if row is not None and row[0] == data and row[1] != FAILED:
+                return None
+            # Ny version - en batch som redan skickas med äldre värde markeras inte som synkad
+            self._conn.execute(
+                "INSERT INTO journal (owner, kind, key, payload, status, version, attempts, retry_at, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, 1, 0, 0, NULL, ?) "
+                "ON CONFLICT(owner, kind, key) DO UPDATE SET payload = excluded.payload, status = excluded.status, "
+                "version = version + 1, attempts = 0, retry_at = 0, error = NULL, updated = excluded.updated",
+                (owner, kind, key, data, PENDING, now)
+            )
+        return 'coalesced' if row is not None and row[1] in (PENDING, SYNCING) else 'queued'
+
+    def take_batch(self, owner: str, kinds: List[str], limit: int = BATCH_SIZE) -> List[Tuple[str, str, Dict[str, Any], int]]:
+        """Väntande poster av typerna kinds som är redo (retry_at passerad), markeras som syncing"""
+        if not kinds:
+            return []
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT kind, key, payload, version FROM journal "
+                f"WHERE owner = ? AND status = ? AND retry_at <= ? AND kind IN ({_placeholders(kinds)}) "
+                "ORDER BY updated LIMIT ?",
+                (owner, PENDING, time.time(), *kinds, limit)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE journal SET status = ? WHERE owner = ? AND kind = ? AND key = ? AND version = ?",
+                [(SYNCING, owner, kind, key, version) for kind, key, _, version in rows]
+            )
+        return [(kind, key, json.loads(payload), version) for kind, key, payload, version in rows]
+
+    def mark_synced(self, owner: str, entries: List[Tuple[str, str, Any, int]]) -> None:
+        """Markera skickade poster som synkade (om de inte ändrats under tiden)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE journal SET status = ?, error = NULL WHERE owner = ? AND kind = ? AND key = ? AND version = ?",
+                [(SYNCED, owner, kind, key, version) for kind, key, _, version in entries]
+            )
+
+    def mark_failed(self, owner: str, entries: List[Tuple[str, str, Any, int]], error: str) -> None:
+        """Räkna upp försöken - tillbaka till pending med backoff, failed efter MAX_ATTEMPTS"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE journal SET attempts = attempts + 1, error = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END, "
+                "retry_at = ? + MIN(?, 1 << (attempts + 1)) "
+                "WHERE owner = ? AND kind = ? AND key = ? AND version = ?",
+                [(error, MAX_ATTEMPTS, FAILED, PENDING, now, MAX_BACKOFF, owner, kind, key, version)
+                 for kind, key, _, version in entries]
+            )
+
+    def statuses(self, owner: str, kind: str) -> Dict[str, Dict[str, Any]]:
+        """Status per cell {key: {status, payload, attempts, error}}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, status, payload, attempts, error FROM journal WHERE owner = ? AND kind = ?", (owner, kind)
+            ).fetchall()
+        return {key: {'status': status, 'payload': json.loads(payload), 'attempts': attempts, 'error': error}
+                for key, status, payload, attempts, error in rows}
+
+    def unsynced(self, owner: str, kinds: List[str]) -> int:
+        """Antal pending/syncing-poster av typerna kinds (de som skrivtråden kan skicka)"""
+        if not kinds:
+            return 0
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM journal WHERE owner = ? AND status IN (?, ?) AND kind IN ({_placeholders(kinds)})",
+                (owner, PENDING, SYNCING, *kinds)
+            ).fetchone()[0]
+
+    def counts(self, owner: Optional[str] = None) -> Dict[str, int]:
+        """Antal poster per status (för en ägare eller hela journalen)"""
+        sql = "SELECT status, COUNT(*) FROM journal" + (" WHERE owner = ?" if owner else "") + " GROUP BY status"
+        with self._lock:
+            rows = dict(self._conn.execute(sql, (owner,) if owner else ()).fetchall())
+        return {status: rows.get(status, 0) for status in (PENDING, SYNCING, SYNCED, FAILED)}
+
+    def retry_failed(self, owner: str) -> int:
+        """Lägg tillbaka misslyckade poster som pending"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE journal SET status = ?, attempts = 0, retry_at = 0 WHERE owner = ? AND status = ?",
+                (PENDING, owner, FAILED)
+            ).rowcount
+
+    def recover(self, owner: str) -> None:
+        """Poster som var på väg när processen stoppades skickas igen"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET status = ? WHERE owner = ? AND status = ?", (PENDING, owner, SYNCING))
+
+    def prune_synced(self, owner: str, older_than: float = 3600) -> None:
+        """Ta bort synkade poster äldre än older_than sekunder"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM journal WHERE owner = ? AND status = ? AND updated < ?",
+                               (owner, SYNCED, time.time() - older_than))
+
+def _current_ctx() -> Any:
+    """Sessionens ScriptRunContext (None utanför Streamlit)"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+class WriteBehindQueue:
+    """En användares skrivkö - journalen tar emot ändringar, en bakgrundstråd skickar dem"""
+
+    def __init__(self, owner: str, journal: WriteJournal):
+        self.owner = owner
+        self.journal = journal
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ctx: Any = None
+        self._stats = {'queued': 0, 'coalesced': 0, 'unchanged': 0, 'batches': 0, 'flushed': 0, 'retries': 0}
+        journal.recover(owner)
+        journal.prune_synced(owner)
+
+    def enqueue(self, kind: str, key: str, payload: Dict[str, Any]) -> bool:
+        """Lägg ändringen i journalen och väck skrivtråden (returnerar direkt)"""
+        result = self.journal.put(self.owner, kind, key, payload)
+        with self._lock:
+            self._stats[result or 'unchanged'] += 1
+            # Senaste sessionens kontext (Firebase-token i session_state)
+            self._ctx = _current_ctx() or self._ctx
+        if result:
+            self._ensure_worker()
+            self._wake.set()
+        return result is not None
+
+    def resume(self) -> None:
+        """Starta skrivtråden om journalen har väntande poster (t.ex. från en tidigare process)"""
+        with self._lock:
+            self._ctx = _current_ctx() or self._ctx
+        if self.journal.unsynced(self.owner, list(_handlers)):
+            self._ensure_worker()
+            self._wake.set()
+
+    def flush(self) -> int:
+        """
+        Skicka en batch väntande poster, ett handler-anrop per typ. Returnerar antal skickade.
+        Typer utan registrerad handler (sidan inte importerad än) lämnas orörda som pending.
+        """
+        handlers = dict(_handlers)
+        batch = self.journal.take_batch(self.owner, list(handlers))
+        by_kind: Dict[str, List[Tuple[str, str, Any, int]]] = {}
+        for entry in batch:
+            by_kind.setdefault(entry[0], []).append(entry)
+
+        for kind, entries in by_kind.items():
+            try:
+                with measure("write_behind", kind):
+                    handlers[kind]([payload for _, _, payload, _ in entries])
+                self.journal.mark_synced(self.owner, entries)
+                with self._lock:
+                    self._stats['batches'] += 1
+                    self._stats['flushed'] += len(entries)
+            except Exception as e:
+                print(f"⚠️ Skrivkö: {len(entries)} {kind}-poster misslyckades: {e}")
+                self.journal.mark_failed(self.owner, entries, str(e))
+                with self._lock:
+                    self._stats['retries'] += 1
+        return len(batch)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"finans-write-behind-{self.owner}", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        if self._ctx is not None:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+            add_script_run_ctx(threading.current_thread(), self._ctx)
+        idle_since = time.monotonic()
+        while True:
+            woken = self._wake.wait(timeout=POLL_INTERVAL)
+            self._wake.clear()
+            if woken:
+                # Samla snabba redigeringar (t.ex. flera celler i griden) i samma batch
+                time.sleep(FLUSH_DELAY)
+            while self.flush():
+                pass
+            if self.journal.unsynced(self.owner, list(_handlers)):
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > IDLE_TIMEOUT:
+                # Kontrollera igen under låset - en enqueue som hann emellan ser annars en
+                # levande tråd och startar ingen ny, medan den här tråden avslutas
+                with self._lock:
+                    if self.journal.unsynced(self.owner, list(_handlers)):
+                        idle_since = time.monotonic()
+                        continue
+                    self._thread = None
+                return
+
+    def statuses(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        return self.journal.statuses(self.owner, kind)
+
+    def retry_failed(self) -> int:
+        """Försök igen med misslyckade poster"""
+        retried = self.journal.retry_failed(self.owner)
+        if retried:
+            self.resume()
+        return retried
+
+    def stats(self) -> Dict[str, int]:
+        """Räknare samt antal poster per status"""
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, **self.journal.counts(self.owner)}
+
+_journal: Optional[WriteJournal] = None
+_queues: Dict[str, WriteBehindQueue] = {}
+_queues_lock = threading.Lock()
+
+def get_journal() -> WriteJournal:
+    """Processens journal (FINANS_WRITE_JOURNAL_PATH, i minnet om filen inte kan öppnas)"""
+    global _journal
+    with _queues_lock:
+        if _journal is None:
+            try:
+                _journal = WriteJournal(os.getenv("FINANS_WRITE_JOURNAL_PATH"))
+            except Exception as e:
+                print(f"⚠️ Skrivjournal otillgänglig ({e}) - använder minnet")
+                _journal = WriteJournal(":memory:")
+        return _journal
+
+def get_write_queue(owner: Optional[str] = None) -> WriteBehindQueue:
+    """Skrivkö för inloggad användare (eller owner), skapas vid första användning"""
+    if owner is None:
+        import streamlit as st
+        user = st.session_state.get('user') or {}
+        owner = user.get('localId') or user.get('email') or "local"
+    journal = get_journal()
+    with _queues_lock:
+        if owner not in _queues:
+            _queues[owner] = WriteBehindQueue(owner, journal)
+        queue = _queues[owner]
+    # Osynkade poster från en tidigare process skickas direkt
+    queue.resume()
+    return queue
+
+def get_write_behind_stats() -> Dict[str, int]:
+    """Räknare för alla köer i processen (tom dict om ingen kö använts)"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    if not queues:
+        return {}
+    totals: Dict[str, int] = {}
+    for queue in queues:
+        for name, value in queue.stats().items():
+            totals[name] = totals.get(name, 0) + value
+    return totals